@@ -3,9 +3,11 @@
 #########################
 
 
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import date
-from typing import List
+from typing import List, Optional
 from fastapi import HTTPException
+import binascii
 import uuid
 import re
 from pydantic import BaseModel, EmailStr, validator, UUID4
@@ -14,6 +16,21 @@ from pydantic import BaseModel, EmailStr, validator, UUID4
 LETTER_MATCH_PATTERN = re.compile(r"^[а-яА-Яa-zA-Z\-]+$")
 
 
+def encode_cursor(*parts) -> str:
+    """Packs the keyset position of the last returned row into an opaque string"""
+    return urlsafe_b64encode("|".join(str(part) for part in parts).encode()).decode()
+
+
+def decode_cursor(cursor: str, size: int) -> List[str]:
+    try:
+        parts = urlsafe_b64decode(cursor.encode()).decode().split("|")
+    except (binascii.Error, UnicodeDecodeError):
+        parts = []
+    if len(parts) != size:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    return parts
+
+
 class TunedModel(BaseModel):
     class Config:
         """tells pydantic to convert even non dict obj to json"""
@@ -83,6 +100,8 @@ class ShowAchievement(TunedModel):
     points: int
     ru_description: str
     en_description: str
+    holders: Optional[int] = None  # users holding the achievement, filled by the catalog
+    rarity_pct: Optional[float] = None  # share of all users holding it
 
 
 class ReceivedAchievementCreate(BaseModel):
@@ -106,6 +125,27 @@ class ShowReceivedAchievement(TunedModel):
         arbitrary_types_allowed = True
 
 
+class ReceivedAchievementsBatchRequest(BaseModel):
+    emails: List[str]
+
+
+class UserReceivedAchievements(BaseModel):
+    email: str
+    user_id: uuid.UUID
+    total_points: int
+    achievements: List[ShowReceivedAchievement]
+
+
+class ReceivedAchievementsBatch(BaseModel):
+    users: List[UserReceivedAchievements]
+    not_found: List[str]
+
+
+class QueuedAward(BaseModel):
+    ra_id: uuid.UUID
+    status: str = "queued"
+
+
 class UsersWithPointDifference(TunedModel):
     user1: dict
     user2: dict
@@ -128,3 +168,44 @@ class ShowUserWithAchievementsConsecutiveDays(BaseModel):
     class Config:
         orm_mode = True
 
+
+class LeaderboardEntry(TunedModel):
+    rank: int
+    user_id: uuid.UUID
+    name: str
+    surname: str
+    achievements_count: int
+    total_points: int
+
+
+class LeaderboardPage(BaseModel):
+    items: List[LeaderboardEntry]
+    next_cursor: Optional[str] = None
+
+
+class ShowUserRank(TunedModel):
+    user_id: uuid.UUID
+    email: EmailStr
+    total_points: int
+    rank: int
+    percentile: float
+    ranked_users: int
+
+
+class TimeseriesBucket(BaseModel):
+    start: date
+    awards: int
+    points: int
+
+
+class BulkError(BaseModel):
+    line: int
+    detail: str
+
+
+class BulkResult(BaseModel):
+    accepted: int
+    rejected: int
+    elapsed_seconds: float
+    rows_per_second: float
+    errors: List[BulkError]
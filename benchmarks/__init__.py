@@ -0,0 +1 @@
+"""Benchmarks for the server-achievements service"""
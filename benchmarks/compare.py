@@ -0,0 +1,69 @@
+"""Compares two load driver reports.
+
+Prints the change of throughput and p95/p99 latency per scenario and
+concurrency, and exits with 1 if any of them regressed by more than the
+threshold.
+
+    python -m benchmarks.compare base.json head.json --threshold 10
+"""
+
+import argparse
+import json
+
+
+def index(report: dict) -> dict:
+    return {(result["scenario"], result["concurrency"]): result for result in report["results"]}
+
+
+def change(before: float, after: float) -> float:
+    if not before:
+        return 0.0
+    return (after - before) * 100 / before
+
+
+def compare(base: dict, head: dict, threshold: float) -> list:
+    rows = []
+    head_results = index(head)
+    for key, before in index(base).items():
+        after = head_results.get(key)
+        if after is None:
+            continue
+        changes = {
+            "throughput_rps": change(before["throughput_rps"], after["throughput_rps"]),
+            "p95_ms": change(before["p95_ms"], after["p95_ms"]),
+            "p99_ms": change(before["p99_ms"], after["p99_ms"]),
+        }
+        # меньше запросов в секунду или больше задержка - хуже
+        regressed = (
+            changes["throughput_rps"] < -threshold
+            or changes["p95_ms"] > threshold
+            or changes["p99_ms"] > threshold
+        )
+        rows.append({"scenario": key[0], "concurrency": key[1], "changes": changes, "regressed": regressed})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed change in percent")
+    args = parser.parse_args()
+
+    with open(args.base) as base_file, open(args.head) as head_file:
+        base, head = json.load(base_file), json.load(head_file)
+    rows = compare(base, head, args.threshold)
+
+    print(f"{base.get('commit')} -> {head.get('commit')}")
+    for row in rows:
+        changes = row["changes"]
+        print(
+            f"{row['scenario']:<40} c={row['concurrency']:<4} "
+            f"rps {changes['throughput_rps']:+7.1f}%  p95 {changes['p95_ms']:+7.1f}%  p99 {changes['p99_ms']:+7.1f}%"
+            f"{'  REGRESSION' if row['regressed'] else ''}"
+        )
+    raise SystemExit(1 if any(row["regressed"] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Seeded synthetic dataset generator.
+
+Generates users, achievements and received achievements with a fixed seed and
+loads them into a local Postgres with COPY, then rebuilds user_stats. The same
+seed and scale always produce the same rows, so runs on different commits see
+the same data. Users are user<i>@bench.example.com and achievements are
+bench_achievement_<i>, the load driver relies on these names.
+
+    python -m benchmarks.generator --scale 1m --truncate
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import time
+import uuid
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import settings
+from dals import AchievementHoldersDAL, AwardRollupDAL, UserStatsDAL
+from tools.partitions import ensure_partitions
+
+
+# awards -> (users, achievements)
+SCALES = {
+    "10k": (10_000, 1_000, 100),
+    "100k": (100_000, 10_000, 200),
+    "1m": (1_000_000, 100_000, 300),
+    "10m": (10_000_000, 1_000_000, 500),
+}
+
+COPY_BATCH_SIZE = 50_000
+DAYS = 365
+
+
+def user_email(index: int) -> str:
+    return f"user{index}@bench.example.com"
+
+
+def achievement_name(index: int) -> str:
+    return f"bench_achievement_{index}"
+
+
+class Dataset:
+    """Deterministic rows of one scale, every table is produced lazily"""
+
+    def __init__(self, awards: int, users: int, achievements: int, seed: int = 42, streak_share: float = 0.05):
+        self.awards = awards
+        self.users = users
+        self.achievements = achievements
+        self.seed = seed
+        self.streak_share = streak_share
+        self.today = datetime.date.today()
+        rnd = random.Random(seed)
+        self.user_ids = [uuid.UUID(int=rnd.getrandbits(128), version=4) for _ in range(users)]
+        self.achievement_ids = [uuid.UUID(int=rnd.getrandbits(128), version=4) for _ in range(achievements)]
+        self.points = [rnd.randint(1, 100) for _ in range(achievements)]
+
+    def iter_achievements(self):
+        for index, achievement_id in enumerate(self.achievement_ids):
+            yield (
+                achievement_id,
+                achievement_name(index),
+                self.points[index],
+                f"Описание достижения {index}",
+                f"Achievement {index} description",
+            )
+
+    def iter_users(self):
+        rnd = random.Random(self.seed + 1)
+        for index, user_id in enumerate(self.user_ids):
+            yield user_id, "Name", "Surname", user_email(index), rnd.choice(("ru", "en"))
+
+    def iter_awards(self):
+        rnd = random.Random(self.seed + 2)
+        produced = 0
+        while produced < self.awards:
+            user_id = self.user_ids[rnd.randrange(self.users)]
+            if rnd.random() < self.streak_share:
+                # a run of consecutive days, so streak queries have something to find
+                length = min(rnd.randint(3, 14), self.awards - produced)
+                start = self.today - datetime.timedelta(days=rnd.randrange(length, DAYS))
+                days = [start + datetime.timedelta(days=offset) for offset in range(length)]
+            else:
+                days = [self.today - datetime.timedelta(days=rnd.randrange(DAYS))]
+            for day in days:
+                achievement_id = self.achievement_ids[rnd.randrange(self.achievements)]
+                yield uuid.UUID(int=rnd.getrandbits(128), version=4), user_id, achievement_id, day
+                produced += 1
+
+
+def batches(rows, size: int):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def copy_rows(async_session, table: str, columns: list, rows) -> int:
+    count = 0
+    for batch in batches(rows, COPY_BATCH_SIZE):
+        async with async_session() as session:
+            async with session.begin():
+                connection = await session.connection()
+                raw_connection = await connection.get_raw_connection()
+                await raw_connection.driver_connection.copy_records_to_table(table, records=batch, columns=columns)
+        count += len(batch)
+    return count
+
+
+async def load(async_session, dataset: Dataset, truncate: bool = False) -> dict:
+    timings = {}
+    if truncate:
+        async with async_session() as session:
+            async with session.begin():
+                await session.execute(text("TRUNCATE user_stats, received_achievements, users, achievements CASCADE"))
+
+    started = time.perf_counter()
+    await copy_rows(
+        async_session,
+        "achievements",
+        ["achievement_id", "name", "points", "ru_description", "en_description"],
+        dataset.iter_achievements(),
+    )
+    await copy_rows(async_session, "users", ["user_id", "name", "surname", "email", "language"], dataset.iter_users())
+    async with async_session() as session:
+        async with session.begin():
+            await ensure_partitions(session, dataset.today - datetime.timedelta(days=DAYS), dataset.today)
+    awards = await copy_rows(
+        async_session,
+        "received_achievements",
+        ["ra_id", "user_id", "achievement_id", "date"],
+        dataset.iter_awards(),
+    )
+    timings["copy_seconds"] = round(time.perf_counter() - started, 2)
+
+    started = time.perf_counter()
+    async with async_session() as session:
+        async with session.begin():
+            await UserStatsDAL(session).rebuild()
+            await AwardRollupDAL(session).rebuild()
+            await AchievementHoldersDAL(session).rebuild()
+    async with async_session() as session:
+        await session.execute(text("ANALYZE"))
+        await session.commit()
+    timings["aggregates_seconds"] = round(time.perf_counter() - started, 2)
+
+    return {
+        "seed": dataset.seed,
+        "users": dataset.users,
+        "achievements": dataset.achievements,
+        "awards": awards,
+        **timings,
+    }
+
+
+def dataset_for(scale: str, seed: int) -> Dataset:
+    awards, users, achievements = SCALES[scale]
+    return Dataset(awards=awards, users=users, achievements=achievements, seed=seed)
+
+
+async def run(args) -> dict:
+    engine = create_async_engine(args.database_url, future=True)
+    async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    try:
+        return await load(async_session, dataset_for(args.scale, args.seed), truncate=args.truncate)
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=sorted(SCALES), default="100k")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--truncate", action="store_true", help="remove all existing rows first")
+    parser.add_argument("--database-url", default=settings.REAL_DATABASE_URL)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""HTTP load driver for every route of the service.
+
+Runs each scenario at the given concurrency levels against a running server
+loaded by benchmarks.generator, and prints throughput and p50/p95/p99 latency
+as JSON. Save the output per commit and compare runs with benchmarks.compare.
+
+    python -m benchmarks.load --scale 100k --concurrency 1 16 64 --duration 10 > run.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import subprocess
+import time
+import uuid
+
+import httpx
+
+from benchmarks.generator import SCALES, achievement_name, user_email
+
+
+class Scenario:
+    """One route with a request factory, run by many workers concurrently"""
+
+    def __init__(self, name: str, method: str, route: str, make_request):
+        self.name = name
+        self.method = method
+        self.route = route
+        self.make_request = make_request
+
+
+def build_scenarios(users: int, achievements: int, run_id: str) -> list:
+    rnd = random.Random()
+    counter = iter(range(10 ** 12))
+
+    def email():
+        return user_email(rnd.randrange(users))
+
+    def new_user(index):
+        return {"name": "Bench", "surname": "User", "email": f"new{run_id}x{index}@bench.example.com", "language": "en"}
+
+    def award():
+        return {
+            "email": email(),
+            "achievement_name": achievement_name(rnd.randrange(achievements)),
+            "date": (datetime.date.today() - datetime.timedelta(days=rnd.randrange(365))).isoformat(),
+        }
+
+    def user_csv():
+        lines = ["name,surname,email,language"]
+        for _ in range(100):
+            user = new_user(next(counter))
+            lines.append(f"{user['name']},{user['surname']},{user['email']},{user['language']}")
+        return "\n".join(lines)
+
+    return [
+        Scenario("user.create", "POST", "/user/", lambda: {"json": new_user(next(counter))}),
+        Scenario("user.bulk", "POST", "/user/bulk", lambda: {
+            "content": user_csv(), "headers": {"content-type": "text/csv"},
+        }),
+        Scenario("user.get", "GET", "/user/", lambda: {"params": {"email": email()}}),
+        Scenario("user.most_achievements", "GET", "/user/most-achievements", dict),
+        Scenario("user.most_achievement_points", "GET", "/user/most-achievement-points", dict),
+        Scenario("user.max_point_difference", "GET", "/user/max-point-difference", dict),
+        Scenario("user.max_point_difference_top", "GET", "/user/max-point-difference/top", lambda: {
+            "params": {"k": 10},
+        }),
+        Scenario("user.min_point_difference", "GET", "/user/min-point-difference", dict),
+        Scenario("user.min_point_difference_top", "GET", "/user/min-point-difference/top", lambda: {
+            "params": {"k": 10},
+        }),
+        Scenario("user.seven_consecutive_days", "GET", "/user/achievements-seven-consecutive-days", dict),
+        Scenario("user.consecutive_days", "GET", "/user/achievements-consecutive-days", lambda: {
+            "params": {"n_days": 10},
+        }),
+        Scenario("user.rank", "GET", "/user/{email}/rank", lambda: {"path": f"/user/{email()}/rank"}),
+        Scenario("achievement.list", "GET", "/achievement/", dict),
+        Scenario("achievement.rarest", "GET", "/achievement/rarest", lambda: {"params": {"limit": 10}}),
+        Scenario("achievement.create", "POST", "/achievement/", lambda: {"json": {
+            "name": f"bench_{run_id}_{next(counter)}", "points": 10, "ru_description": "тест", "en_description": "test",
+        }}),
+        Scenario("received_achievement.create", "POST", "/received-achievement/", lambda: {"json": award()}),
+        Scenario("received_achievement.bulk", "POST", "/received-achievement/bulk", lambda: {
+            "content": "\n".join(json.dumps(award()) for _ in range(100)),
+            "headers": {"content-type": "application/x-ndjson"},
+        }),
+        Scenario("received_achievement.list", "GET", "/received-achievement/", lambda: {
+            "params": {"email": email()},
+        }),
+        Scenario("received_achievement.batch", "POST", "/received-achievement/batch", lambda: {
+            "json": {"emails": [email() for _ in range(100)]},
+        }),
+        Scenario("received_achievement.export", "GET", "/received-achievement/export", lambda: {
+            "params": {"date_from": (datetime.date.today() - datetime.timedelta(days=7)).isoformat()},
+        }),
+        Scenario("leaderboard.page", "GET", "/leaderboard/", lambda: {"params": {"limit": 50}}),
+        Scenario("stats.timeseries", "GET", "/stats/timeseries", lambda: {
+            "params": {"bucket": rnd.choice(["day", "week", "month"])},
+        }),
+    ]
+
+
+def check_coverage(scenarios: list) -> list:
+    """Routes of main.py that no scenario hits"""
+    from fastapi.routing import APIRoute
+
+    import main
+
+    covered = {(scenario.method, scenario.route) for scenario in scenarios}
+    return [
+        f"{method} {route.path}"
+        for route in main.app.routes
+        if isinstance(route, APIRoute) and route.include_in_schema
+        for method in sorted(route.methods)
+        if (method, route.path) not in covered
+    ]
+
+
+def percentile(sorted_values: list, share: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(share * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, concurrency: int, duration: float) -> dict:
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            request = scenario.make_request()
+            path = request.pop("path", scenario.route)
+            started = time.perf_counter()
+            try:
+                response = await client.request(scenario.method, path, **request)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "scenario": scenario.name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run(args) -> dict:
+    _, users, achievements = SCALES[args.scale]
+    scenarios = build_scenarios(users, achievements, run_id=uuid.uuid4().hex[:8])
+    if args.only:
+        scenarios = [scenario for scenario in scenarios if scenario.name in args.only]
+
+    results = []
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        for scenario in scenarios:
+            for concurrency in args.concurrency:
+                results.append(await run_scenario(client, scenario, concurrency, args.duration))
+
+    return {
+        "commit": git_commit(),
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "base_url": args.base_url,
+        "scale": args.scale,
+        "duration_seconds": args.duration,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="100k", help="scale the database was seeded with")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario and concurrency level")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--only", nargs="+", help="scenario names to run")
+    parser.add_argument("--check-coverage", action="store_true", help="list routes without a scenario and exit")
+    args = parser.parse_args()
+
+    if args.check_coverage:
+        missing = check_coverage(build_scenarios(1, 1, "check"))
+        print("\n".join(missing) or "all routes are covered")
+        raise SystemExit(1 if missing else 0)
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Benchmark of date-bounded queries on received_achievements.
+
+Runs every query with EXPLAIN ANALYZE and prints the median execution time
+and the tables it read. Run it on a database seeded by benchmarks.generator
+once before and once after the partitioning migration, with the same scale
+and seed, and compare the two outputs.
+
+    python -m benchmarks.partitions --repeat 5 > partitioned.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import statistics
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import settings
+from benchmarks.generator import user_email
+from benchmarks.load import git_commit
+
+
+QUERIES = {
+    "count_last_month": (
+        "SELECT count(*) FROM received_achievements WHERE date >= :month_start AND date < :month_end"
+    ),
+    "export_last_week": (
+        "SELECT ra.ra_id, ra.date, u.email, a.name, a.points FROM received_achievements ra "
+        "JOIN users u ON u.user_id = ra.user_id JOIN achievements a ON a.achievement_id = ra.achievement_id "
+        "WHERE ra.date >= :week_ago"
+    ),
+    "user_awards_last_30_days": (
+        "SELECT ra.ra_id, ra.date FROM users u JOIN received_achievements ra ON ra.user_id = u.user_id "
+        "AND ra.date >= :month_ago WHERE u.email = :email ORDER BY ra.date, ra.ra_id LIMIT 100"
+    ),
+    "points_per_day_last_quarter": (
+        "SELECT ra.date, sum(a.points) FROM received_achievements ra "
+        "JOIN achievements a ON a.achievement_id = ra.achievement_id "
+        "WHERE ra.date >= :quarter_ago GROUP BY ra.date"
+    ),
+}
+
+
+def relations(plan: dict) -> set:
+    found = {plan["Relation Name"]} if "Relation Name" in plan else set()
+    for child in plan.get("Plans", []):
+        found |= relations(child)
+    return found
+
+
+async def run(args) -> dict:
+    today = datetime.date.today()
+    month_end = today.replace(day=1)
+    month_start = (month_end - datetime.timedelta(days=1)).replace(day=1)
+    parameters = {
+        "month_start": month_start,
+        "month_end": month_end,
+        "week_ago": today - datetime.timedelta(days=7),
+        "month_ago": today - datetime.timedelta(days=30),
+        "quarter_ago": today - datetime.timedelta(days=90),
+        "email": user_email(0),
+    }
+
+    engine = create_async_engine(args.database_url, future=True)
+    async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    results = []
+    try:
+        async with async_session() as session:
+            for name, query in QUERIES.items():
+                timings, scanned = [], set()
+                for _ in range(args.repeat):
+                    result = await session.execute(text("EXPLAIN (ANALYZE, FORMAT JSON) " + query), parameters)
+                    plan = result.scalar()
+                    plan = json.loads(plan) if isinstance(plan, str) else plan
+                    timings.append(plan[0]["Execution Time"])
+                    scanned = relations(plan[0]["Plan"])
+                results.append({
+                    "query": name,
+                    "median_ms": round(statistics.median(timings), 2),
+                    "tables_read": sorted(scanned),
+                })
+    finally:
+        await engine.dispose()
+    return {"commit": git_commit(), "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--database-url", default=settings.REAL_DATABASE_URL)
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
+
+
+if __name__ == "__main__":
+    main()
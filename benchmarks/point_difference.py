@@ -0,0 +1,71 @@
+"""Benchmark of the point difference queries.
+
+Times the UserDAL methods behind the max/min point difference routes, the
+queries that ship: lead() for the closest pair, the ranked self-join for
+the k closest pairs and the k first and last rows for the farthest ones.
+Run it on databases seeded by benchmarks.generator at growing scales, the
+time must grow linearly with the number of users.
+
+    python -m benchmarks.generator --scale 100k --truncate
+    python -m benchmarks.point_difference --k 1 10 100 --repeat 5
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import settings
+from benchmarks.load import git_commit
+from database import UserStats
+from dals import UserDAL
+
+
+METHODS = {
+    "closest": UserDAL.get_users_with_min_point_difference,
+    "farthest": UserDAL.get_users_with_max_point_difference,
+}
+
+
+async def run(args) -> dict:
+    engine = create_async_engine(args.database_url, future=True)
+    async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    results = []
+    try:
+        async with async_session() as session:
+            users = await session.scalar(select(func.count()).select_from(UserStats))
+            for k in args.k:
+                for name, method in METHODS.items():
+                    timings = []
+                    for _ in range(args.repeat):
+                        started = time.perf_counter()
+                        await method(UserDAL(session), top_k=k)
+                        timings.append((time.perf_counter() - started) * 1000)
+                    median_ms = statistics.median(timings)
+                    results.append({
+                        "method": name,
+                        "k": k,
+                        "median_ms": round(median_ms, 2),
+                        # при линейном росте отношение времени к числу пользователей постоянно
+                        "ns_per_user": round(median_ms * 1e6 / users, 1) if users else None,
+                    })
+    finally:
+        await engine.dispose()
+    return {"benchmark": "point_difference", "commit": git_commit(), "users": users, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--database-url", default=settings.REAL_DATABASE_URL)
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
+
+
+if __name__ == "__main__":
+    main()
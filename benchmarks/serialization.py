@@ -0,0 +1,104 @@
+"""Benchmark of the serialization of large list responses.
+
+Serves the same synthetic received achievements in two ways, without a
+database: through response_model validation of a ShowReceivedAchievement per
+row, as the routes did before, and as plain rows encoded by ORJSONResponse,
+as the listing route does now. Prints the median CPU time per request.
+
+    python -m benchmarks.serialization --rows 10000 --repeat 20
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import statistics
+import time
+import uuid
+from collections import namedtuple
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+
+from api_models import ShowReceivedAchievement
+from benchmarks.load import git_commit
+
+
+# stands for the Row objects returned by the listing query
+ReceivedRow = namedtuple("ReceivedRow", ["ra_id", "date", "name", "surname", "points", "description"])
+
+
+def make_rows(count: int) -> list:
+    start = datetime.date(2024, 1, 1)
+    return [
+        ReceivedRow(
+            uuid.uuid4(), start + datetime.timedelta(days=index % 365),
+            f"name{index}", f"surname{index}", index % 100, f"description of achievement {index % 50}",
+        )
+        for index in range(count)
+    ]
+
+
+def make_app(rows: list) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/model", response_model=list[ShowReceivedAchievement])
+    async def model_path():
+        return [
+            ShowReceivedAchievement(
+                ra_id=row.ra_id,
+                date=row.date,
+                name=row.name,
+                surname=row.surname,
+                points=row.points,
+                description=row.description,
+            )
+            for row in rows
+        ]
+
+    @app.get("/fast", response_model=list[ShowReceivedAchievement])
+    async def fast_path():
+        return ORJSONResponse([row._asdict() for row in rows])
+
+    return app
+
+
+async def run(args) -> dict:
+    app = make_app(make_rows(args.rows))
+    results = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+        bodies = {}
+        for path in ("/model", "/fast"):
+            timings = []
+            for _ in range(args.warmup + args.repeat):
+                started = time.process_time()
+                response = await client.get(path)
+                timings.append((time.process_time() - started) * 1000)
+                response.raise_for_status()
+            bodies[path] = response.json()
+            results.append({
+                "path": path,
+                "median_cpu_ms": round(statistics.median(timings[args.warmup:]), 2),
+                "bytes": len(response.content),
+            })
+    if bodies["/model"] != bodies["/fast"]:
+        raise SystemExit("the paths returned different bodies")
+    return {
+        "commit": git_commit(),
+        "rows": args.rows,
+        "results": results,
+        "speedup": round(results[0]["median_cpu_ms"] / results[1]["median_cpu_ms"], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
+
+
+if __name__ == "__main__":
+    main()
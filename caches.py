@@ -0,0 +1,370 @@
+#####################
+# BLOCK WITH CACHES #
+#####################
+
+
+import asyncio
+import functools
+import heapq
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence
+
+import orjson
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+
+import metrics
+import settings
+from api_models import ShowAchievement, ShowUser
+from singleflight import SingleFlight, call_key
+
+
+class AchievementCatalog:
+    """Whole achievements catalog kept in memory, keyed by id and by name.
+
+    The catalog is small and changes only through create_achievement, which
+    puts new entries here after commit. Holder counts and the number of users
+    come with every load and are advanced after commit by the writes of this
+    process. The TTL reload is a safety net for achievements, holders and
+    users written by other processes.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._by_id: Dict[uuid.UUID, ShowAchievement] = {}
+        self._by_name: Dict[str, ShowAchievement] = {}
+        self._holders: Dict[uuid.UUID, int] = {}
+        self._users = 0
+        self._json: Optional[bytes] = None
+        self._loaded_at = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl_seconds
+
+    async def ensure_fresh(self, load: Callable[[], Awaitable[tuple]]) -> None:
+        """load returns the achievements, their holder counts by id and the number of users"""
+        if self.is_fresh:
+            return
+        async with self._lock:
+            if self.is_fresh:
+                return
+            self.reset(*await load())
+
+    def reset(
+            self, achievements: Iterable[ShowAchievement], holders: Optional[Dict[uuid.UUID, int]] = None, users: int = 0,
+    ) -> None:
+        achievements = list(achievements)
+        self._by_id = {achievement.achievement_id: achievement for achievement in achievements}
+        self._by_name = {achievement.name: achievement for achievement in achievements}
+        self._holders = dict(holders or {})
+        self._users = users
+        self._json = None
+        self._loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    def put(self, achievement: ShowAchievement) -> None:
+        self._by_id[achievement.achievement_id] = achievement
+        self._by_name[achievement.name] = achievement
+        self._json = None
+
+    def add_holders(self, counts: Dict[uuid.UUID, int]) -> None:
+        for achievement_id, count in counts.items():
+            self._holders[achievement_id] = self._holders.get(achievement_id, 0) + count
+        self._json = None
+
+    def add_users(self, count: int) -> None:
+        self._users += count
+        self._json = None
+
+    def with_rarity(self, achievement: ShowAchievement) -> ShowAchievement:
+        holders = self._holders.get(achievement.achievement_id, 0)
+        rarity_pct = round(100 * holders / self._users, 2) if self._users else 0.0
+        return achievement.model_copy(update={"holders": holders, "rarity_pct": rarity_pct})
+
+    def rarest(self, limit: int) -> List[ShowAchievement]:
+        """Achievements with the fewest holders, those nobody holds first"""
+        achievements = heapq.nsmallest(
+            limit,
+            self._by_id.values(),
+            key=lambda achievement: (self._holders.get(achievement.achievement_id, 0), achievement.name),
+        )
+        return [self.with_rarity(achievement) for achievement in achievements]
+
+    def get_by_id(self, achievement_id: uuid.UUID) -> Optional[ShowAchievement]:
+        return self._by_id.get(achievement_id)
+
+    def get_by_name(self, name: str) -> Optional[ShowAchievement]:
+        return self._by_name.get(name)
+
+    def all(self) -> List[ShowAchievement]:
+        """Entries without holders, with_rarity fills them"""
+        return list(self._by_id.values())
+
+    def as_json(self) -> bytes:
+        """The whole catalog with holders encoded once per change"""
+        if self._json is None:
+            self._json = orjson.dumps(
+                [self.with_rarity(achievement).model_dump() for achievement in self._by_id.values()]
+            )
+        return self._json
+
+
+achievement_catalog = AchievementCatalog(ttl_seconds=settings.ACHIEVEMENT_CATALOG_TTL_SECONDS)
+
+
+# returned by UserCache.get_by_email for an email remembered as missing
+UNKNOWN_USER = object()
+
+
+class UserCache:
+    """Users looked up by email and by id, the least recently used are dropped above max_entries.
+
+    Users are never changed after they are created, so an entry stays valid
+    until its TTL, which covers users written around the application. Emails
+    missing on the primary are remembered for negative_ttl_seconds: repeated
+    reads of them get 404 without a query, writes look them up again. The DAL methods creating users drop or replace
+    the entries of their emails after commit, other processes see a new user
+    once the negative entry of its email expires.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, negative_ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._by_email: "OrderedDict[str, tuple]" = OrderedDict()
+        self._by_id: "OrderedDict[uuid.UUID, tuple]" = OrderedDict()
+        self._unknown: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._by_email)
+
+    def get_by_email(self, email: str) -> Any:
+        """The cached user, UNKNOWN_USER for an email known to be missing, otherwise None"""
+        user = self._get(self._by_email, email)
+        if user is not None:
+            metrics.user_cache_lookups.inc("email", "hit")
+            return user
+        if self._get(self._unknown, email) is not None:
+            metrics.user_cache_lookups.inc("email", "negative_hit")
+            return UNKNOWN_USER
+        metrics.user_cache_lookups.inc("email", "miss")
+        return None
+
+    def get_by_id(self, user_id: uuid.UUID) -> Optional[ShowUser]:
+        user = self._get(self._by_id, user_id)
+        metrics.user_cache_lookups.inc("id", "miss" if user is None else "hit")
+        return user
+
+    def put(self, email: str, user: ShowUser) -> None:
+        """Keyed by the email as stored, the model may have normalized it"""
+        self._unknown.pop(email, None)
+        if self.ttl_seconds <= 0:
+            return
+        entry = (time.monotonic() + self.ttl_seconds, user)
+        self._set(self._by_email, email, entry)
+        self._set(self._by_id, user.user_id, entry)
+
+    def put_unknown(self, email: str) -> None:
+        if self.negative_ttl_seconds > 0:
+            self._set(self._unknown, email, (time.monotonic() + self.negative_ttl_seconds, UNKNOWN_USER))
+
+    def invalidate(self, *emails: str) -> None:
+        for email in emails:
+            self._unknown.pop(email, None)
+            entry = self._by_email.pop(email, None)
+            if entry is not None:
+                self._by_id.pop(entry[1].user_id, None)
+
+    def clear(self) -> None:
+        self._by_email.clear()
+        self._by_id.clear()
+        self._unknown.clear()
+
+    @staticmethod
+    def _get(entries: OrderedDict, key) -> Any:
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del entries[key]
+            return None
+        entries.move_to_end(key)
+        return value
+
+    def _set(self, entries: OrderedDict, key, entry: tuple) -> None:
+        entries[key] = entry
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+
+user_cache = UserCache(
+    max_entries=settings.USER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.USER_CACHE_TTL_SECONDS,
+    negative_ttl_seconds=settings.USER_CACHE_NEGATIVE_TTL_SECONDS,
+)
+
+
+class RecentWrites:
+    """Keys written in the last ttl_seconds, the oldest are dropped above max_entries"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._written: "OrderedDict[str, float]" = OrderedDict()
+
+    def __contains__(self, key: str) -> bool:
+        written_at = self._written.get(key)
+        if written_at is None:
+            return False
+        if time.monotonic() - written_at >= self.ttl_seconds:
+            del self._written[key]
+            return False
+        return True
+
+    def mark(self, key: str) -> None:
+        self._written[key] = time.monotonic()
+        self._written.move_to_end(key)
+        while len(self._written) > self.max_entries:
+            self._written.popitem(last=False)
+
+
+# emails of recently awarded users, their reads are not sent to replicas
+recent_award_writers = RecentWrites(
+    ttl_seconds=settings.READ_YOUR_WRITES_SECONDS, max_entries=settings.READ_YOUR_WRITES_MAX_ENTRIES
+)
+
+
+# tags of cached responses, invalidated by the DAL methods writing them
+USERS_TAG = "users"
+AWARDS_TAG = "awards"
+
+
+class LRUBackend:
+    """Response cache storage of one process"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def generations(self, tags: Sequence[str]) -> list:
+        return [self._generations.get(tag, 0) for tag in tags]
+
+    async def bump(self, tags: Sequence[str]) -> None:
+        for tag in tags:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class RedisBackend:
+    """Response cache storage shared by all processes, needs the redis package"""
+
+    def __init__(self, url: str, prefix: str = "response-cache:"):
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND=redis needs the redis package installed")
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self.client.set(self.prefix + key, value, px=int(ttl * 1000))
+
+    async def generations(self, tags: Sequence[str]) -> list:
+        values = await self.client.mget([self.prefix + "tag:" + tag for tag in tags])
+        return [int(value or 0) for value in values]
+
+    async def bump(self, tags: Sequence[str]) -> None:
+        async with self.client.pipeline(transaction=False) as pipeline:
+            for tag in tags:
+                pipeline.incr(self.prefix + "tag:" + tag)
+            await pipeline.execute()
+
+    def clear(self) -> None:
+        pass
+
+
+class ResponseCache:
+    """Caches encoded route results for a TTL, invalidated by tags.
+
+    Every key contains the current generation of its tags. Invalidation
+    bumps the generations, so older entries are never read again and simply
+    expire, and no backend has to find keys by tag. A hit is sent as stored,
+    without building and validating the response models again.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._pending = set()
+        # concurrent misses of one key compute the value once
+        self._flight = SingleFlight("response_cache")
+
+    def cached(self, name: str, ttl: float, tags: Sequence[str]):
+        """Route decorator, the key is made of the name and the keyword arguments"""
+
+        def decorator(function):
+            if ttl <= 0:
+                return function
+
+            @functools.wraps(function)
+            async def wrapper(**kwargs):
+                generations = await self.backend.generations(tags)
+                key = f"{name}:{','.join(map(str, generations))}:{call_key(kwargs)}"
+                body = await self.backend.get(key)
+                if body is None:
+                    body = await self._flight.do(key, lambda: self._compute(key, ttl, function, kwargs))
+                return Response(content=body, media_type="application/json")
+
+            return wrapper
+
+        return decorator
+
+    async def _compute(self, key: str, ttl: float, function, kwargs: dict) -> bytes:
+        body = orjson.dumps(jsonable_encoder(await function(**kwargs)))
+        await self.backend.set(key, body, ttl)
+        return body
+
+    def invalidate(self, *tags: str) -> None:
+        """Called after commit, which is synchronous, so the backend is updated in a task"""
+        task = asyncio.get_running_loop().create_task(self.backend.bump(tags))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+
+def create_response_cache_backend():
+    if settings.RESPONSE_CACHE_BACKEND == "redis":
+        return RedisBackend(settings.RESPONSE_CACHE_REDIS_URL)
+    return LRUBackend(max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES)
+
+
+response_cache = ResponseCache(create_response_cache_backend())
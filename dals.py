@@ -3,11 +3,80 @@
 ###########################################################
 
 
-from datetime import date
+from collections import Counter
+from datetime import date, timedelta
 from fastapi import HTTPException
-from sqlalchemy import select, func, desc
+from typing import AsyncIterator, Callable, Optional
+from sqlalchemy import select, update, delete, join, text, func, desc, case, cast, literal, literal_column, tuple_, union_all, and_, or_, any_, event, Row, true, DateTime
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by, insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 from database import *
+from point_difference import farthest_pairs, make_pair
+from api_models import ShowAchievement, ShowUser
+from caches import (
+    AWARDS_TAG, UNKNOWN_USER, USERS_TAG, achievement_catalog, recent_award_writers, response_cache, user_cache,
+)
+from rank_index import rank_index
+
+
+def run_after_commit(db_session: AsyncSession, callback: Callable[[], None]) -> None:
+    """Schedules the callback to run once the current transaction is committed"""
+    db_session.info.setdefault("after_commit", []).append(callback)
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit_callbacks(session):
+    for callback in session.info.pop("after_commit", []):
+        callback()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_after_commit_callbacks(session, previous_transaction):
+    session.info.pop("after_commit", None)
+
+
+def count_users_stmt(count: int):
+    """Upsert adding count to the number of users, the row lock is held until commit"""
+    stmt = insert(UserCount).values(id=1, users=count)
+    return stmt.on_conflict_do_update(
+        index_elements=[UserCount.id], set_={"users": UserCount.users + stmt.excluded.users},
+    )
+
+
+def reads_primary(db_session: AsyncSession) -> bool:
+    """Replica sessions are marked by the engine router, a user missing there may exist on the primary"""
+    return not db_session.info.get("replica", False)
+
+
+def streak_runs(*criteria):
+    """Select of the runs of consecutive award days: (user_id, length, last_day).
+
+    Gaps-and-islands: after subtracting the row number from every distinct day
+    all days of one run get the same anchor date.
+    """
+    days = (
+        select(ReceivedAchievements.user_id, ReceivedAchievements.date)
+        .where(*criteria)
+        .distinct()
+        .subquery()
+    )
+    islands = select(
+        days.c.user_id,
+        days.c.date,
+        (
+            days.c.date
+            - cast(func.row_number().over(partition_by=days.c.user_id, order_by=days.c.date), Integer)
+        ).label("anchor"),
+    ).subquery()
+    return (
+        select(
+            islands.c.user_id,
+            func.count().label("length"),
+            func.max(islands.c.date).label("last_day"),
+        )
+        .group_by(islands.c.user_id, islands.c.anchor)
+    )
 
 
 class UserDAL:
@@ -27,203 +96,261 @@ class UserDAL:
         )
         self.db_session.add(new_user)
         await self.db_session.flush()
+        await self.db_session.execute(count_users_stmt(1))
+        # replaces a negative entry of the email as well
+        cached = ShowUser.model_validate(new_user)
+        run_after_commit(self.db_session, lambda: user_cache.put(email, cached))
+        run_after_commit(self.db_session, lambda: achievement_catalog.add_users(1))
+        run_after_commit(self.db_session, lambda: response_cache.invalidate(USERS_TAG))
         return new_user
 
-    async def get_user(self, email: str) -> User:
-        result = await self.db_session.execute(
-            select(User).filter_by(email=email)
+    async def create_users_bulk(self, users: list) -> set:
+        """Loads (user_id, name, surname, email, language) rows with COPY, returns inserted emails.
+
+        Rows are copied into a temporary staging table first, so existing
+        emails are skipped by ON CONFLICT instead of failing the whole COPY.
+        """
+        connection = await self.db_session.connection()
+        await connection.execute(
+            text("CREATE TEMP TABLE IF NOT EXISTS users_staging (LIKE users) ON COMMIT DELETE ROWS")
+        )
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            "users_staging",
+            records=users,
+            columns=["user_id", "name", "surname", "email", "language"],
+        )
+        result = await connection.execute(
+            text(
+                "INSERT INTO users (user_id, name, surname, email, language) "
+                "SELECT user_id, name, surname, email, language FROM users_staging "
+                "ON CONFLICT (email) DO NOTHING "
+                "RETURNING email"
+            )
         )
-        user = result.scalar()
+        inserted = set(result.scalars())
+        if inserted:
+            await connection.execute(count_users_stmt(len(inserted)))
+            run_after_commit(self.db_session, lambda: user_cache.invalidate(*inserted))
+            run_after_commit(self.db_session, lambda: achievement_catalog.add_users(len(inserted)))
+            run_after_commit(self.db_session, lambda: response_cache.invalidate(USERS_TAG))
+        return inserted
+
+    async def get_user(self, email: str) -> ShowUser:
+        user = await self.find_user(email)
         if user is None:
             raise HTTPException(status_code=404, detail="User not found")
         return user
 
-    async def get_user_by_id(self, user_id: uuid.UUID) -> User:
-        result = await self.db_session.execute(
-            select(User).filter_by(user_id=user_id)
-        )
-        user = result.scalar()
+    async def find_user(self, email: str) -> Optional[ShowUser]:
+        """Resolves the email through the user cache, None for an unknown email.
+
+        Only a lookup on the primary remembers an email as unknown.
+        """
+        user = user_cache.get_by_email(email)
+        if user is UNKNOWN_USER:
+            return None
         if user is None:
-            raise HTTPException(status_code=404, detail="User not found")
+            result = await self.db_session.execute(
+                select(User).filter_by(email=email)
+            )
+            row = result.scalar()
+            if row is None:
+                if reads_primary(self.db_session):
+                    user_cache.put_unknown(email)
+                return None
+            user = ShowUser.model_validate(row)
+            user_cache.put(row.email, user)
         return user
 
-    async def get_user_with_most_achievements(self) -> (User, int):
+    async def find_users(self, emails, confirm_unknown: bool = False) -> dict:
+        """Resolves emails through the user cache, the rest cost one query together.
+
+        Returns {email: ShowUser} of the known emails only. Writes pass
+        confirm_unknown to look the emails remembered as unknown up again.
+        """
+        users, missing = {}, []
+        for email in set(emails):
+            user = user_cache.get_by_email(email)
+            if user is None or (user is UNKNOWN_USER and confirm_unknown):
+                missing.append(email)
+            elif user is not UNKNOWN_USER:
+                users[email] = user
+        if missing:
+            result = await self.db_session.execute(select(User).where(User.email == any_(missing)))
+            for row in result.scalars():
+                user = ShowUser.model_validate(row)
+                user_cache.put(row.email, user)
+                users[row.email] = user
+            if reads_primary(self.db_session):
+                for email in missing:
+                    if email not in users:
+                        user_cache.put_unknown(email)
+        return users
+
+    async def get_user_by_id(self, user_id: uuid.UUID) -> ShowUser:
+        user = user_cache.get_by_id(user_id)
+        if user is None:
+            result = await self.db_session.execute(
+                select(User).filter_by(user_id=user_id)
+            )
+            row = result.scalar()
+            if row is None:
+                raise HTTPException(status_code=404, detail="User not found")
+            user = ShowUser.model_validate(row)
+            user_cache.put(row.email, user)
+        return user
+
+    async def get_user_with_most_achievements(self) -> (Row, int):
+        # columns instead of the entity, nothing is loaded into the session
         result = await self.db_session.execute(
-            select(User, func.count(ReceivedAchievements.ra_id).label('achievements_count'))
-            .join(ReceivedAchievements, User.user_id == ReceivedAchievements.user_id)
-            .group_by(User.user_id)
-            .order_by(desc('achievements_count'))
+            select(User.user_id, User.name, User.surname, User.email, User.language, UserStats.achievements_count)
+            .join(UserStats, User.user_id == UserStats.user_id)
+            .order_by(UserStats.achievements_count.desc(), UserStats.user_id)
             .limit(1)
         )
-        user, achievements_count = result.first()
-        if user is None:
+        row = result.first()
+        if row is None:
             raise HTTPException(status_code=404, detail="No users found")
-        return user, achievements_count
+        return row, row.achievements_count
 
-    async def get_user_with_most_achievement_points(self) -> (User, int):
+    async def get_user_with_most_achievement_points(self) -> (Row, int):
+        # columns instead of the entity, nothing is loaded into the session
         result = await self.db_session.execute(
-            select(User, func.sum(Achievement.points).label('total_points'))
-            .join(ReceivedAchievements, User.user_id == ReceivedAchievements.user_id)
-            .join(Achievement, ReceivedAchievements.achievement_id == Achievement.achievement_id)
-            .group_by(User.user_id)
-            .order_by(desc('total_points'))
+            select(User.user_id, User.name, User.surname, User.email, User.language, UserStats.total_points)
+            .join(UserStats, User.user_id == UserStats.user_id)
+            .order_by(UserStats.total_points.desc(), UserStats.user_id)
             .limit(1)
         )
-        user, total_points = result.first()
-        if user is None:
+        row = result.first()
+        if row is None:
             raise HTTPException(status_code=404, detail="No users found")
-        return user, total_points
+        return row, row.total_points
 
-    async def get_users_with_max_point_difference(self):
-        stmt = (
+    def _user_totals(self):
+        return (
             select(
                 User.user_id,
                 User.name,
                 User.surname,
-                func.sum(Achievement.points).label("total_points")
+                UserStats.total_points,
             )
-            .join(ReceivedAchievements, User.user_id == ReceivedAchievements.user_id)
-            .join(Achievement, ReceivedAchievements.achievement_id == Achievement.achievement_id)
-            .group_by(User.user_id, User.name, User.surname)
-            .order_by(func.sum(Achievement.points).desc())
+            .join(UserStats, User.user_id == UserStats.user_id)
         )
 
+    async def get_users_with_max_point_difference(self, top_k: int = 1) -> list:
+        # самая большая разница всегда между первым и последним пользователем,
+        # поэтому достаточно k первых и k последних строк
+        totals = self._user_totals()
+        stmt = union_all(
+            totals.add_columns(literal(True).label("is_top"))
+            .order_by(UserStats.total_points.desc(), UserStats.user_id)
+            .limit(top_k),
+            totals.add_columns(literal(False).label("is_top"))
+            .order_by(UserStats.total_points, desc(UserStats.user_id))
+            .limit(top_k),
+        )
         result = await self.db_session.execute(stmt)
-        users = result.fetchall()
+        rows = result.fetchall()
+        top_rows = [row[:4] for row in rows if row.is_top]
+        bottom_rows = [row[:4] for row in rows if not row.is_top]
 
-        if len(users) < 2:
+        pairs = farthest_pairs(top_rows, bottom_rows, top_k)
+        if not pairs:
             raise HTTPException(status_code=404, detail="Not enough users to compare")
+        return pairs
 
-        # max_points = users[0][3]  # Исправляем индексацию на целочисленные значения
-        # second_max_points = users[len(users)][3]
-
-        diffs = []
-        for j in range(len(users)):
-            for i in range(len(users)):
-                if i < j:
-                    d = users[i][3] - users[j][3]
-                    diff = (i, j, d)
-                    diffs.append(diff)
-                else:
-                    break
-        print(diffs)
-        difference = max(diffs, key=lambda x: x[2])
-        user1_number = difference[0]
-        user2_number = difference[1]
-        max_difference = difference[2]
-
-        return {
-            "user1": {
-                "user_id": str(users[user1_number][0]),  # Преобразуем user_id к строке, если нужно
-                "name": users[user1_number][1],
-                "surname": users[user1_number][2],
-                "total_points": users[user1_number][3],
-            },
-            "user2": {
-                "user_id": str(users[user2_number][0]),  # Преобразуем user_id к строке, если нужно
-                "name": users[user2_number][1],
-                "surname": users[user2_number][2],
-                "total_points": users[user2_number][3],
-            },
-            "point_difference": max_difference,
-        }
+    async def get_users_with_min_point_difference(self, top_k: int = 1) -> list:
+        if top_k == 1:
+            pairs = await self._get_closest_adjacent_pair()
+        else:
+            pairs = await self._get_closest_pairs(top_k)
+        if not pairs:
+            raise HTTPException(status_code=404, detail="Not enough users to compare")
+        return pairs
 
-    async def get_users_with_min_point_difference(self):
-        stmt = (
-            select(
-                User.user_id,
-                User.name,
-                User.surname,
-                func.sum(Achievement.points).label("total_points")
+    async def _get_closest_adjacent_pair(self) -> list:
+        totals = self._user_totals().subquery()
+        order = (totals.c.total_points.desc(), totals.c.user_id)
+        ranked = select(
+            totals,
+            func.lead(totals.c.user_id).over(order_by=order).label("next_user_id"),
+            func.lead(totals.c.name).over(order_by=order).label("next_name"),
+            func.lead(totals.c.surname).over(order_by=order).label("next_surname"),
+            func.lead(totals.c.total_points).over(order_by=order).label("next_total_points"),
+        ).subquery()
+        result = await self.db_session.execute(
+            select(ranked)
+            .where(ranked.c.next_user_id.is_not(None))
+            .order_by(
+                ranked.c.total_points - ranked.c.next_total_points,
+                ranked.c.total_points.desc(),
+                ranked.c.user_id,
             )
-            .join(ReceivedAchievements, User.user_id == ReceivedAchievements.user_id)
-            .join(Achievement, ReceivedAchievements.achievement_id == Achievement.achievement_id)
-            .group_by(User.user_id, User.name, User.surname)
-            .order_by(func.sum(Achievement.points).desc())
+            .limit(1)
         )
+        row = result.first()
+        if row is None:
+            return []
+        return [make_pair(row[:4], row[4:])]
 
-        result = await self.db_session.execute(stmt)
-        users = result.fetchall()
-
-        if len(users) < 2:
-            raise HTTPException(status_code=404, detail="Not enough users to compare")
-
-        diffs = []
-        for j in range(len(users)):
-            for i in range(len(users)):
-                if i < j:
-                    d = users[i][3] - users[j][3]
-                    diff = (i, j, d)
-                    diffs.append(diff)
-                else:
-                    break
-        print(diffs)
-        difference = min(diffs, key=lambda x: x[2])
-        user1_number = difference[0]
-        user2_number = difference[1]
-        max_difference = difference[2]
-
-        return {
-            "user1": {
-                "user_id": str(users[user1_number][0]),  # Преобразуем user_id к строке, если нужно
-                "name": users[user1_number][1],
-                "surname": users[user1_number][2],
-                "total_points": users[user1_number][3],
-            },
-            "user2": {
-                "user_id": str(users[user2_number][0]),  # Преобразуем user_id к строке, если нужно
-                "name": users[user2_number][1],
-                "surname": users[user2_number][2],
-                "total_points": users[user2_number][3],
-            },
-            "point_difference": max_difference,
-        }
-
-    async def get_users_with_achievements_for_seven_consecutive_days(self):
+    async def _get_closest_pairs(self, top_k: int) -> list:
+        """k closest pairs, ties go to the higher and then to the lower user first"""
+        totals = self._user_totals().subquery()
+        ranked = select(
+            totals,
+            func.row_number().over(order_by=(totals.c.total_points.desc(), totals.c.user_id)).label("place"),
+        ).cte("ranked")
+        higher, lower = ranked.alias("higher"), ranked.alias("lower")
+        # пары из ответа отстоят друг от друга не больше чем на k строк; соединение
+        # по равенству с каждым сдвигом - hash join, а не nested loop по диапазону
+        distances = func.generate_series(1, top_k).table_valued("distance").render_derived(name="distances")
         result = await self.db_session.execute(
+            select(
+                higher.c.user_id, higher.c.name, higher.c.surname, higher.c.total_points,
+                lower.c.user_id, lower.c.name, lower.c.surname, lower.c.total_points,
+            )
+            .select_from(higher)
+            .join(distances, true())
+            .join(lower, lower.c.place == higher.c.place + distances.c.distance)
+            .order_by(higher.c.total_points - lower.c.total_points, higher.c.place, lower.c.place)
+            .limit(top_k)
+        )
+        return [make_pair(row[:4], row[4:]) for row in result]
+
+    async def get_users_with_achievements_for_consecutive_days(self, n_days: int) -> AsyncIterator[dict]:
+        """Yields users having a streak of at least n_days with all their achievements"""
+        eligible_users = (
+            select(UserStats.user_id)
+            .where(UserStats.longest_streak >= n_days)
+            .subquery()
+        )
+        result = await self.db_session.stream(
             select(
                 User.user_id,
                 User.name,
                 User.surname,
                 User.email,
                 User.language,
-                func.array_agg(ReceivedAchievements.date).label('dates'),
-                func.array_agg(Achievement.name).label('achievement_names')
+                ReceivedAchievements.date,
+                Achievement.name.label("achievement_name"),
             )
+            .join(eligible_users, User.user_id == eligible_users.c.user_id)
             .join(ReceivedAchievements, User.user_id == ReceivedAchievements.user_id)
             .join(Achievement, ReceivedAchievements.achievement_id == Achievement.achievement_id)
-            .group_by(User.user_id)
-        )
-        users_with_achievements = result.fetchall()
-
-        eligible_users = []
-        for user in users_with_achievements:
-            if self._check_seven_consecutive_days(user.dates):
-                achievements = [
-                    {"name": achievement_name, "date": date}
-                    for achievement_name, date in zip(user.achievement_names, user.dates)
-                ]
-                eligible_users.append({
-                    "user": user,
-                    "achievements": achievements
-                })
-
-        return eligible_users
-
-    def _check_seven_consecutive_days(self, dates):
-        if len(dates) < 7:
-            return False
-
-        dates = sorted(dates)
-        consecutive_days_count = 1
-        for i in range(1, len(dates)):
-            if (dates[i] - dates[i - 1]).days == 1:
-                consecutive_days_count += 1
-                if consecutive_days_count == 7:
-                    return True
-            else:
-                consecutive_days_count = 1
-        return False
+            .order_by(User.user_id, ReceivedAchievements.date)
+        )
+
+        # строки идут по пользователям, поэтому в памяти только один пользователь
+        user_data = None
+        async for row in result:
+            if user_data is None or user_data["user"].user_id != row.user_id:
+                if user_data is not None:
+                    yield user_data
+                user_data = {"user": row, "achievements": []}
+            user_data["achievements"].append({"name": row.achievement_name, "date": row.date})
+        if user_data is not None:
+            yield user_data
 
 
 # Achievement DAL (добавляем метод для получения всех достижений и добавления достижения)
@@ -233,9 +360,26 @@ class AchievementDAL:
     def __init__(self, db_session: AsyncSession):
         self.db_session = db_session
 
-    async def get_all_achievements(self):
-        result = await self.db_session.execute(select(Achievement))
-        return result.scalars().all()
+    async def get_all_achievements(self) -> list:
+        await achievement_catalog.ensure_fresh(self._load_catalog)
+        return achievement_catalog.all()
+
+    async def _load_catalog(self) -> tuple:
+        """Achievements, their holder counts by id and the number of users"""
+        result = await self.db_session.execute(
+            select(Achievement, AchievementStats.holders)
+            .outerjoin(AchievementStats, AchievementStats.achievement_id == Achievement.achievement_id)
+        )
+        achievements, holders = [], {}
+        for achievement, count in result:
+            achievements.append(ShowAchievement.model_validate(achievement))
+            holders[achievement.achievement_id] = count or 0
+        users = await self.db_session.scalar(select(UserCount.users).where(UserCount.id == 1))
+        return achievements, holders, users or 0
+
+    async def get_rarest_achievements(self, limit: int) -> list:
+        await achievement_catalog.ensure_fresh(self._load_catalog)
+        return achievement_catalog.rarest(limit)
 
     async def create_achievement(self, name: str, points: int, ru_description: str, en_description: str) -> Achievement:
         new_achievement = Achievement(
@@ -246,133 +390,748 @@ class AchievementDAL:
         )
         self.db_session.add(new_achievement)
         await self.db_session.flush()
+
+        cached = ShowAchievement.model_validate(new_achievement)
+        run_after_commit(self.db_session, lambda: achievement_catalog.put(cached))
         return new_achievement
 
-    async def get_achievement_by_id(self, achievement_id: uuid.UUID) -> Achievement:
-        result = await self.db_session.execute(
-            select(Achievement).filter_by(achievement_id=achievement_id)
-        )
-        achievement = result.scalar()
+    async def get_achievement_by_id(self, achievement_id: uuid.UUID) -> ShowAchievement:
+        await achievement_catalog.ensure_fresh(self._load_catalog)
+        achievement = achievement_catalog.get_by_id(achievement_id)
+        if achievement is None:
+            achievement = await self._fetch_missing(Achievement.achievement_id == achievement_id)
         if achievement is None:
             raise HTTPException(status_code=404, detail="Achievement not found")
         return achievement
 
-    async def get_achievement_by_name(self, name: str) -> Achievement:
-        result = await self.db_session.execute(
-            select(Achievement).filter_by(name=name)
-        )
-        achievement = result.scalar()
-        if achievement is None:
-            raise HTTPException(status_code=404, detail="Achievement not found")
+    async def get_achievement_by_name(self, name: str) -> ShowAchievement:
+        achievements = await self.get_achievements_by_names([name])
+        if name not in achievements:
+            raise HTTPException(status_code=404, detail=f"Achievement with name '{name}' not found")
+        return achievements[name]
+
+    async def get_achievements_by_names(self, names) -> dict:
+        """Resolves names through the catalog, unknown names cost one query together"""
+        await achievement_catalog.ensure_fresh(self._load_catalog)
+        achievements = {}
+        missing = []
+        for name in set(names):
+            achievement = achievement_catalog.get_by_name(name)
+            if achievement is None:
+                missing.append(name)
+            else:
+                achievements[name] = achievement
+        if missing:
+            # могли быть созданы другим процессом после загрузки каталога
+            result = await self.db_session.execute(select(Achievement).where(Achievement.name.in_(missing)))
+            for row in result.scalars():
+                achievement = ShowAchievement.model_validate(row)
+                achievement_catalog.put(achievement)
+                achievements[achievement.name] = achievement
+        return achievements
+
+    async def _fetch_missing(self, criteria) -> Optional[ShowAchievement]:
+        result = await self.db_session.execute(select(Achievement).where(criteria))
+        row = result.scalar()
+        if row is None:
+            return None
+        achievement = ShowAchievement.model_validate(row)
+        achievement_catalog.put(achievement)
         return achievement
 
     async def get_total_points_by_user_id(self, user_id: uuid.UUID):
-        stmt = (
-            select(func.sum(Achievement.points))
-            .join(ReceivedAchievements, Achievement.achievement_id == ReceivedAchievements.achievement_id)
-            .filter(ReceivedAchievements.user_id == user_id)
-            .group_by(ReceivedAchievements.user_id)
+        result = await self.db_session.execute(
+            select(UserStats.total_points).filter_by(user_id=user_id)
         )
-        result = await self.db_session.execute(stmt)
         total_points = result.scalar_one_or_none()
         return total_points if total_points else 0
 
 
-class ReceivedAchievementsDAL:
-    """Data Access Layer for operating received achievements"""
+class UserStatsDAL:
+    """Data Access Layer for operating per-user aggregates"""
 
     def __init__(self, db_session: AsyncSession):
         self.db_session = db_session
 
-    async def create_received_achievement(
-            self, email: str, achievement_name: str, date: date
-    ) -> ReceivedAchievements:
-        # Получаем пользователя по email
-        user_result = await self.db_session.execute(
-            select(User).filter_by(email=email)
+    @staticmethod
+    def upsert_award_stmt(awards):
+        """INSERT .. ON CONFLICT adding one award per row of the (user_id, points, date) select"""
+        stmt = insert(UserStats).from_select(
+            ["user_id", "achievements_count", "total_points", "last_award_date", "current_streak", "longest_streak"],
+            select(awards.c.user_id, literal(1), awards.c.points, awards.c.date, literal(1), literal(1)),
         )
-        user = user_result.scalar()
-        if user is None:
-            raise HTTPException(status_code=404, detail=f"User with email '{email}' not found")
+        # серия продолжается, если награда пришла на следующий день после последней;
+        # награда задним числом может склеить серии, её пересчитываем отдельно
+        current_streak = case(
+            (stmt.excluded.last_award_date == UserStats.last_award_date + 1, UserStats.current_streak + 1),
+            (stmt.excluded.last_award_date > UserStats.last_award_date + 1, 1),
+            else_=UserStats.current_streak,
+        )
+        return stmt.on_conflict_do_update(
+            index_elements=[UserStats.user_id],
+            set_={
+                "achievements_count": UserStats.achievements_count + 1,
+                "total_points": UserStats.total_points + stmt.excluded.total_points,
+                "last_award_date": func.greatest(UserStats.last_award_date, stmt.excluded.last_award_date),
+                "current_streak": current_streak,
+                "longest_streak": func.greatest(UserStats.longest_streak, current_streak),
+            },
+        ).returning(UserStats.user_id, UserStats.total_points, UserStats.last_award_date)
+
+    async def after_award(self, user_id: uuid.UUID, date: date, total_points: int, last_award_date: date) -> None:
+        if last_award_date > date:
+            await self.recompute_streaks([user_id])
+        run_after_commit(self.db_session, lambda: rank_index.update(user_id, total_points))
+
+    async def add_awards(self, awards: list) -> None:
+        """Applies a batch of (user_id, points, date) awards in one upsert.
 
-        # Получаем достижение по имени
-        achievement_result = await self.db_session.execute(
-            select(Achievement).filter_by(name=achievement_name)
+        Streaks of users whose award days all follow their last_award_date
+        are continued from the stored ones. Users with a backdated or
+        same-day award get them recomputed from their whole history.
+        """
+        deltas, days = {}, {}
+        for user_id, points, award_date in awards:
+            count, total_points, last_award_date = deltas.get(user_id, (0, 0, award_date))
+            deltas[user_id] = (count + 1, total_points + points, max(last_award_date, award_date))
+            days.setdefault(user_id, set()).add(award_date)
+
+        # строки блокируются до конца транзакции, серии не изменятся до апсерта
+        result = await self.db_session.execute(
+            select(UserStats.user_id, UserStats.last_award_date, UserStats.current_streak, UserStats.longest_streak)
+            .where(UserStats.user_id.in_(list(deltas)))
+            .order_by(UserStats.user_id)
+            .with_for_update()
         )
-        achievement = achievement_result.scalar()
-        if achievement is None:
-            raise HTTPException(status_code=404, detail=f"Achievement with name '{achievement_name}' not found")
+        stored = {row.user_id: row for row in result}
+
+        streaks, recompute = {}, []
+        for user_id, award_days in days.items():
+            row = stored.get(user_id)
+            last_day, current, longest = (None, 0, 0) if row is None else (
+                row.last_award_date, row.current_streak, row.longest_streak
+            )
+            if last_day is not None and min(award_days) <= last_day:
+                recompute.append(user_id)
+                continue
+            for day in sorted(award_days):
+                current = current + 1 if last_day is not None and day == last_day + timedelta(days=1) else 1
+                longest = max(longest, current)
+                last_day = day
+            streaks[user_id] = (current, longest)
+
+        stmt = insert(UserStats).values([
+            {
+                "user_id": user_id,
+                "achievements_count": count,
+                "total_points": total_points,
+                "last_award_date": last_award_date,
+                # recomputed users get theirs after the upsert
+                "current_streak": streaks.get(user_id, (0, 0))[0],
+                "longest_streak": streaks.get(user_id, (0, 0))[1],
+            }
+            for user_id, (count, total_points, last_award_date) in deltas.items()
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserStats.user_id],
+            set_={
+                "achievements_count": UserStats.achievements_count + stmt.excluded.achievements_count,
+                "total_points": UserStats.total_points + stmt.excluded.total_points,
+                "last_award_date": func.greatest(UserStats.last_award_date, stmt.excluded.last_award_date),
+                "current_streak": stmt.excluded.current_streak,
+                "longest_streak": stmt.excluded.longest_streak,
+            },
+        ).returning(UserStats.user_id, UserStats.total_points, UserStats.achievements_count)
+        result = await self.db_session.execute(stmt)
+        totals = []
+        for user_id, total_points, achievements_count in result:
+            totals.append((user_id, total_points))
+            # a concurrent transaction created the row after it was not found, its awards are not in the streaks
+            if user_id not in stored and user_id in streaks and achievements_count != deltas[user_id][0]:
+                recompute.append(user_id)
+
+        if recompute:
+            await self.recompute_streaks(recompute)
+
+        def update_rank_index():
+            for user_id, total_points in totals:
+                rank_index.update(user_id, total_points)
+
+        run_after_commit(self.db_session, update_rank_index)
+
+    async def rebuild(self) -> None:
+        """Recomputes all aggregates from received_achievements"""
+        await self.db_session.execute(delete(UserStats))
+        await self.db_session.execute(
+            insert(UserStats).from_select(
+                ["user_id", "achievements_count", "total_points", "last_award_date", "current_streak", "longest_streak"],
+                select(
+                    ReceivedAchievements.user_id,
+                    func.count(ReceivedAchievements.ra_id),
+                    func.sum(Achievement.points),
+                    func.max(ReceivedAchievements.date),
+                    literal(0),
+                    literal(0),
+                )
+                .join(Achievement, ReceivedAchievements.achievement_id == Achievement.achievement_id)
+                .group_by(ReceivedAchievements.user_id)
+            )
+        )
+        await self.recompute_streaks()
 
-        # Создаем запись о полученном достижении
-        new_received_achievement = ReceivedAchievements(
-            user_id=user.user_id,
-            achievement_id=achievement.achievement_id,
-            date=date
+    async def recompute_streaks(self, user_ids: Optional[list] = None) -> None:
+        """Recomputes streaks from the awards with the gaps-and-islands technique"""
+        criteria = [] if user_ids is None else [ReceivedAchievements.user_id.in_(user_ids)]
+        runs = streak_runs(*criteria).subquery()
+        streaks = (
+            select(
+                runs.c.user_id,
+                func.max(runs.c.length).label("longest_streak"),
+                # последняя серия - текущая
+                func.array_agg(aggregate_order_by(runs.c.length, runs.c.last_day.desc()))[1].label("current_streak"),
+            )
+            .group_by(runs.c.user_id)
+            .subquery()
+        )
+        await self.db_session.execute(
+            update(UserStats)
+            .where(UserStats.user_id == streaks.c.user_id)
+            .values(longest_streak=streaks.c.longest_streak, current_streak=streaks.c.current_streak)
         )
-        self.db_session.add(new_received_achievement)
-        await self.db_session.commit()  # Сохраняем изменения в базе
-        return new_received_achievement
 
-    async def get_user(self, email: str) -> User:
+    async def get_all_totals(self):
         result = await self.db_session.execute(
-            select(User).filter_by(email=email)
+            select(UserStats.user_id, UserStats.total_points)
         )
-        user = result.scalar()
-        if user is None:
-            raise HTTPException(status_code=404, detail="User not found")
-        return user
+        return result.fetchall()
+
+    async def get_leaderboard_page(
+            self, limit: int, after_points: Optional[int] = None, after_user_id: Optional[uuid.UUID] = None,
+    ):
+        stmt = (
+            select(User.user_id, User.name, User.surname, UserStats.achievements_count, UserStats.total_points)
+            .join(UserStats, User.user_id == UserStats.user_id)
+            .order_by(UserStats.total_points.desc(), UserStats.user_id)
+            .limit(limit)
+        )
+        if after_points is not None:
+            # keyset по индексу (total_points DESC, user_id)
+            stmt = stmt.where(
+                UserStats.total_points <= after_points,
+                or_(UserStats.total_points < after_points, UserStats.user_id > after_user_id),
+            )
+        result = await self.db_session.execute(stmt)
+        return result.fetchall()
 
-    async def get_achievement_by_name(self, name: str) -> Achievement:
+
+class AchievementHoldersDAL:
+    """Data Access Layer for operating the users holding every achievement"""
+
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    @staticmethod
+    def insert_holders_stmt(holders):
+        """INSERT of the (achievement_id, user_id) select returning the achievement of every new holder"""
+        return (
+            insert(AchievementHolder)
+            .from_select(["achievement_id", "user_id"], holders)
+            .on_conflict_do_nothing()
+            .returning(AchievementHolder.achievement_id)
+        )
+
+    @staticmethod
+    def _count(stmt):
+        return stmt.on_conflict_do_update(
+            index_elements=[AchievementStats.achievement_id],
+            set_={"holders": AchievementStats.holders + stmt.excluded.holders},
+        )
+
+    @staticmethod
+    def count_holders_stmt(new_holders):
+        """INSERT .. ON CONFLICT adding the rows of new_holders, a select of achievement_id, to the counts"""
+        return AchievementHoldersDAL._count(
+            insert(AchievementStats).from_select(
+                ["achievement_id", "holders"],
+                select(new_holders.c.achievement_id, func.count()).group_by(new_holders.c.achievement_id),
+            )
+        )
+
+    async def add_holders(self, holders: set) -> None:
+        """Records (achievement_id, user_id) pairs, only the pairs seen first are counted"""
         result = await self.db_session.execute(
-            select(Achievement).filter_by(name=name)
+            insert(AchievementHolder)
+            .values([{"achievement_id": achievement_id, "user_id": user_id} for achievement_id, user_id in sorted(holders)])
+            .on_conflict_do_nothing()
+            .returning(AchievementHolder.achievement_id)
         )
-        achievement = result.scalar()
-        if achievement is None:
-            raise HTTPException(status_code=404, detail="Achievement not found")
-        return achievement
+        counts = Counter(result.scalars())
+        if not counts:
+            return
+        await self.db_session.execute(
+            self._count(
+                insert(AchievementStats).values([
+                    {"achievement_id": achievement_id, "holders": count}
+                    for achievement_id, count in sorted(counts.items())
+                ])
+            )
+        )
+        run_after_commit(self.db_session, lambda: achievement_catalog.add_holders(counts))
 
-    async def get_received_achievements_by_email(self, email: str):
-        user_result = await self.db_session.execute(
-            select(User).filter_by(email=email)
+    async def rebuild(self) -> None:
+        """Recomputes holders and their counts from received_achievements"""
+        await self.db_session.execute(delete(AchievementStats))
+        await self.db_session.execute(delete(AchievementHolder))
+        await self.db_session.execute(
+            insert(AchievementHolder).from_select(
+                ["achievement_id", "user_id"],
+                select(ReceivedAchievements.achievement_id, ReceivedAchievements.user_id).distinct(),
+            )
         )
-        user = user_result.scalar()
-        if user is None:
-            raise HTTPException(status_code=404, detail=f"User with email '{email}' not found")
+        await self.db_session.execute(
+            insert(AchievementStats).from_select(
+                ["achievement_id", "holders"],
+                select(AchievementHolder.achievement_id, func.count()).group_by(AchievementHolder.achievement_id),
+            )
+        )
+        run_after_commit(self.db_session, achievement_catalog.invalidate)
+
+
+TIMESERIES_BUCKETS = ("day", "week", "month")
+
+
+def bucket_start(day: date, bucket: str) -> date:
+    """First day of the day, ISO week or month containing the day, as date_trunc computes it"""
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start: date, bucket: str) -> date:
+    if bucket == "week":
+        return start + timedelta(days=7)
+    if bucket == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def bucket_count(date_from: date, date_to: date, bucket: str) -> int:
+    """Buckets overlapping the range"""
+    first, last = bucket_start(date_from, bucket), bucket_start(date_to, bucket)
+    if bucket == "week":
+        return (last - first).days // 7 + 1
+    if bucket == "month":
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    return (last - first).days + 1
+
+
+class AwardRollupDAL:
+    """Data Access Layer for operating awards and points per day and achievement"""
+
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    @staticmethod
+    def _upsert(stmt):
+        return stmt.on_conflict_do_update(
+            index_elements=[DailyAwardRollup.date, DailyAwardRollup.achievement_id],
+            set_={
+                "awards": DailyAwardRollup.awards + stmt.excluded.awards,
+                "points": DailyAwardRollup.points + stmt.excluded.points,
+            },
+        )
+
+    @staticmethod
+    def upsert_award_stmt(awards):
+        """INSERT .. ON CONFLICT adding one award per row of the (date, achievement_id, points) select"""
+        return AwardRollupDAL._upsert(
+            insert(DailyAwardRollup).from_select(
+                ["date", "achievement_id", "awards", "points"],
+                select(awards.c.date, awards.c.achievement_id, literal(1), awards.c.points),
+            )
+        )
+
+    async def add_awards(self, awards: list) -> None:
+        """Applies a batch of (achievement_id, points, date) awards in one upsert"""
+        deltas = {}
+        for achievement_id, points, award_date in awards:
+            count, total_points = deltas.get((award_date, achievement_id), (0, 0))
+            deltas[(award_date, achievement_id)] = (count + 1, total_points + points)
+
+        # a popular achievement puts concurrent batches on the same rows, they are locked in one order
+        await self.db_session.execute(
+            self._upsert(
+                insert(DailyAwardRollup).values([
+                    {"date": award_date, "achievement_id": achievement_id, "awards": count, "points": total_points}
+                    for (award_date, achievement_id), (count, total_points) in sorted(deltas.items())
+                ])
+            )
+        )
+
+    async def rebuild(self, date_from: Optional[date] = None, date_to: Optional[date] = None) -> None:
+        """Recomputes the days of the range, all of them by default, from received_achievements"""
+        rollup_criteria, award_criteria = [], []
+        if date_from is not None:
+            rollup_criteria.append(DailyAwardRollup.date >= date_from)
+            award_criteria.append(ReceivedAchievements.date >= date_from)
+        if date_to is not None:
+            rollup_criteria.append(DailyAwardRollup.date <= date_to)
+            award_criteria.append(ReceivedAchievements.date <= date_to)
+
+        # awards wait for the rebuild instead of being counted twice or lost by it
+        await self.db_session.execute(text("LOCK TABLE daily_award_rollup IN SHARE ROW EXCLUSIVE MODE"))
+        await self.db_session.execute(delete(DailyAwardRollup).where(*rollup_criteria))
+        await self.db_session.execute(
+            insert(DailyAwardRollup).from_select(
+                ["date", "achievement_id", "awards", "points"],
+                select(
+                    ReceivedAchievements.date,
+                    ReceivedAchievements.achievement_id,
+                    func.count(ReceivedAchievements.ra_id),
+                    func.sum(Achievement.points),
+                )
+                .join(Achievement, ReceivedAchievements.achievement_id == Achievement.achievement_id)
+                .where(*award_criteria)
+                .group_by(ReceivedAchievements.date, ReceivedAchievements.achievement_id)
+            )
+        )
+
+    async def get_timeseries(self, date_from: date, date_to: date, bucket: str) -> list:
+        """Returns (start, awards, points) of every bucket overlapping the range, empty ones included.
+
+        Reads one rollup row per day and achievement of the range, buckets
+        are cut to the range at its ends.
+        """
+        start = cast(func.date_trunc(bucket, cast(DailyAwardRollup.date, DateTime)), Date).label("start")
+        result = await self.db_session.execute(
+            select(
+                start,
+                func.sum(DailyAwardRollup.awards).label("awards"),
+                func.sum(DailyAwardRollup.points).label("points"),
+            )
+            .where(DailyAwardRollup.date >= date_from, DailyAwardRollup.date <= date_to)
+            # by the output column, the expression itself holds a bind parameter
+            .group_by(literal_column("start"))
+            .order_by(literal_column("start"))
+        )
+        totals = {row.start: (row.awards, row.points) for row in result}
+
+        series = []
+        current = bucket_start(date_from, bucket)
+        while current <= date_to:
+            awards, points = totals.get(current, (0, 0))
+            series.append((current, awards, points))
+            current = next_bucket(current, bucket)
+        return series
+
+
+class ReceivedAchievementsDAL:
+    """Data Access Layer for operating received achievements"""
+
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    async def create_received_achievement(self, email: str, achievement_name: str, date: date):
+        """Awards the achievement in one statement and returns the fields to display.
+
+        The achievement comes from the catalog cache. The user is resolved, the
+        award is inserted and user_stats is updated by data-modifying CTEs of
+        a single statement. The transaction is left to the caller. An email
+        remembered as unknown is looked up again by the statement itself.
+        """
+        achievement = await AchievementDAL(self.db_session).get_achievement_by_name(achievement_name)
+        user = (
+            select(User.user_id, User.name, User.surname, User.language)
+            .filter_by(email=email)
+            .cte("award_user")
+        )
+        inserted = (
+            insert(ReceivedAchievements)
+            .from_select(
+                ["ra_id", "user_id", "achievement_id", "date"],
+                select(
+                    literal(uuid.uuid4(), UUID),
+                    user.c.user_id,
+                    literal(achievement.achievement_id, UUID),
+                    literal(date, Date),
+                ),
+            )
+            .returning(ReceivedAchievements.ra_id, ReceivedAchievements.user_id, ReceivedAchievements.date)
+            .cte("award")
+        )
+        stats = UserStatsDAL.upsert_award_stmt(
+            select(inserted.c.user_id, literal(achievement.points).label("points"), inserted.c.date).subquery()
+        ).cte("award_stats")
+        rollup = AwardRollupDAL.upsert_award_stmt(
+            select(
+                inserted.c.date,
+                literal(achievement.achievement_id, UUID).label("achievement_id"),
+                literal(achievement.points).label("points"),
+            ).subquery()
+        ).cte("award_rollup")
+        holder = AchievementHoldersDAL.insert_holders_stmt(
+            select(literal(achievement.achievement_id, UUID), inserted.c.user_id)
+        ).cte("award_holder")
+        holder_stats = AchievementHoldersDAL.count_holders_stmt(holder).cte("award_holder_stats")
 
         result = await self.db_session.execute(
-            select(ReceivedAchievements).filter_by(user_id=user.user_id)
+            select(
+                inserted.c.ra_id,
+                inserted.c.date,
+                user.c.user_id,
+                user.c.name,
+                user.c.surname,
+                user.c.language,
+                literal(achievement.points).label("points"),
+                case(
+                    (user.c.language == "ru", literal(achievement.ru_description)),
+                    else_=literal(achievement.en_description),
+                ).label("description"),
+                stats.c.total_points,
+                stats.c.last_award_date,
+                select(func.count()).select_from(holder).scalar_subquery().label("new_holders"),
+            )
+            .select_from(inserted)
+            .join(user, user.c.user_id == inserted.c.user_id)
+            .join(stats, stats.c.user_id == inserted.c.user_id)
+            # not read by the select, but executed with the statement
+            .add_cte(rollup, holder_stats)
         )
-        return result.scalars().all()
+        award = result.first()
+        if award is None:
+            # the achievement exists, so only the user can be missing
+            user_cache.put_unknown(email)
+            raise HTTPException(status_code=404, detail=f"User with email '{email}' not found")
+        user_cache.put(
+            email,
+            ShowUser(
+                user_id=award.user_id, name=award.name, surname=award.surname, email=email, language=award.language,
+            )
+        )
+
+        await UserStatsDAL(self.db_session).after_award(award.user_id, date, award.total_points, award.last_award_date)
+        if award.new_holders:
+            run_after_commit(self.db_session, lambda: achievement_catalog.add_holders({achievement.achievement_id: 1}))
+        run_after_commit(self.db_session, lambda: response_cache.invalidate(AWARDS_TAG))
+        run_after_commit(self.db_session, lambda: recent_award_writers.mark(email))
+        return award
 
-    async def get_users_with_max_point_difference_details(self):
-        user_dal = UserDAL(self.db_session)
-        achievement_dal = AchievementDAL(self.db_session)
+    async def create_received_achievements_bulk(self, records: list, ra_ids: Optional[list] = None) -> list:
+        """Awards a batch of (email, achievement_name, date) records.
 
-        max_points_data = await user_dal.get_users_with_max_point_difference()
-        user1_id = max_points_data["user1"]["user_id"]
-        user2_id = max_points_data["user2"]["user_id"]
+        Emails are resolved through the user cache and one lookup of the
+        rest, names through the catalog, the awards are inserted with a single
+        executemany and user_stats gets one upsert. ra_ids are used for the awards when the caller already
+        handed them out.
+        Returns for every record either the fields to display or an error text.
+        """
+        names = {name for _, name, _ in records}
+        users = await UserDAL(self.db_session).find_users((email for email, _, _ in records), confirm_unknown=True)
+        achievements = await AchievementDAL(self.db_session).get_achievements_by_names(names)
 
-        user1_points = await achievement_dal.get_total_points_by_user_id(user1_id)
-        user2_points = await achievement_dal.get_total_points_by_user_id(user2_id)
+        results, rows, awards, rollup_awards = [], [], [], []
+        for index, (email, achievement_name, award_date) in enumerate(records):
+            user = users.get(email)
+            achievement = achievements.get(achievement_name)
+            if user is None:
+                results.append(f"User with email '{email}' not found")
+                continue
+            if achievement is None:
+                results.append(f"Achievement with name '{achievement_name}' not found")
+                continue
+            ra_id = ra_ids[index] if ra_ids is not None else uuid.uuid4()
+            rows.append({
+                "ra_id": ra_id,
+                "user_id": user.user_id,
+                "achievement_id": achievement.achievement_id,
+                "date": award_date,
+            })
+            awards.append((user.user_id, achievement.points, award_date))
+            rollup_awards.append((achievement.achievement_id, achievement.points, award_date))
+            results.append({
+                "ra_id": ra_id,
+                "date": award_date,
+                "name": user.name,
+                "surname": user.surname,
+                "points": achievement.points,
+                "description": achievement.ru_description if user.language == "ru" else achievement.en_description,
+            })
 
-        max_points_data["user1"]["total_points"] = user1_points
-        max_points_data["user2"]["total_points"] = user2_points
+        if rows:
+            await self.db_session.execute(insert(ReceivedAchievements), rows)
+            await UserStatsDAL(self.db_session).add_awards(awards)
+            await AwardRollupDAL(self.db_session).add_awards(rollup_awards)
+            await AchievementHoldersDAL(self.db_session).add_holders(
+                {(row["achievement_id"], row["user_id"]) for row in rows}
+            )
+            run_after_commit(self.db_session, lambda: response_cache.invalidate(AWARDS_TAG))
 
-        return max_points_data
+            def mark_awarded_users():
+                for email, _, _ in records:
+                    if email in users:
+                        recent_award_writers.mark(email)
 
-    async def get_users_with_min_point_difference_details(self):
-        user_dal = UserDAL(self.db_session)
-        achievement_dal = AchievementDAL(self.db_session)
+            run_after_commit(self.db_session, mark_awarded_users)
+        return results
 
-        min_points_data = await user_dal.get_users_with_min_point_difference()
-        user1_id = min_points_data["user1"]["user_id"]
-        user2_id = min_points_data["user2"]["user_id"]
+    async def get_user(self, email: str) -> ShowUser:
+        user = await UserDAL(self.db_session).find_user(email)
+        if user is None:
+            raise HTTPException(status_code=404, detail=f"User with email '{email}' not found")
+        return user
 
-        user1_points = await achievement_dal.get_total_points_by_user_id(user1_id)
-        user2_points = await achievement_dal.get_total_points_by_user_id(user2_id)
+    async def get_achievement_by_name(self, name: str) -> ShowAchievement:
+        return await AchievementDAL(self.db_session).get_achievement_by_name(name)
 
-        min_points_data["user1"]["total_points"] = user1_points
-        min_points_data["user2"]["total_points"] = user2_points
+    async def get_received_achievements_by_email(
+            self,
+            email: str,
+            limit: int,
+            after_date: Optional[date] = None,
+            after_ra_id: Optional[uuid.UUID] = None,
+            date_from: Optional[date] = None,
+            date_to: Optional[date] = None,
+    ):
+        """Returns one page of the user's achievements with the localized description.
 
-        return min_points_data
+        Awards are joined to the user with an outer join, so a single query
+        tells an unknown email (no rows) from a user without awards (one row
+        without ra_id).
+        """
+        if user_cache.get_by_email(email) is UNKNOWN_USER:
+            raise HTTPException(status_code=404, detail=f"User with email '{email}' not found")
+        criteria = [ReceivedAchievements.user_id == User.user_id]
+        if after_date is not None:
+            criteria.append(tuple_(ReceivedAchievements.date, ReceivedAchievements.ra_id) > tuple_(after_date, after_ra_id))
+            # the row comparison alone does not let the planner skip the earlier partitions
+            criteria.append(ReceivedAchievements.date >= after_date)
+        if date_from is not None:
+            criteria.append(ReceivedAchievements.date >= date_from)
+        if date_to is not None:
+            criteria.append(ReceivedAchievements.date <= date_to)
 
+        awards = join(ReceivedAchievements, Achievement, ReceivedAchievements.achievement_id == Achievement.achievement_id)
+        result = await self.db_session.execute(
+            select(
+                ReceivedAchievements.ra_id,
+                ReceivedAchievements.date,
+                User.name,
+                User.surname,
+                Achievement.points,
+                case(
+                    (User.language == "ru", Achievement.ru_description),
+                    else_=Achievement.en_description,
+                ).label("description"),
+            )
+            .select_from(User)
+            .outerjoin(awards, and_(*criteria))
+            .where(User.email == email)
+            .order_by(ReceivedAchievements.date, ReceivedAchievements.ra_id)
+            .limit(limit)
+        )
+        rows = result.fetchall()
+        if not rows:
+            if reads_primary(self.db_session):
+                user_cache.put_unknown(email)
+            raise HTTPException(status_code=404, detail=f"User with email '{email}' not found")
+        return [row for row in rows if row.ra_id is not None]
+
+    async def get_received_achievements_by_emails(self, emails: list, limit: int) -> dict:
+        """Returns {email: (user, total_points, awards)} for the known emails, up to limit first awards of each.
+
+        Users are resolved by find_users, their awards come from one query:
+        the user ids and languages are unnested and a lateral subquery reads
+        the first awards of every user off the (user_id, date, ra_id) index.
+        """
+        users = await UserDAL(self.db_session).find_users(emails)
+        if not users:
+            return {}
+
+        batch = (
+            func.unnest(
+                literal([user.user_id for user in users.values()], ARRAY(UUID)),
+                literal([user.language for user in users.values()], ARRAY(String)),
+            )
+            .table_valued("user_id", "language")
+            .render_derived(name="batch")
+        )
+        awards = (
+            select(
+                ReceivedAchievements.ra_id,
+                ReceivedAchievements.date,
+                Achievement.points,
+                case(
+                    (batch.c.language == "ru", Achievement.ru_description),
+                    else_=Achievement.en_description,
+                ).label("description"),
+            )
+            .join(Achievement, Achievement.achievement_id == ReceivedAchievements.achievement_id)
+            .where(ReceivedAchievements.user_id == batch.c.user_id)
+            .order_by(ReceivedAchievements.date, ReceivedAchievements.ra_id)
+            .limit(limit)
+            .lateral("awards")
+        )
+        result = await self.db_session.execute(
+            select(
+                batch.c.user_id,
+                func.coalesce(UserStats.total_points, 0).label("total_points"),
+                awards.c.ra_id,
+                awards.c.date,
+                awards.c.points,
+                awards.c.description,
+            )
+            .select_from(batch)
+            .outerjoin(UserStats, UserStats.user_id == batch.c.user_id)
+            .outerjoin(awards, true())
+            .order_by(batch.c.user_id, awards.c.date, awards.c.ra_id)
+        )
+
+        by_id = {user.user_id: (email, user) for email, user in users.items()}
+        found = {}
+        for row in result:
+            email, user = by_id[row.user_id]
+            if email not in found:
+                found[email] = (user, row.total_points, [])
+            if row.ra_id is not None:
+                found[email][2].append(row)
+        return found
+
+    async def stream_received_achievements(
+            self,
+            fetch_size: int,
+            date_from: Optional[date] = None,
+            date_to: Optional[date] = None,
+    ) -> AsyncIterator[list]:
+        """Yields all awards joined to their user and achievement in lists of fetch_size rows.
+
+        Rows are read through a server-side cursor, so memory does not depend
+        on the number of awards. There is no ORDER BY: sorting the whole table
+        would cost more than the export itself. Must run inside a transaction.
+        """
+        criteria = []
+        if date_from is not None:
+            criteria.append(ReceivedAchievements.date >= date_from)
+        if date_to is not None:
+            criteria.append(ReceivedAchievements.date <= date_to)
+
+        result = await self.db_session.stream(
+            select(
+                ReceivedAchievements.ra_id,
+                ReceivedAchievements.date,
+                User.user_id,
+                User.email,
+                User.name,
+                User.surname,
+                Achievement.achievement_id,
+                Achievement.name.label("achievement_name"),
+                Achievement.points,
+            )
+            .join(User, User.user_id == ReceivedAchievements.user_id)
+            .join(Achievement, Achievement.achievement_id == ReceivedAchievements.achievement_id)
+            .where(*criteria)
+            .execution_options(yield_per=fetch_size)
+        )
+        async for partition in result.partitions():
+            yield partition
@@ -3,7 +3,7 @@
 ##############################
 
 
-from sqlalchemy import Column, Integer, String, ForeignKey, Date
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, Date, Index
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
@@ -33,9 +33,73 @@ class Achievement(Base):
 
 
 class ReceivedAchievements(Base):
+    """Partitioned by month on date, partitions are managed by tools.partitions"""
     __tablename__ = "received_achievements"
+    __table_args__ = {"postgresql_partition_by": "RANGE (date)"}
 
     ra_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey('users.user_id'))
-    achievement_id = Column(UUID(as_uuid=True), ForeignKey('achievements.achievement_id'))
-    date = Column(Date, nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.user_id'), nullable=False)
+    achievement_id = Column(UUID(as_uuid=True), ForeignKey('achievements.achievement_id'), nullable=False)
+    date = Column(Date, primary_key=True)  # the partition key is a part of the primary key
+
+
+Index(
+    "ix_received_achievements_user_id_date",
+    ReceivedAchievements.user_id,
+    ReceivedAchievements.date,
+    ReceivedAchievements.ra_id,
+    postgresql_include=["achievement_id"],
+)
+Index("ix_received_achievements_achievement_id", ReceivedAchievements.achievement_id)
+Index("ix_achievements_achievement_id_points", Achievement.achievement_id, postgresql_include=["points"])
+
+
+class UserStats(Base):
+    """Per-user aggregates, updated together with every received achievement"""
+    __tablename__ = "user_stats"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.user_id'), primary_key=True)
+    achievements_count = Column(Integer, nullable=False, default=0)
+    total_points = Column(BigInteger, nullable=False, default=0)
+    last_award_date = Column(Date)
+    current_streak = Column(Integer, nullable=False, default=0)  # days in the run ending at last_award_date
+    longest_streak = Column(Integer, nullable=False, default=0)
+
+
+Index("ix_user_stats_total_points", UserStats.total_points.desc(), UserStats.user_id)
+Index("ix_user_stats_achievements_count", UserStats.achievements_count.desc(), UserStats.user_id)
+Index("ix_user_stats_longest_streak", UserStats.longest_streak)
+
+
+class DailyAwardRollup(Base):
+    """Awards and points per day and achievement, updated together with every received achievement"""
+    __tablename__ = "daily_award_rollup"
+
+    date = Column(Date, primary_key=True)  # the primary key serves date range reads
+    achievement_id = Column(UUID(as_uuid=True), ForeignKey('achievements.achievement_id'), primary_key=True)
+    awards = Column(Integer, nullable=False, default=0)
+    points = Column(BigInteger, nullable=False, default=0)
+
+
+class AchievementHolder(Base):
+    """Users holding an achievement, one row however many times it was received"""
+    __tablename__ = "achievement_holders"
+
+    achievement_id = Column(UUID(as_uuid=True), ForeignKey('achievements.achievement_id'), primary_key=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.user_id'), primary_key=True)
+
+
+class AchievementStats(Base):
+    """Per-achievement aggregates, updated together with every new holder"""
+    __tablename__ = "achievement_stats"
+
+    achievement_id = Column(UUID(as_uuid=True), ForeignKey('achievements.achievement_id'), primary_key=True)
+    holders = Column(BigInteger, nullable=False, default=0)
+
+
+class UserCount(Base):
+    """Number of users, its only row is updated together with every created user"""
+    __tablename__ = "user_count"
+
+    id = Column(Integer, primary_key=True, default=1)
+    users = Column(BigInteger, nullable=False, default=0)
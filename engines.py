@@ -0,0 +1,173 @@
+###############################
+# BLOCK WITH DATABASE ENGINES #
+###############################
+
+
+import asyncio
+import itertools
+import logging
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import metrics
+import settings
+from caches import recent_award_writers
+from slow_queries import instrument_engine as instrument_slow_queries, slow_query_log
+
+
+logger = logging.getLogger("engines")
+
+# 0 on the primary and on a replica which replayed everything it received,
+# otherwise the age of the last replayed transaction
+REPLICATION_LAG_QUERY = text(
+    "SELECT CASE "
+    "WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def create_engine(url: str, name: str):
+    """Async engine with the configured pool, statement metrics and slow query log attached"""
+    engine = create_async_engine(
+        url,
+        future=True,
+        echo=settings.DB_ECHO,
+        poolclass=metrics.TimedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        connect_args={"prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE},
+    )
+    metrics.instrument_engine(engine, name)
+    instrument_slow_queries(engine, slow_query_log)
+    return engine
+
+
+class RollbackWarmUp(Exception):
+    """Rolls the savepoint of a warm-up call back"""
+
+
+async def warm_up(session_factory, connections: int, calls: list) -> None:
+    """Opens the connections at once and runs the calls on each of them.
+
+    Every session holds its connection until all of them are open, so the
+    pool really creates that many. Statements are prepared by the first
+    execution on a connection, the calls run in transactions which are
+    rolled back and their expected errors are ignored.
+    """
+    if connections <= 0:
+        return
+    # asyncio.Barrier is not available before Python 3.11
+    waiting = connections
+    all_opened = asyncio.Event()
+    failed = False
+
+    async def warm_connection():
+        nonlocal waiting, failed
+        async with session_factory() as session:
+            try:
+                try:
+                    await session.connection()
+                finally:
+                    # a failed connection stops counting, the others must not wait for it forever
+                    waiting -= 1
+                    if waiting == 0:
+                        all_opened.set()
+                await all_opened.wait()
+                if failed:
+                    return
+                for call in calls:
+                    # a savepoint keeps the connection of the session between the calls
+                    try:
+                        async with session.begin_nested():
+                            await call(session)
+                            raise RollbackWarmUp
+                    except (HTTPException, RollbackWarmUp):
+                        pass
+            except SQLAlchemyError:
+                logger.warning("connection warm-up failed", exc_info=True)
+                failed = True
+                all_opened.set()
+            finally:
+                await session.rollback()
+
+    await asyncio.gather(*(warm_connection() for _ in range(connections)))
+
+
+class Replica:
+    def __init__(self, url: str, name: str):
+        self.engine = create_engine(url, name)
+        # DAL methods do not trust a miss on a replica, it may lag behind the primary
+        self.session = sessionmaker(self.engine, expire_on_commit=False, class_=AsyncSession, info={"replica": True})
+        self.healthy = True
+        self.lag_seconds = 0.0
+
+    async def check(self, timeout: float, max_lag: float) -> bool:
+        try:
+            async with self.engine.connect() as connection:
+                self.lag_seconds = float(await asyncio.wait_for(connection.scalar(REPLICATION_LAG_QUERY), timeout))
+            healthy = self.lag_seconds <= max_lag
+        except (SQLAlchemyError, OSError, asyncio.TimeoutError):
+            healthy = False
+        if healthy != self.healthy:
+            logger.warning("replica %s is %s", self.engine.url.render_as_string(), "up" if healthy else "down")
+        self.healthy = healthy
+        return healthy
+
+
+class EngineRouter:
+    """Sends writes to the primary and read-only work to healthy replicas in turn.
+
+    Without replicas, or when none of them is healthy, reads go to the
+    primary too. A read keyed by the email of a user who was awarded in the
+    last READ_YOUR_WRITES_SECONDS goes to the primary, so the user sees the
+    award even while the replicas lag behind.
+    """
+
+    def __init__(self, primary_url: str, replica_urls: List[str]):
+        self.primary = create_engine(primary_url, "primary")
+        self.primary_session = sessionmaker(self.primary, expire_on_commit=False, class_=AsyncSession)
+        self.replicas = [Replica(url, f"replica{index}") for index, url in enumerate(replica_urls)]
+        self._turn = itertools.count()
+
+    def read_session(self, sticky_key: Optional[str] = None) -> AsyncSession:
+        if sticky_key is not None and sticky_key in recent_award_writers:
+            metrics.read_sessions.inc("primary_sticky")
+            return self.primary_session()
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            metrics.read_sessions.inc("primary")
+            return self.primary_session()
+        metrics.read_sessions.inc("replica")
+        return healthy[next(self._turn) % len(healthy)].session()
+
+    async def check_replicas(self) -> None:
+        await asyncio.gather(
+            *(
+                replica.check(settings.REPLICA_HEALTH_CHECK_TIMEOUT_SECONDS, settings.REPLICA_MAX_LAG_SECONDS)
+                for replica in self.replicas
+            )
+        )
+
+    async def run_health_checks(self) -> None:
+        while True:
+            await asyncio.sleep(settings.REPLICA_HEALTH_CHECK_SECONDS)
+            await self.check_replicas()
+
+    async def warm_up(self, connections: int, read_calls: list, write_calls: list) -> None:
+        # more sessions than the pool can hold would wait for each other until the pool timeout
+        connections = min(connections, settings.DB_POOL_SIZE)
+        await asyncio.gather(
+            warm_up(self.primary_session, connections, read_calls + write_calls),
+            *(warm_up(replica.session, connections, read_calls) for replica in self.replicas),
+        )
+
+    async def dispose(self) -> None:
+        await asyncio.gather(self.primary.dispose(), *(replica.engine.dispose() for replica in self.replicas))
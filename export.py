@@ -0,0 +1,48 @@
+##################################
+# BLOCK FOR STREAMED BULK OUTPUT #
+##################################
+
+
+import csv
+import io
+from typing import AsyncIterator
+
+import orjson
+
+
+EXPORT_COLUMNS = (
+    "ra_id", "date", "user_id", "email", "name", "surname", "achievement_id", "achievement_name", "points",
+)
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _values(row) -> list:
+    return [value if isinstance(value, (int, str)) else str(value) for value in row]
+
+
+def format_ndjson(rows: list) -> bytes:
+    # orjson writes UUIDs and dates itself
+    return b"".join(
+        orjson.dumps(dict(zip(EXPORT_COLUMNS, row)), default=str, option=orjson.OPT_APPEND_NEWLINE) for row in rows
+    )
+
+
+def format_csv(rows: list) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(_values(row) for row in rows)
+    return buffer.getvalue().encode()
+
+
+async def iter_export(partitions: AsyncIterator[list], export_format: str) -> AsyncIterator[bytes]:
+    """Encodes every partition of rows into one chunk of the response body"""
+    if export_format == "csv":
+        yield (",".join(EXPORT_COLUMNS) + "\n").encode()
+        formatter = format_csv
+    else:
+        formatter = format_ndjson
+    async for rows in partitions:
+        yield formatter(rows)
@@ -0,0 +1,230 @@
+#################################
+# BLOCK FOR STREAMED BULK INPUT #
+#################################
+
+
+import csv
+import time
+import uuid
+from typing import AsyncIterator, List, Tuple, Type, Union
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+
+import settings
+from api_models import ReceivedAchievementCreate, UserCreate
+from dals import ReceivedAchievementsDAL, UserDAL
+
+
+async def iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """Splits a byte stream into numbered non-empty lines keeping only one line in memory"""
+    buffer = b""
+    line_no = 0
+    async for chunk in stream:
+        buffer += chunk
+        if b"\n" in chunk:
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                line_no += 1
+                if line.strip():
+                    yield line_no, line
+        # the unfinished line may come after the last newline of the chunk as well
+        if len(buffer) > settings.BULK_MAX_LINE_BYTES:
+            raise HTTPException(status_code=413, detail=f"Line {line_no + 1} is too long")
+    if buffer.strip():
+        yield line_no + 1, buffer
+
+
+async def iter_csv_records(lines: AsyncIterator[Tuple[int, bytes]]) -> AsyncIterator[Tuple[int, Union[bytes, Exception]]]:
+    """Joins the lines of a quoted field holding newlines, numbered by the first line.
+
+    A record goes on while it has an odd number of quotes, escaped quotes are
+    doubled and keep the count even. iter_lines drops blank lines, those
+    inside a field are put back empty.
+    """
+    record, first_no, last_no = None, 0, 0
+    async for line_no, line in lines:
+        if record is None:
+            record, first_no = line, line_no
+        else:
+            record += b"\n" * (line_no - last_no) + line
+        last_no = line_no
+        if record.count(b'"') % 2:
+            if len(record) > settings.BULK_MAX_LINE_BYTES:
+                raise HTTPException(status_code=413, detail=f"Line {first_no} is too long")
+            continue
+        yield first_no, record
+        record = None
+    if record is not None:
+        yield first_no, ValueError("Quoted field is not closed")
+
+
+async def iter_csv_rows(lines: AsyncIterator[Tuple[int, bytes]]) -> AsyncIterator[Tuple[int, Union[dict, Exception]]]:
+    """Turns CSV records into dicts using the first one as the header"""
+    header = None
+    async for line_no, line in iter_csv_records(lines):
+        if isinstance(line, Exception):
+            if header is None:
+                raise HTTPException(status_code=400, detail=f"Line {line_no}: {line}")
+            yield line_no, line
+            continue
+        try:
+            values = next(csv.reader([line.decode()]))
+        except UnicodeDecodeError as error:
+            if header is None:
+                raise HTTPException(status_code=400, detail=f"Line {line_no}: the header is not valid UTF-8")
+            yield line_no, ValueError(f"Not valid UTF-8 at byte {error.start}")
+            continue
+        except csv.Error as error:
+            if header is None:
+                raise HTTPException(status_code=400, detail=f"Line {line_no}: {error}")
+            yield line_no, ValueError(str(error))
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield line_no, ValueError(f"Expected {len(header)} columns, got {len(values)}")
+        else:
+            yield line_no, dict(zip(header, values))
+
+
+def iter_records(stream: AsyncIterator[bytes], content_type: str):
+    """Numbered records of an NDJSON (default) or CSV upload"""
+    lines = iter_lines(stream)
+    if content_type.startswith("text/csv"):
+        return iter_csv_rows(lines)
+    return lines
+
+
+async def iter_chunks(lines: AsyncIterator[Tuple[int, bytes]], size: int) -> AsyncIterator[List[Tuple[int, bytes]]]:
+    chunk = []
+    async for line in lines:
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def describe_error(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in item['loc']) or 'body'}: {item['msg']}" for item in error.errors()
+        )
+    if isinstance(error, HTTPException):
+        return str(error.detail)
+    return str(error)
+
+
+def parse_records(chunk: List[Tuple[int, Union[bytes, dict, Exception]]], model: Type[BaseModel]):
+    """Validates every record of the chunk, returns ([(line_no, record)], [(line_no, error)])"""
+    records, errors = [], []
+    for line_no, payload in chunk:
+        try:
+            if isinstance(payload, Exception):
+                raise payload
+            if isinstance(payload, bytes):
+                records.append((line_no, model.model_validate_json(payload)))
+            else:
+                records.append((line_no, model.model_validate(payload)))
+        except (ValidationError, HTTPException, ValueError) as error:
+            errors.append((line_no, describe_error(error)))
+    return records, errors
+
+
+class BulkReport:
+    """Counts accepted and rejected lines, keeps a bounded list of errors"""
+
+    def __init__(self, max_errors: int = settings.BULK_MAX_REPORTED_ERRORS):
+        self.max_errors = max_errors
+        self.accepted = 0
+        self.rejected = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    def reject(self, line_no: int, detail: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line_no, "detail": detail})
+
+    def reject_all(self, records: list, detail: str) -> None:
+        for line_no, _ in records:
+            self.reject(line_no, detail)
+
+    def as_dict(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        processed = self.accepted + self.rejected
+        return {
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(processed / elapsed, 1) if elapsed else 0.0,
+            "errors": self.errors,
+        }
+
+
+async def import_awards(session_factory, records: AsyncIterator, report: BulkReport, chunk_size: int) -> BulkReport:
+    async for chunk in iter_chunks(records, chunk_size):
+        awards, errors = parse_records(chunk, ReceivedAchievementCreate)
+        for line_no, detail in errors:
+            report.reject(line_no, detail)
+        if not awards:
+            continue
+
+        try:
+            async with session_factory() as session:
+                async with session.begin():
+                    received_achievement_dal = ReceivedAchievementsDAL(session)
+                    results = await received_achievement_dal.create_received_achievements_bulk(
+                        [(award.email, award.achievement_name, award.date) for _, award in awards]
+                    )
+        except SQLAlchemyError as error:
+            report.reject_all(awards, f"Chunk was not saved: {error.__class__.__name__}")
+            continue
+
+        for (line_no, _), result in zip(awards, results):
+            if isinstance(result, str):
+                report.reject(line_no, result)
+            else:
+                report.accepted += 1
+    return report
+
+
+async def import_users(session_factory, records: AsyncIterator, report: BulkReport, chunk_size: int) -> BulkReport:
+    async for chunk in iter_chunks(records, chunk_size):
+        users, errors = parse_records(chunk, UserCreate)
+        for line_no, detail in errors:
+            report.reject(line_no, detail)
+
+        unique_users = {}
+        for line_no, user in users:
+            if user.email in unique_users:
+                report.reject(line_no, f"Duplicate email '{user.email}' in the upload")
+            else:
+                unique_users[user.email] = (line_no, user)
+        if not unique_users:
+            continue
+
+        try:
+            async with session_factory() as session:
+                async with session.begin():
+                    user_dal = UserDAL(session)
+                    inserted = await user_dal.create_users_bulk(
+                        [
+                            (uuid.uuid4(), user.name, user.surname, user.email, user.language)
+                            for _, user in unique_users.values()
+                        ]
+                    )
+        except SQLAlchemyError as error:
+            report.reject_all(list(unique_users.values()), f"Chunk was not saved: {error.__class__.__name__}")
+            continue
+
+        for email, (line_no, _) in unique_users.items():
+            if email in inserted:
+                report.accepted += 1
+            else:
+                report.reject(line_no, f"User with email '{email}' already exists")
+    return report
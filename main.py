@@ -1,26 +1,119 @@
-from fastapi import FastAPI, APIRouter
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, APIRouter, Header, Query, Request, Response
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+import asyncio
 import uvicorn
-from sqlalchemy.ext.asyncio import create_async_engine
-from sqlalchemy.orm import sessionmaker
 
 import settings  # Импортируем настройки
 from dals import *
 from api_models import *
+from ingest import BulkReport, import_awards, import_users, iter_lines, iter_records
+from export import EXPORT_MEDIA_TYPES, iter_export
+from rank_index import rank_index
+from caches import AWARDS_TAG, USERS_TAG, achievement_catalog, recent_award_writers, response_cache, user_cache
+from singleflight import coalesced
+import metrics
+from engines import EngineRouter
+from slow_queries import slow_query_log
+from write_behind import AwardWriteQueue
 
 
-# create instance of the app
-app = FastAPI(title="server-achievements")
-
 ##############################################
 # BLOCK FOR COMMON INTERACTION WITH DATABASE #
 ##############################################
 
 
-# create async engine for interaction with database
-engine = create_async_engine(settings.REAL_DATABASE_URL, future=True, echo=True)
+# create async engines for interaction with the primary database and its replicas
+engine_router = EngineRouter(settings.REAL_DATABASE_URL, settings.REPLICA_DATABASE_URLS)
+engine = engine_router.primary
+
+# create session for the interaction with database, every write goes through it
+async_session = engine_router.primary_session
+
+# sessions of read-only routes, served by a replica when there is a healthy one
+read_session = engine_router.read_session
+
+# single awards are batched by the queue when AWARD_WRITE_BEHIND is on
+award_queue = AwardWriteQueue(
+    async_session,
+    max_size=settings.AWARD_QUEUE_MAX_SIZE,
+    batch_size=settings.AWARD_QUEUE_BATCH_SIZE,
+    flush_ms=settings.AWARD_QUEUE_FLUSH_MS,
+    put_timeout_ms=settings.AWARD_QUEUE_PUT_TIMEOUT_MS,
+)
+
+
+# no user has this email, the warm-up calls find nothing and write nothing
+WARMUP_EMAIL = "warm-up@example.invalid"
+
+def warmup_call(call):
+    """Forgets the warm-up email first, a negative user cache entry would answer without any statement"""
+
+    async def run(session):
+        user_cache.invalidate(WARMUP_EMAIL)
+        return await call(session)
+
+    return run
+
+
+# hot statements prepared on every connection opened on startup
+WARMUP_READ_CALLS = [
+    warmup_call(lambda session: UserDAL(session).get_user(WARMUP_EMAIL)),
+    lambda session: UserDAL(session).get_user_with_most_achievements(),
+    lambda session: UserDAL(session).get_user_with_most_achievement_points(),
+    lambda session: UserStatsDAL(session).get_leaderboard_page(50),
+    warmup_call(lambda session: ReceivedAchievementsDAL(session).get_received_achievements_by_email(WARMUP_EMAIL, 100)),
+]
+
+
+def warmup_write_calls() -> list:
+    achievements = achievement_catalog.all()
+    if not achievements:
+        return []
+    return [
+        warmup_call(
+            lambda session: ReceivedAchievementsDAL(session).create_received_achievement(
+                WARMUP_EMAIL, achievements[0].name, date.today()
+            )
+        ),
+    ]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # load the achievements catalog before the first request
+    async with async_session() as session:
+        await AchievementDAL(session).get_all_achievements()
+    await engine_router.check_replicas()
+    await engine_router.warm_up(settings.DB_WARMUP_CONNECTIONS, WARMUP_READ_CALLS, warmup_write_calls())
+    health_checks = asyncio.create_task(engine_router.run_health_checks())
+    if settings.AWARD_WRITE_BEHIND:
+        award_queue.start()
+    yield
+    if settings.AWARD_WRITE_BEHIND:
+        # queued awards are written before the engines are closed
+        await award_queue.drain()
+    health_checks.cancel()
+    await engine_router.dispose()
+
+
+# create instance of the app
+app = FastAPI(title="server-achievements", lifespan=lifespan, default_response_class=ORJSONResponse)
+app.add_middleware(metrics.MetricsMiddleware)
+
 
-# create session for the interaction with database
-async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics() -> Response:
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/slow-queries", include_in_schema=False)
+async def get_slow_queries() -> dict:
+    return {
+        "threshold_ms": settings.SLOW_QUERY_THRESHOLD_MS,
+        "size": slow_query_log.size,
+        "entries": slow_query_log.entries(),
+    }
 
 
 #########################
@@ -31,6 +124,11 @@ async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession
 user_router = APIRouter()
 achievement_router = APIRouter()
 received_achievement_router = APIRouter()
+leaderboard_router = APIRouter()
+stats_router = APIRouter()
+
+# analytics responses change with every written user or award
+ANALYTICS_TAGS = (USERS_TAG, AWARDS_TAG)
 
 
 async def _create_new_user(body: UserCreate) -> ShowUser:
@@ -57,24 +155,37 @@ async def create_user(body: UserCreate) -> ShowUser:
     return await _create_new_user(body)
 
 
+@user_router.post(
+    "/bulk",
+    response_model=BulkResult,
+    openapi_extra={
+        "requestBody": {
+            "content": {
+                "application/x-ndjson": {"schema": {"type": "string"}},
+                "text/csv": {"schema": {"type": "string"}},
+            }
+        }
+    },
+)
+async def create_users_bulk(request: Request):
+    """Accepts UserCreate records as NDJSON or CSV with a header line"""
+    records = iter_records(request.stream(), request.headers.get("content-type", ""))
+    report = await import_users(async_session, records, BulkReport(), settings.BULK_CHUNK_SIZE)
+    return report.as_dict()
+
+
 @user_router.get("/", response_model=ShowUser)
 async def get_user(email: str):
     async with async_session() as session:
         async with session.begin():
             user_dal = UserDAL(session)
-            user = await user_dal.get_user(email)
-            return ShowUser(
-                user_id=user.user_id,
-                name=user.name,
-                surname=user.surname,
-                email=user.email,
-                language=user.language,
-            )
+            return await user_dal.get_user(email)
 
 
 @user_router.get("/most-achievements", response_model=ShowUserWithAchievementsCount)
+@response_cache.cached("user.most_achievements", settings.ANALYTICS_CACHE_TTL_SECONDS, ANALYTICS_TAGS)
 async def get_user_with_most_achievements():
-    async with async_session() as session:
+    async with read_session() as session:
         async with session.begin():
             user_dal = UserDAL(session)
             user, achievements_count = await user_dal.get_user_with_most_achievements()
@@ -89,8 +200,9 @@ async def get_user_with_most_achievements():
 
 
 @user_router.get("/most-achievement-points", response_model=ShowUserWithAchievementPoints)
+@response_cache.cached("user.most_achievement_points", settings.ANALYTICS_CACHE_TTL_SECONDS, ANALYTICS_TAGS)
 async def get_user_with_most_achievement_points():
-    async with async_session() as session:
+    async with read_session() as session:
         async with session.begin():
             user_dal = UserDAL(session)
             user, total_points = await user_dal.get_user_with_most_achievement_points()
@@ -105,27 +217,54 @@ async def get_user_with_most_achievement_points():
 
 
 @user_router.get("/max-point-difference", response_model=UsersWithPointDifference)
+@response_cache.cached("user.max_point_difference", settings.ANALYTICS_CACHE_TTL_SECONDS, ANALYTICS_TAGS)
 async def get_users_with_max_point_difference():
-    async with async_session() as session:
+    async with read_session() as session:
         async with session.begin():
-            received_achievement_dal = ReceivedAchievementsDAL(session)
-            return await received_achievement_dal.get_users_with_max_point_difference_details()
+            user_dal = UserDAL(session)
+            pairs = await user_dal.get_users_with_max_point_difference()
+            return pairs[0]
+
+
+@user_router.get("/max-point-difference/top", response_model=List[UsersWithPointDifference])
+@response_cache.cached("user.max_point_difference_top", settings.ANALYTICS_CACHE_TTL_SECONDS, ANALYTICS_TAGS)
+async def get_users_with_top_max_point_difference(k: int = Query(default=10, ge=1, le=100)):
+    async with read_session() as session:
+        async with session.begin():
+            user_dal = UserDAL(session)
+            return await user_dal.get_users_with_max_point_difference(top_k=k)
 
 
 @user_router.get("/min-point-difference", response_model=UsersWithPointDifference)
+@response_cache.cached("user.min_point_difference", settings.ANALYTICS_CACHE_TTL_SECONDS, ANALYTICS_TAGS)
 async def get_users_with_min_point_difference():
-    async with async_session() as session:
+    async with read_session() as session:
         async with session.begin():
-            received_achievement_dal = ReceivedAchievementsDAL(session)
-            return await received_achievement_dal.get_users_with_min_point_difference_details()
+            user_dal = UserDAL(session)
+            pairs = await user_dal.get_users_with_min_point_difference()
+            return pairs[0]
+
+
+@user_router.get("/min-point-difference/top", response_model=List[UsersWithPointDifference])
+@response_cache.cached("user.min_point_difference_top", settings.ANALYTICS_CACHE_TTL_SECONDS, ANALYTICS_TAGS)
+async def get_users_with_top_min_point_difference(k: int = Query(default=10, ge=1, le=100)):
+    async with read_session() as session:
+        async with session.begin():
+            user_dal = UserDAL(session)
+            return await user_dal.get_users_with_min_point_difference(top_k=k)
 
 
 @user_router.get("/achievements-seven-consecutive-days", response_model=List[ShowUserWithAchievementsConsecutiveDays])
 async def get_users_with_achievements_for_seven_consecutive_days():
-    async with async_session() as session:
+    return await get_users_with_achievements_for_consecutive_days(n_days=7)
+
+
+@user_router.get("/achievements-consecutive-days", response_model=List[ShowUserWithAchievementsConsecutiveDays])
+@response_cache.cached("user.consecutive_days", settings.STREAKS_CACHE_TTL_SECONDS, ANALYTICS_TAGS)
+async def get_users_with_achievements_for_consecutive_days(n_days: int = Query(default=7, ge=1)):
+    async with read_session() as session:
         async with session.begin():
             user_dal = UserDAL(session)
-            users = await user_dal.get_users_with_achievements_for_seven_consecutive_days()
             return [
                 ShowUserWithAchievementsConsecutiveDays(
                     user_id=user_data["user"].user_id,
@@ -138,18 +277,47 @@ async def get_users_with_achievements_for_seven_consecutive_days():
                         for achievement in user_data["achievements"]
                     ]
                 )
-                for user_data in users
+                async for user_data in user_dal.get_users_with_achievements_for_consecutive_days(n_days)
             ]
 
 
+@user_router.get("/{email}/rank", response_model=ShowUserRank)
+async def get_user_rank(email: str):
+    async with read_session(sticky_key=email) as session:
+        async with session.begin():
+            user_dal = UserDAL(session)
+            user = await user_dal.get_user(email)
+            await rank_index.ensure_fresh(UserStatsDAL(session).get_all_totals)
+
+    total_points = rank_index.get_points(user.user_id) or 0
+    return ShowUserRank(
+        user_id=user.user_id,
+        email=user.email,
+        total_points=total_points,
+        rank=rank_index.rank(total_points),
+        percentile=rank_index.percentile(total_points),
+        ranked_users=len(rank_index),
+    )
+
+
 # Achievement Routes
 @achievement_router.get("/", response_model=list[ShowAchievement])
 async def get_all_achievements():
     async with async_session() as session:
         async with session.begin():
             achievement_dal = AchievementDAL(session)
-            achievements = await achievement_dal.get_all_achievements()
-            return achievements
+            await achievement_dal.get_all_achievements()
+    # the catalog keeps its encoded form, nothing is built per request
+    return Response(content=achievement_catalog.as_json(), media_type="application/json")
+
+
+@achievement_router.get("/rarest", response_model=list[ShowAchievement])
+async def get_rarest_achievements(limit: int = Query(default=10, ge=1, le=100)):
+    """Achievements held by the fewest users, served from the catalog"""
+    async with async_session() as session:
+        async with session.begin():
+            achievement_dal = AchievementDAL(session)
+            return await achievement_dal.get_rarest_achievements(limit)
 
 
 @achievement_router.post("/", response_model=ShowAchievement)
@@ -167,64 +335,227 @@ async def create_achievement(body: AchievementCreate):
 
 
 # Received Achievements Routes
-@received_achievement_router.post("/", response_model=ShowReceivedAchievement)
-async def create_received_achievement(body: ReceivedAchievementCreate):
+@received_achievement_router.post(
+    "/",
+    response_model=ShowReceivedAchievement,
+    responses={202: {"model": QueuedAward, "description": "Queued, sent with Prefer: respond-async"}},
+)
+async def create_received_achievement(body: ReceivedAchievementCreate, prefer: Optional[str] = Header(default=None)):
+    if settings.AWARD_WRITE_BEHIND:
+        return await _queue_received_achievement(body, respond_async=prefer == "respond-async")
+
     async with async_session() as session:
         async with session.begin():
             received_achievement_dal = ReceivedAchievementsDAL(session)
-            received_achievement = await received_achievement_dal.create_received_achievement(
+            award = await received_achievement_dal.create_received_achievement(
                 email=body.email,
-                achievement_name=body.achievement_name,  # Предполагается, что здесь body.name - это имя достижения
+                achievement_name=body.achievement_name,
                 date=body.date,
             )
-
-        async with async_session() as new_session:
-            async with new_session.begin():
-                user_dal = UserDAL(new_session)
-                user = await user_dal.get_user(body.email)
-
-                achievement_dal = AchievementDAL(new_session)
-                achievement = await achievement_dal.get_achievement_by_name(body.achievement_name)
-
             return ShowReceivedAchievement(
-                ra_id=received_achievement.ra_id,
-                date=received_achievement.date,
-                name=user.name,
-                surname=user.surname,
-                points=achievement.points,
-                description=achievement.ru_description if user.language == "ru" else achievement.en_description,
+                ra_id=award.ra_id,
+                date=award.date,
+                name=award.name,
+                surname=award.surname,
+                points=award.points,
+                description=award.description,
             )
 
 
+async def _queue_received_achievement(body: ReceivedAchievementCreate, respond_async: bool):
+    ra_id, written = await award_queue.submit(body.email, body.achievement_name, body.date)
+    if respond_async:
+        # nobody awaits the write, its errors are only logged by the queue
+        written.add_done_callback(lambda future: future.cancelled() or future.exception())
+        return JSONResponse(status_code=202, content=QueuedAward(ra_id=ra_id).model_dump(mode="json"))
+    return ShowReceivedAchievement(**await written)
+
+
+@received_achievement_router.post(
+    "/bulk",
+    response_model=BulkResult,
+    openapi_extra={"requestBody": {"content": {"application/x-ndjson": {"schema": {"type": "string"}}}}},
+)
+async def create_received_achievements_bulk(request: Request):
+    """Accepts NDJSON lines of ReceivedAchievementCreate, every chunk is written in its own transaction"""
+    report = await import_awards(async_session, iter_lines(request.stream()), BulkReport(), settings.BULK_CHUNK_SIZE)
+    return report.as_dict()
+
+
+@received_achievement_router.get(
+    "/export",
+    response_class=StreamingResponse,
+    responses={200: {"content": {media_type: {} for media_type in EXPORT_MEDIA_TYPES.values()}}},
+)
+async def export_received_achievements(
+        export_format: str = Query(default="ndjson", alias="format", pattern="^(ndjson|csv)$"),
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+):
+    """Streams every award with its user and achievement as NDJSON or CSV"""
+
+    async def body():
+        # the session lives as long as the response is streamed
+        async with read_session() as session:
+            async with session.begin():
+                received_achievement_dal = ReceivedAchievementsDAL(session)
+                partitions = received_achievement_dal.stream_received_achievements(
+                    settings.EXPORT_FETCH_SIZE, date_from, date_to,
+                )
+                async for chunk in iter_export(partitions, export_format):
+                    yield chunk
+
+    return StreamingResponse(
+        body(),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="received-achievements.{export_format}"'},
+    )
+
+
+@received_achievement_router.post("/batch", response_model=ReceivedAchievementsBatch)
+async def get_users_achievements_batch(
+        body: ReceivedAchievementsBatchRequest,
+        limit: int = Query(default=100, ge=1, le=1000),
+):
+    """First limit achievements and the total points of every user, unknown emails are listed in not_found"""
+    emails = list(dict.fromkeys(body.emails))
+    if len(emails) > settings.RECEIVED_ACHIEVEMENTS_BATCH_MAX_EMAILS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {settings.RECEIVED_ACHIEVEMENTS_BATCH_MAX_EMAILS} emails are accepted in one batch",
+        )
+
+    # one recently awarded user sends the whole batch to the primary
+    sticky_key = next((email for email in emails if email in recent_award_writers), None)
+    async with read_session(sticky_key=sticky_key) as session:
+        async with session.begin():
+            received_achievement_dal = ReceivedAchievementsDAL(session)
+            found = await received_achievement_dal.get_received_achievements_by_emails(emails, limit)
+
+    users = []
+    for email in emails:
+        if email not in found:
+            continue
+        user, total_points, rows = found[email]
+        users.append({
+            "email": email,
+            "user_id": user.user_id,
+            "total_points": total_points,
+            "achievements": [
+                {
+                    "ra_id": row.ra_id,
+                    "date": row.date,
+                    "name": user.name,
+                    "surname": user.surname,
+                    "points": row.points,
+                    "description": row.description,
+                }
+                for row in rows
+            ],
+        })
+    return ORJSONResponse({"users": users, "not_found": [email for email in emails if email not in found]})
+
+
 @received_achievement_router.get("/", response_model=list[ShowReceivedAchievement])
-async def get_user_achievements(email: str):
-    async with async_session() as session:
+async def get_user_achievements(
+        email: str,
+        limit: int = Query(default=100, ge=1, le=1000),
+        cursor: Optional[str] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+):
+    after_date = after_ra_id = None
+    if cursor is not None:
+        after_date, after_ra_id = decode_cursor(cursor, 2)
+        try:
+            after_date, after_ra_id = date.fromisoformat(after_date), uuid.UUID(after_ra_id)
+        except ValueError:
+            raise HTTPException(status_code=422, detail="Invalid cursor")
+
+    async with read_session(sticky_key=email) as session:
         async with session.begin():
             received_achievement_dal = ReceivedAchievementsDAL(session)
-            user_dal = UserDAL(session)
-            achievement_dal = AchievementDAL(session)
+            rows = await received_achievement_dal.get_received_achievements_by_email(
+                email, limit, after_date, after_ra_id, date_from, date_to,
+            )
 
-            # Получаем пользователя
-            user = await user_dal.get_user(email)
+    # rows already have the fields of ShowReceivedAchievement, they are encoded without building models
+    response = ORJSONResponse([row._asdict() for row in rows])
+    # следующая страница передаётся в заголовке, чтобы не менять формат ответа
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].date.isoformat(), rows[-1].ra_id)
+    return response
 
-            # Получаем список полученных достижений пользователя
-            received_achievements = await received_achievement_dal.get_received_achievements_by_email(email)
-
-            # Собираем данные для каждого достижения
-            user_achievements = []
-            for ra in received_achievements:
-                achievement = await achievement_dal.get_achievement_by_id(ra.achievement_id)
-                user_achievements.append(
-                    ShowReceivedAchievement(
-                        ra_id=ra.ra_id,
-                        date=ra.date,
-                        name=user.name,
-                        surname=user.surname,
-                        points=achievement.points,
-                        description=achievement.ru_description if user.language == "ru" else achievement.en_description,
-                    )
-                )
-            return user_achievements
+
+# Leaderboard Routes
+@coalesced("leaderboard.page")
+async def _get_leaderboard_page(limit: int, after_points: Optional[int], after_user_id: Optional[uuid.UUID]):
+    async with read_session() as session:
+        async with session.begin():
+            user_stats_dal = UserStatsDAL(session)
+            rows = await user_stats_dal.get_leaderboard_page(limit, after_points, after_user_id)
+            await rank_index.ensure_fresh(user_stats_dal.get_all_totals)
+
+    items = [
+        {
+            "rank": rank_index.rank(row.total_points),
+            "user_id": row.user_id,
+            "name": row.name,
+            "surname": row.surname,
+            "achievements_count": row.achievements_count,
+            "total_points": row.total_points,
+        }
+        for row in rows
+    ]
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = encode_cursor(rows[-1].total_points, rows[-1].user_id)
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@leaderboard_router.get("/", response_model=LeaderboardPage)
+async def get_leaderboard(limit: int = Query(default=50, ge=1, le=500), cursor: Optional[str] = None):
+    after_points = after_user_id = None
+    if cursor is not None:
+        after_points, after_user_id = decode_cursor(cursor, 2)
+        try:
+            after_points, after_user_id = int(after_points), uuid.UUID(after_user_id)
+        except ValueError:
+            raise HTTPException(status_code=422, detail="Invalid cursor")
+
+    # the page is shared by the coalesced requests, the response is not
+    page = await _get_leaderboard_page(limit=limit, after_points=after_points, after_user_id=after_user_id)
+    return ORJSONResponse(page)
+
+
+# Stats Routes
+@response_cache.cached("stats.timeseries", settings.ANALYTICS_CACHE_TTL_SECONDS, (AWARDS_TAG,))
+async def _get_awards_timeseries(date_from: date, date_to: date, bucket: str):
+    async with read_session() as session:
+        async with session.begin():
+            rollup_dal = AwardRollupDAL(session)
+            series = await rollup_dal.get_timeseries(date_from, date_to, bucket)
+    return [{"start": start, "awards": awards, "points": points} for start, awards, points in series]
+
+
+@stats_router.get("/timeseries", response_model=List[TimeseriesBucket])
+async def get_awards_timeseries(
+        date_from: Optional[date] = Query(default=None, alias="from"),
+        date_to: Optional[date] = Query(default=None, alias="to"),
+        bucket: str = Query(default="day", pattern=f"^({'|'.join(TIMESERIES_BUCKETS)})$"),
+):
+    """Awards and points per day, week or month, the last 365 days by default"""
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - timedelta(days=364)
+    if date_from > date_to:
+        raise HTTPException(status_code=422, detail="'from' is after 'to'")
+    if bucket_count(date_from, date_to, bucket) > settings.STATS_TIMESERIES_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"The range holds more than {settings.STATS_TIMESERIES_MAX_BUCKETS} buckets of a {bucket}",
+        )
+    # the resolved dates are a part of the cache key, a default range cached yesterday is not served today
+    return await _get_awards_timeseries(date_from=date_from, date_to=date_to, bucket=bucket)
 
 
 # create the instance for the routes
@@ -235,6 +566,8 @@ main_api_router.include_router(user_router, prefix="/user", tags=["user"])
 main_api_router.include_router(achievement_router, prefix="/achievement", tags=["achievement"])
 main_api_router.include_router(received_achievement_router, prefix="/received-achievement",
                                tags=["received-achievement"])
+main_api_router.include_router(leaderboard_router, prefix="/leaderboard", tags=["leaderboard"])
+main_api_router.include_router(stats_router, prefix="/stats", tags=["stats"])
 app.include_router(main_api_router)
 
 if __name__ == "__main__":
@@ -0,0 +1,295 @@
+##########################################
+# BLOCK FOR REQUEST AND DATABASE METRICS #
+##########################################
+
+
+import contextvars
+import time
+import weakref
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+
+class Histogram:
+    """Prometheus histogram with a fixed set of label names"""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # labels -> [counts per bucket + overflow, sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._series.items()):
+            pairs = [f'{name}="{escape(value)}"' for name, value in zip(self.label_names, labels)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                bucket_labels = ",".join(pairs + [f'le="{le}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = "{" + ",".join(pairs) + "}" if pairs else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return "\n".join(lines)
+
+
+class Counter:
+    """Prometheus counter with a fixed set of label names"""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            pairs = ",".join(f'{name}="{escape(label)}"' for name, label in zip(self.label_names, labels))
+            lines.append(f"{self.name}{{{pairs}}} {value}" if pairs else f"{self.name} {value}")
+        return "\n".join(lines)
+
+
+class Gauge:
+    """Prometheus gauge read at scrape time from the registered collectors"""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._collectors = []
+
+    def add_collector(self, collect: Callable[[], Iterable[Tuple[Tuple[str, ...], float]]]) -> None:
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for collect in self._collectors:
+            for labels, value in collect():
+                pairs = ",".join(f'{name}="{escape(label)}"' for name, label in zip(self.label_names, labels))
+                lines.append(f"{self.name}{{{pairs}}} {value}")
+        return "\n".join(lines)
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "Time to serve a request", ("method", "route", "status"), LATENCY_BUCKETS
+)
+request_statements = Histogram(
+    "http_request_db_statements", "SQL statements executed per request", ("method", "route"), STATEMENT_BUCKETS
+)
+request_db_time = Histogram(
+    "http_request_db_seconds", "Time spent executing SQL per request", ("method", "route"), LATENCY_BUCKETS
+)
+request_pool_wait = Histogram(
+    "http_request_db_pool_wait_seconds", "Time spent waiting for a pooled connection per request",
+    ("method", "route"), LATENCY_BUCKETS,
+)
+pool_wait = Histogram("db_pool_wait_seconds", "Time to check out a pooled connection", (), LATENCY_BUCKETS)
+singleflight_calls = Counter(
+    "singleflight_calls_total", "Calls which started a computation, joined one or cancelled it", ("name", "result")
+)
+award_queue_batch_size = Histogram(
+    "award_queue_batch_size", "Awards written by one write-behind transaction", (), (1, 5, 10, 50, 100, 250, 500, 1000)
+)
+award_queue_rejected = Counter("award_queue_rejected_total", "Awards rejected because the queue was full", ())
+pool_connections = Gauge(
+    "db_pool_connections", "Connections of an engine's pool: size, checked_out, idle and overflow", ("engine", "state")
+)
+read_sessions = Counter("db_read_sessions_total", "Read-only sessions by the engine they were sent to", ("target",))
+user_cache_lookups = Counter(
+    "user_cache_lookups_total", "User lookups by email or id: hit, negative_hit or miss", ("key", "result")
+)
+
+REGISTRY = (
+    request_duration, request_statements, request_db_time, request_pool_wait, pool_wait, singleflight_calls,
+    read_sessions, award_queue_batch_size, award_queue_rejected, pool_connections, user_cache_lookups,
+)
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+class RequestStats:
+    """Database work done while serving one request"""
+
+    __slots__ = ("statements", "db_seconds", "pool_wait_seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+
+
+# sqlalchemy runs the driver in a greenlet which shares the context of the caller,
+# so the hooks below see the stats of the request that issued the statement
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "current_request", default=None
+)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Pool that measures how long a checkout waits for a free connection"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            pool_wait.observe(waited)
+            stats = current_request.get()
+            if stats is not None:
+                stats.pool_wait_seconds += waited
+
+
+# listeners of the finished statements by the sync engine they were sent through
+_statement_listeners: "weakref.WeakKeyDictionary[object, list]" = weakref.WeakKeyDictionary()
+
+
+def on_statement(engine, listener: Callable) -> None:
+    """Calls listener(conn, statement, parameters, executemany, elapsed, error) after every statement of the async engine.
+
+    A statement is timed once for all the listeners. A connection runs one
+    statement at a time, so one start time is kept in conn.info; a failed
+    statement, for which after_cursor_execute is not called, is finished by
+    handle_error with the class name of its exception as error.
+    """
+    sync_engine = engine.sync_engine
+    listeners = _statement_listeners.get(sync_engine)
+    if listeners is None:
+        listeners = _statement_listeners[sync_engine] = []
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(sync_engine, "handle_error", _handle_error)
+    listeners.append(listener)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["statement_started"] = time.perf_counter()
+
+
+def _finish_statement(conn, statement: str, parameters, executemany: bool, error: Optional[str] = None) -> None:
+    started = conn.info.pop("statement_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    for listener in _statement_listeners.get(conn.engine, ()):
+        listener(conn, statement, parameters, executemany, elapsed, error)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _finish_statement(conn, statement, parameters, executemany)
+
+
+def _handle_error(exception_context):
+    if exception_context.connection is None:
+        return
+    context = exception_context.execution_context
+    _finish_statement(
+        exception_context.connection,
+        exception_context.statement,
+        exception_context.parameters,
+        context is not None and context.executemany,
+        error=exception_context.original_exception.__class__.__name__,
+    )
+
+
+def _count_statement(conn, statement, parameters, executemany, elapsed: float, error) -> None:
+    stats = current_request.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_seconds += elapsed
+
+
+def instrument_engine(engine, name: str) -> None:
+    """Counts statements and their time of the given async engine and reports its pool"""
+    on_statement(engine, _count_statement)
+
+    def collect_pool():
+        pool = engine.pool
+        yield (name, "size"), pool.size()
+        yield (name, "checked_out"), pool.checkedout()
+        yield (name, "idle"), pool.checkedin()
+        yield (name, "overflow"), max(pool.overflow(), 0)
+
+    pool_connections.add_collector(collect_pool)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and database work per route.
+
+    The route label is the path template ("/user/{email}/rank"), so the
+    number of series does not grow with the number of users. The request is
+    finished when the last body chunk is sent, streamed responses included.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        status = 500
+        recorded = False
+
+        def finish():
+            nonlocal recorded
+            if not recorded:
+                recorded = True
+                record(scope, status, time.perf_counter() - started, stats)
+
+        async def send_and_record(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            finish()
+            current_request.reset(token)
+
+
+def record(scope, status: int, elapsed: float, stats: RequestStats) -> None:
+    route = scope.get("route")
+    # unmatched paths are grouped, otherwise every 404 would create a series
+    path = getattr(route, "path", "<unmatched>")
+    method = scope["method"]
+    request_duration.observe(elapsed, method, path, str(status))
+    request_statements.observe(stats.statements, method, path)
+    request_db_time.observe(stats.db_seconds, method, path)
+    request_pool_wait.observe(stats.pool_wait_seconds, method, path)
@@ -17,9 +17,27 @@ if config.config_file_name is not None:
 # add your model's MetaData object here
 # for 'autogenerate' support
 from main import Base
+from tools.partitions import DEFAULT_PARTITION, PARTITION_NAME
 target_metadata = Base.metadata
 # target_metadata = None
 
+
+def is_partition(name) -> bool:
+    return name == DEFAULT_PARTITION or PARTITION_NAME.match(name or "") is not None
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Skips the partitions of received_achievements and their indexes.
+
+    They are created and detached by tools.partitions and have no models, so
+    autogenerate would otherwise drop them.
+    """
+    if type_ == "table" and reflected and is_partition(name):
+        return False
+    if type_ in ("index", "unique_constraint", "foreign_key_constraint") and reflected:
+        return not is_partition(object.table.name)
+    return True
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -44,6 +62,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -65,7 +84,7 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata, include_object=include_object
         )
 
         with context.begin_transaction():
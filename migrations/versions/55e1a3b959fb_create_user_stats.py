@@ -0,0 +1,49 @@
+"""create user_stats
+
+Revision ID: 55e1a3b959fb
+Revises: 47feb3a72520
+Create Date: 2026-10-17 09:12:40.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '55e1a3b959fb'
+down_revision: Union[str, None] = '47feb3a72520'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('user_stats',
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('achievements_count', sa.Integer(), nullable=False),
+    sa.Column('total_points', sa.BigInteger(), nullable=False),
+    sa.Column('last_award_date', sa.Date(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_index('ix_user_stats_total_points', 'user_stats', [sa.text('total_points DESC'), 'user_id'])
+    op.create_index('ix_user_stats_achievements_count', 'user_stats', [sa.text('achievements_count DESC'), 'user_id'])
+
+    # backfill from the existing awards
+    op.execute(
+        """
+        INSERT INTO user_stats (user_id, achievements_count, total_points, last_award_date)
+        SELECT ra.user_id, count(ra.ra_id), sum(a.points), max(ra.date)
+        FROM received_achievements ra
+        JOIN achievements a ON a.achievement_id = ra.achievement_id
+        WHERE ra.user_id IS NOT NULL
+        GROUP BY ra.user_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_stats_achievements_count', table_name='user_stats')
+    op.drop_index('ix_user_stats_total_points', table_name='user_stats')
+    op.drop_table('user_stats')
@@ -0,0 +1,57 @@
+"""add user streaks
+
+Revision ID: 9c41d2e7f0a3
+Revises: 55e1a3b959fb
+Create Date: 2026-10-17 11:03:27.551902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c41d2e7f0a3'
+down_revision: Union[str, None] = '55e1a3b959fb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('user_stats', sa.Column('current_streak', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('user_stats', sa.Column('longest_streak', sa.Integer(), server_default='0', nullable=False))
+
+    # backfill with gaps-and-islands: days of one run share (date - row_number)
+    op.execute(
+        """
+        WITH days AS (
+            SELECT DISTINCT user_id, date FROM received_achievements WHERE user_id IS NOT NULL
+        ), runs AS (
+            SELECT user_id, count(*) AS length, max(date) AS last_day
+            FROM (
+                SELECT user_id, date,
+                       date - (row_number() OVER (PARTITION BY user_id ORDER BY date))::int AS anchor
+                FROM days
+            ) islands
+            GROUP BY user_id, anchor
+        ), streaks AS (
+            SELECT user_id,
+                   max(length) AS longest_streak,
+                   (array_agg(length ORDER BY last_day DESC))[1] AS current_streak
+            FROM runs
+            GROUP BY user_id
+        )
+        UPDATE user_stats
+        SET longest_streak = streaks.longest_streak, current_streak = streaks.current_streak
+        FROM streaks
+        WHERE user_stats.user_id = streaks.user_id
+        """
+    )
+    op.create_index('ix_user_stats_longest_streak', 'user_stats', ['longest_streak'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_stats_longest_streak', table_name='user_stats')
+    op.drop_column('user_stats', 'longest_streak')
+    op.drop_column('user_stats', 'current_streak')
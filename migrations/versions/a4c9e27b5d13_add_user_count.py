@@ -0,0 +1,33 @@
+"""add user count
+
+Revision ID: a4c9e27b5d13
+Revises: f71a2d9c0e35
+Create Date: 2026-10-18 10:12:41.318205
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c9e27b5d13'
+down_revision: Union[str, None] = 'f71a2d9c0e35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'user_count',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('users', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    # writes must be stopped for the time of the backfill, like for the partitioning
+    op.execute("INSERT INTO user_count (id, users) SELECT 1, count(*) FROM users")
+
+
+def downgrade() -> None:
+    op.drop_table('user_count')
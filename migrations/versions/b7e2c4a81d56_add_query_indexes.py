@@ -0,0 +1,63 @@
+"""add query indexes
+
+Revision ID: b7e2c4a81d56
+Revises: 9c41d2e7f0a3
+Create Date: 2026-10-17 14:20:11.904731
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2c4a81d56'
+down_revision: Union[str, None] = '9c41d2e7f0a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # awards without a user or an achievement are not valid, fails if there are any
+    op.alter_column('received_achievements', 'user_id', existing_type=sa.UUID(), nullable=False)
+    op.alter_column('received_achievements', 'achievement_id', existing_type=sa.UUID(), nullable=False)
+
+    # CREATE INDEX CONCURRENTLY can not run inside a transaction
+    with op.get_context().autocommit_block():
+        # user's awards by date, keyset pages by (date, ra_id), streaks; achievement_id makes the join index-only
+        op.create_index(
+            'ix_received_achievements_user_id_date',
+            'received_achievements',
+            ['user_id', 'date', 'ra_id'],
+            postgresql_include=['achievement_id'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_received_achievements_achievement_id',
+            'received_achievements',
+            ['achievement_id'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # covering index for the points join
+        op.create_index(
+            'ix_achievements_achievement_id_points',
+            'achievements',
+            ['achievement_id'],
+            postgresql_include=['points'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_achievements_achievement_id_points', table_name='achievements', postgresql_concurrently=True)
+        op.drop_index('ix_received_achievements_achievement_id', table_name='received_achievements',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_received_achievements_user_id_date', table_name='received_achievements',
+                      postgresql_concurrently=True)
+    op.alter_column('received_achievements', 'achievement_id', existing_type=sa.UUID(), nullable=True)
+    op.alter_column('received_achievements', 'user_id', existing_type=sa.UUID(), nullable=True)
@@ -0,0 +1,122 @@
+"""partition received_achievements by month
+
+Revision ID: d3a9f61c2b84
+Revises: b7e2c4a81d56
+Create Date: 2026-10-17 16:05:42.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3a9f61c2b84'
+down_revision: Union[str, None] = 'b7e2c4a81d56'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# partitions created ahead of the current month, later ones come from tools.partitions
+MONTHS_AHEAD = 3
+
+
+def upgrade() -> None:
+    # the old table is copied into the partitioned one, writes must be stopped for the time of the migration
+    op.execute("ALTER TABLE received_achievements RENAME TO received_achievements_unpartitioned")
+    op.execute(
+        "ALTER TABLE received_achievements_unpartitioned "
+        "RENAME CONSTRAINT received_achievements_pkey TO received_achievements_unpartitioned_pkey"
+    )
+    op.drop_index('ix_received_achievements_user_id_date', table_name='received_achievements_unpartitioned')
+    op.drop_index('ix_received_achievements_achievement_id', table_name='received_achievements_unpartitioned')
+
+    # the partition key has to be a part of the primary key
+    op.create_table(
+        'received_achievements',
+        sa.Column('ra_id', sa.UUID(), nullable=False),
+        sa.Column('user_id', sa.UUID(), nullable=False),
+        sa.Column('achievement_id', sa.UUID(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.ForeignKeyConstraint(['achievement_id'], ['achievements.achievement_id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.user_id']),
+        sa.PrimaryKeyConstraint('ra_id', 'date'),
+        postgresql_partition_by='RANGE (date)',
+    )
+    # awards dated outside of the created months are not rejected
+    op.execute("CREATE TABLE received_achievements_default PARTITION OF received_achievements DEFAULT")
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            month date;
+        BEGIN
+            FOR month IN
+                SELECT generate_series(
+                    date_trunc('month', coalesce((SELECT min(date) FROM received_achievements_unpartitioned), current_date)),
+                    date_trunc('month', current_date) + interval '{MONTHS_AHEAD} months',
+                    interval '1 month'
+                )::date
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF received_achievements FOR VALUES FROM (%L) TO (%L)',
+                    'received_achievements_p' || to_char(month, 'YYYY_MM'),
+                    month,
+                    (month + interval '1 month')::date
+                );
+            END LOOP;
+        END $$
+        """
+    )
+    op.execute(
+        "INSERT INTO received_achievements (ra_id, user_id, achievement_id, date) "
+        "SELECT ra_id, user_id, achievement_id, date FROM received_achievements_unpartitioned"
+    )
+    op.drop_table('received_achievements_unpartitioned')
+
+    # indexes of the parent are created on every partition, now and for the partitions attached later
+    op.create_index(
+        'ix_received_achievements_user_id_date',
+        'received_achievements',
+        ['user_id', 'date', 'ra_id'],
+        postgresql_include=['achievement_id'],
+    )
+    op.create_index('ix_received_achievements_achievement_id', 'received_achievements', ['achievement_id'])
+    op.execute("ANALYZE received_achievements")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE received_achievements RENAME TO received_achievements_partitioned")
+    op.execute(
+        "ALTER TABLE received_achievements_partitioned "
+        "RENAME CONSTRAINT received_achievements_pkey TO received_achievements_partitioned_pkey"
+    )
+    op.drop_index('ix_received_achievements_user_id_date', table_name='received_achievements_partitioned')
+    op.drop_index('ix_received_achievements_achievement_id', table_name='received_achievements_partitioned')
+
+    op.create_table(
+        'received_achievements',
+        sa.Column('ra_id', sa.UUID(), nullable=False),
+        sa.Column('user_id', sa.UUID(), nullable=False),
+        sa.Column('achievement_id', sa.UUID(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.ForeignKeyConstraint(['achievement_id'], ['achievements.achievement_id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.user_id']),
+        sa.PrimaryKeyConstraint('ra_id'),
+    )
+    # detached partitions are not copied back
+    op.execute(
+        "INSERT INTO received_achievements (ra_id, user_id, achievement_id, date) "
+        "SELECT ra_id, user_id, achievement_id, date FROM received_achievements_partitioned"
+    )
+    # drops the partitions as well
+    op.drop_table('received_achievements_partitioned')
+
+    op.create_index(
+        'ix_received_achievements_user_id_date',
+        'received_achievements',
+        ['user_id', 'date', 'ra_id'],
+        postgresql_include=['achievement_id'],
+    )
+    op.create_index('ix_received_achievements_achievement_id', 'received_achievements', ['achievement_id'])
@@ -0,0 +1,45 @@
+"""add daily award rollup
+
+Revision ID: e5b18c7a4f92
+Revises: d3a9f61c2b84
+Create Date: 2026-10-17 18:21:09.604733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b18c7a4f92'
+down_revision: Union[str, None] = 'd3a9f61c2b84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'daily_award_rollup',
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('achievement_id', sa.UUID(), nullable=False),
+        sa.Column('awards', sa.Integer(), nullable=False),
+        sa.Column('points', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['achievement_id'], ['achievements.achievement_id']),
+        sa.PrimaryKeyConstraint('date', 'achievement_id'),
+    )
+    # awards written while the backfill runs are missed, tools.rollup rebuilds the affected days
+    op.execute(
+        """
+        INSERT INTO daily_award_rollup (date, achievement_id, awards, points)
+        SELECT ra.date, ra.achievement_id, count(*), sum(a.points)
+        FROM received_achievements ra
+        JOIN achievements a ON a.achievement_id = ra.achievement_id
+        GROUP BY ra.date, ra.achievement_id
+        """
+    )
+    op.execute("ANALYZE daily_award_rollup")
+
+
+def downgrade() -> None:
+    op.drop_table('daily_award_rollup')
@@ -0,0 +1,52 @@
+"""add achievement holders
+
+Revision ID: f71a2d9c0e35
+Revises: e5b18c7a4f92
+Create Date: 2026-10-17 19:47:52.130418
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f71a2d9c0e35'
+down_revision: Union[str, None] = 'e5b18c7a4f92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'achievement_holders',
+        sa.Column('achievement_id', sa.UUID(), nullable=False),
+        sa.Column('user_id', sa.UUID(), nullable=False),
+        sa.ForeignKeyConstraint(['achievement_id'], ['achievements.achievement_id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.user_id']),
+        sa.PrimaryKeyConstraint('achievement_id', 'user_id'),
+    )
+    op.create_table(
+        'achievement_stats',
+        sa.Column('achievement_id', sa.UUID(), nullable=False),
+        sa.Column('holders', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['achievement_id'], ['achievements.achievement_id']),
+        sa.PrimaryKeyConstraint('achievement_id'),
+    )
+    # writes must be stopped for the time of the backfill, like for the partitioning
+    op.execute(
+        "INSERT INTO achievement_holders (achievement_id, user_id) "
+        "SELECT DISTINCT achievement_id, user_id FROM received_achievements"
+    )
+    op.execute(
+        "INSERT INTO achievement_stats (achievement_id, holders) "
+        "SELECT achievement_id, count(*) FROM achievement_holders GROUP BY achievement_id"
+    )
+    op.execute("ANALYZE achievement_holders")
+    op.execute("ANALYZE achievement_stats")
+
+
+def downgrade() -> None:
+    op.drop_table('achievement_stats')
+    op.drop_table('achievement_holders')
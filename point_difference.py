@@ -0,0 +1,55 @@
+######################################
+# BLOCK WITH POINT DIFFERENCE ENGINE #
+######################################
+
+
+import heapq
+from typing import List, Sequence
+
+
+# every row is (user_id, name, surname, total_points), rows are ordered by
+# total_points DESC, user_id ASC - the same order the DAL selects them in
+
+
+def make_pair(higher: Sequence, lower: Sequence) -> dict:
+    """Builds the response dict for a pair, user1 always has more points"""
+    return {
+        "user1": {
+            "user_id": str(higher[0]),
+            "name": higher[1],
+            "surname": higher[2],
+            "total_points": higher[3],
+        },
+        "user2": {
+            "user_id": str(lower[0]),
+            "name": lower[1],
+            "surname": lower[2],
+            "total_points": lower[3],
+        },
+        "point_difference": higher[3] - lower[3],
+    }
+
+
+def farthest_pairs(top_rows: Sequence[Sequence], bottom_rows: Sequence[Sequence], k: int = 1) -> List[dict]:
+    """Returns k pairs with the biggest point difference.
+
+    Every pair of the answer is made of one of the k first rows and one of the
+    k last rows, so only 2k rows are needed: top_rows in DESC order and
+    bottom_rows in ASC order. That holds when equal differences are ordered
+    by the higher row first to last and then by the lower row last to first,
+    so the rows are sorted again and pairs are ordered by their positions.
+    The rows may overlap when there are less than 2k users, such pairs are
+    skipped.
+    """
+    def sort_key(row):
+        return -row[3], str(row[0])
+
+    top_rows = sorted(top_rows, key=sort_key)
+    bottom_rows = sorted(bottom_rows, key=sort_key, reverse=True)
+    candidates = []
+    for top_position, higher in enumerate(top_rows):
+        for bottom_position, lower in enumerate(bottom_rows):
+            if sort_key(higher) < sort_key(lower):
+                candidates.append((higher[3] - lower[3], top_position, bottom_position, higher, lower))
+    best = heapq.nsmallest(k, candidates, key=lambda item: (-item[0], item[1], item[2]))
+    return [make_pair(higher, lower) for _, _, _, higher, lower in best]
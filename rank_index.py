@@ -0,0 +1,80 @@
+###################################
+# BLOCK WITH IN-MEMORY RANK INDEX #
+###################################
+
+
+import asyncio
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Iterable, Tuple
+
+from sortedcontainers import SortedList
+
+import settings
+
+
+class RankIndex:
+    """Sorted snapshot of user totals for O(log n) rank lookups and updates.
+
+    Keys are (-total_points, user_id) so the list is ordered like the
+    leaderboard. A SortedList keeps an update logarithmic, a plain list would
+    move every key after the updated one. The snapshot is loaded from
+    user_stats, updated in place after every committed award and fully
+    reloaded once in REFRESH_SECONDS to pick up awards written by other
+    processes.
+    """
+
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._keys = SortedList()
+        self._points: Dict[str, int] = {}
+        self._loaded_at = None
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @property
+    def is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_seconds
+
+    async def ensure_fresh(self, load: Callable[[], Awaitable[Iterable[Tuple[uuid.UUID, int]]]]) -> None:
+        if self.is_fresh:
+            return
+        async with self._lock:
+            if self.is_fresh:
+                return
+            self.reset(await load())
+
+    def reset(self, rows: Iterable[Tuple[uuid.UUID, int]]) -> None:
+        points = {str(user_id): total_points for user_id, total_points in rows}
+        self._keys = SortedList((-total_points, user_id) for user_id, total_points in points.items())
+        self._points = points
+        self._loaded_at = time.monotonic()
+
+    def update(self, user_id: uuid.UUID, total_points: int) -> None:
+        if self._loaded_at is None:
+            return
+        user_id = str(user_id)
+        old_points = self._points.get(user_id)
+        if old_points is not None:
+            self._keys.remove((-old_points, user_id))
+        self._keys.add((-total_points, user_id))
+        self._points[user_id] = total_points
+
+    def rank(self, total_points: int) -> int:
+        """Position of the given total, users with equal points share a rank"""
+        return self._keys.bisect_left((-total_points,)) + 1
+
+    def percentile(self, total_points: int) -> float:
+        """Share of ranked users with less points"""
+        if not self._keys:
+            return 0.0
+        below = len(self._keys) - self._keys.bisect_right((-total_points, chr(0x10FFFF)))
+        return round(below * 100 / len(self._keys), 2)
+
+    def get_points(self, user_id: uuid.UUID):
+        return self._points.get(str(user_id))
+
+
+rank_index = RankIndex(refresh_seconds=settings.RANK_INDEX_REFRESH_SECONDS)
@@ -0,0 +1,86 @@
+####################################
+# BLOCK FOR COALESCING EQUAL CALLS #
+####################################
+
+
+import asyncio
+import functools
+import json
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from fastapi.encoders import jsonable_encoder
+
+import metrics
+
+
+class SingleFlight:
+    """Runs one computation per key, concurrent callers with the key await it.
+
+    The computation runs in its own task: a caller which is cancelled (the
+    client went away) does not cancel it for the others, it is cancelled only
+    when no caller waits for it anymore. Exceptions reach every caller, and
+    the key is free again as soon as the computation is done.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(compute())
+            self._calls[key] = task
+            self._waiters[task] = 0
+            task.add_done_callback(lambda _: self._forget(key, task))
+            metrics.singleflight_calls.inc(self.name, "leader")
+        else:
+            metrics.singleflight_calls.inc(self.name, "coalesced")
+
+        self._waiters[task] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and self._waiters[task] == 1:
+                task.cancel()
+                metrics.singleflight_calls.inc(self.name, "cancelled")
+            raise
+        finally:
+            if task in self._waiters:
+                self._waiters[task] -= 1
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        self._waiters.pop(task, None)
+        # an exception nobody awaited anymore must not be reported as never retrieved
+        if not task.cancelled():
+            task.exception()
+
+
+def call_key(kwargs: dict) -> str:
+    return json.dumps(jsonable_encoder(kwargs), sort_keys=True)
+
+
+def coalesced(name: str):
+    """Decorator, concurrent calls with equal keyword arguments share one call.
+
+    Only for functions which open their own session, the call runs on behalf
+    of every waiting request. Every caller gets the same result object, so it
+    must be plain data: a Response, which is sent and may be changed per
+    request, is built by each caller.
+    """
+    flight = SingleFlight(name)
+
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(**kwargs):
+            return await flight.do(call_key(kwargs), lambda: function(**kwargs))
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,180 @@
+################################
+# BLOCK FOR THE SLOW QUERY LOG #
+################################
+
+
+import asyncio
+import datetime
+import logging
+import re
+import uuid
+from typing import Dict, Optional
+
+from greenlet import getcurrent
+
+import metrics
+import settings
+
+
+logger = logging.getLogger("slow_queries")
+
+# files whose frames name the caller of a statement
+CALLER_MODULES = ("dals.py", "ingest.py")
+
+# a write anywhere in the statement (a data-modifying CTE too) or a row lock
+WRITES_OR_LOCKS = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|SHARE)\b", re.IGNORECASE)
+
+
+class SlowQueryLog:
+    """Worst statements seen by the process, one entry per SQL text.
+
+    An entry keeps the slowest execution of its statement: the duration,
+    redacted parameters, the DAL method that sent it, the exception class if
+    it failed and its plan. When the log is full the entry with the smallest
+    duration is dropped.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._entries: Dict[str, dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(
+            self, statement: str, parameters, duration_ms: float, caller: str, error: Optional[str] = None,
+    ) -> Optional[dict]:
+        """Stores the execution, returns the entry if it became the worst of its statement"""
+        entry = self._entries.get(statement)
+        if entry is not None:
+            entry["count"] += 1
+            entry["last_seen"] = now()
+            if duration_ms <= entry["duration_ms"]:
+                return None
+        elif len(self._entries) >= self.size:
+            fastest = min(self._entries.values(), key=lambda item: item["duration_ms"])
+            if duration_ms <= fastest["duration_ms"]:
+                return None
+            del self._entries[fastest["statement"]]
+            entry = None
+
+        if entry is None:
+            entry = self._entries[statement] = {"statement": statement, "count": 1, "last_seen": now()}
+        entry.update(
+            duration_ms=round(duration_ms, 2),
+            parameters=redact(parameters),
+            caller=caller,
+            error=error,
+            plan=None,
+        )
+        return entry
+
+    def entries(self) -> list:
+        return sorted(self._entries.values(), key=lambda item: item["duration_ms"], reverse=True)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+def now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def redact(parameters):
+    """Strings may be emails or names, only their length is kept"""
+    if isinstance(parameters, dict):
+        return {key: redact(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [redact(value) for value in parameters]
+    if isinstance(parameters, str):
+        return f"<str:{len(parameters)}>" if settings.SLOW_QUERY_REDACT else parameters
+    if isinstance(parameters, (int, float, bool, type(None))):
+        return parameters
+    if isinstance(parameters, (datetime.date, uuid.UUID)):
+        return str(parameters)
+    return f"<{type(parameters).__name__}>"
+
+
+def find_caller() -> str:
+    """Qualified name of the innermost DAL function on the stack.
+
+    Statements run in a greenlet started by the async API, the coroutine that
+    awaited it is on the stack of the parent greenlet.
+    """
+    current = getcurrent()
+    for frame in (current.gr_frame, current.parent.gr_frame if current.parent else None):
+        while frame is not None:
+            if frame.f_code.co_filename.endswith(CALLER_MODULES):
+                code = frame.f_code
+                # co_qualname appeared in Python 3.11
+                return f"{code.co_filename.rsplit('/', 1)[-1]}:{getattr(code, 'co_qualname', code.co_name)}"
+            frame = frame.f_back
+    return "unknown"
+
+
+def explain_prefix(statement: str) -> str:
+    """ANALYZE runs the statement again, only plain reads are worth it.
+
+    Writes would take their row locks and do their work once more on an
+    already slow primary, and fail on a conflict of a literal key.
+    """
+    is_read = statement.lstrip().upper().startswith(("SELECT", "WITH"))
+    if is_read and WRITES_OR_LOCKS.search(statement) is None:
+        return "EXPLAIN (ANALYZE, BUFFERS) "
+    return "EXPLAIN "
+
+
+async def capture_plan(engine, entry: dict, statement: str, parameters) -> None:
+    # the plan is not work of the request which ran into the slow statement
+    metrics.current_request.set(None)
+    try:
+        async with engine.connect() as connection:
+            connection.info["skip_slow_query_log"] = True
+            try:
+                async with connection.begin() as transaction:
+                    # a read is executed again and must not wait for the locks
+                    # of the transaction which sent it
+                    timeout = settings.SLOW_QUERY_EXPLAIN_TIMEOUT_MS
+                    await connection.exec_driver_sql(f"SET LOCAL lock_timeout = {timeout}")
+                    await connection.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout}")
+                    result = await connection.exec_driver_sql(explain_prefix(statement) + statement, parameters)
+                    entry["plan"] = "\n".join(row[0] for row in result)
+                    await transaction.rollback()
+            finally:
+                connection.info.pop("skip_slow_query_log", None)
+    except Exception as error:
+        entry["plan"] = f"EXPLAIN failed: {error.__class__.__name__}: {error}"
+
+
+def instrument_engine(engine, log: "SlowQueryLog") -> None:
+    """Logs statements of the async engine slower than SLOW_QUERY_THRESHOLD_MS"""
+    threshold = settings.SLOW_QUERY_THRESHOLD_MS
+    if threshold <= 0:
+        return
+    pending = set()
+
+    def log_statement(conn, statement: str, parameters, executemany: bool, elapsed: float, error: Optional[str]):
+        duration_ms = elapsed * 1000
+        if duration_ms < threshold or conn.info.get("skip_slow_query_log"):
+            return
+
+        caller = find_caller()
+        logger.warning("slow query %.1f ms in %s: %s", duration_ms, caller, statement)
+        entry = log.add(statement, parameters, duration_ms, caller, error)
+        if entry is None or executemany or not settings.SLOW_QUERY_EXPLAIN:
+            return
+        if error is not None:
+            entry["plan"] = "EXPLAIN skipped: the statement failed"
+            return
+        if len(pending) >= settings.SLOW_QUERY_MAX_PENDING_EXPLAINS:
+            entry["plan"] = "EXPLAIN skipped: too many plans are being captured"
+            return
+        task = asyncio.get_running_loop().create_task(capture_plan(engine, entry, statement, parameters))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+
+    # failed statements are logged too, one cancelled by statement_timeout is worth seeing
+    metrics.on_statement(engine, log_statement)
+
+
+slow_query_log = SlowQueryLog(size=settings.SLOW_QUERY_LOG_SIZE)
@@ -0,0 +1,47 @@
+import datetime
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from api_models import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    ra_id = uuid.uuid4()
+    cursor = encode_cursor(datetime.date(2024, 1, 31).isoformat(), ra_id)
+    assert decode_cursor(cursor, 2) == ["2024-01-31", str(ra_id)]
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor("\xff\xfe" * 10, "?&=")
+    assert all(char.isalnum() or char in "-_=" for char in cursor)
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not base64 at all!",
+    encode_cursor("2024-01-31"),
+    encode_cursor("2024-01-31", uuid.uuid4(), "extra"),
+    # valid base64 of bytes which are not UTF-8
+    "__79",
+    "ключ",
+])
+def test_invalid_cursor_is_422(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, 2)
+    assert error.value.status_code == 422
+
+
+@pytest.mark.parametrize("path, params", [
+    ("/received-achievement/", {"email": "user@example.com"}),
+    ("/leaderboard/", {}),
+])
+def test_cursor_with_invalid_values_is_422_before_any_query(path, params):
+    from fastapi.testclient import TestClient
+
+    from main import app
+
+    response = TestClient(app).get(path, params={**params, "cursor": encode_cursor("yesterday", "not-a-uuid")})
+    assert response.status_code == 422
+    assert response.json()["detail"] == "Invalid cursor"
@@ -0,0 +1,54 @@
+import csv
+import datetime
+import io
+import json
+import uuid
+
+from export import EXPORT_COLUMNS, format_csv, format_ndjson, iter_export
+
+
+def make_row(name: str = "Anna", achievement_name: str = "First") -> tuple:
+    return (
+        uuid.uuid4(), datetime.date(2024, 1, 31), uuid.uuid4(), "anna@example.com",
+        name, "Иванова", uuid.uuid4(), achievement_name, 10,
+    )
+
+
+def expected(row: tuple) -> dict:
+    return {column: value if isinstance(value, (int, str)) else str(value) for column, value in zip(EXPORT_COLUMNS, row)}
+
+
+async def partitions(*chunks: list):
+    for rows in chunks:
+        yield rows
+
+
+async def collect(iterator) -> list:
+    return [chunk async for chunk in iterator]
+
+
+def test_ndjson_line_per_row():
+    rows = [make_row(), make_row(name="Bob")]
+    lines = format_ndjson(rows).decode().splitlines()
+    assert [json.loads(line) for line in lines] == [expected(row) for row in rows]
+    # non-ASCII text is written as UTF-8, not escaped
+    assert "Иванова" in lines[0]
+
+
+def test_csv_quotes_delimiters_quotes_and_newlines():
+    row = make_row(name='Anna, "the first"', achievement_name="two\nlines")
+    parsed = list(csv.reader(io.StringIO(format_csv([row]).decode())))
+    assert parsed == [[str(value) for value in expected(row).values()]]
+
+
+async def test_csv_export_starts_with_the_header():
+    chunks = await collect(iter_export(partitions([make_row()], [], [make_row(), make_row()]), "csv"))
+    assert chunks[0] == (",".join(EXPORT_COLUMNS) + "\n").encode()
+    # one chunk per partition of rows
+    assert [chunk.count(b"\n") for chunk in chunks[1:]] == [1, 0, 2]
+
+
+async def test_ndjson_export_is_the_default():
+    rows = [make_row()]
+    chunks = await collect(iter_export(partitions(rows), "ndjson"))
+    assert [json.loads(line) for chunk in chunks for line in chunk.splitlines()] == [expected(rows[0])]
@@ -0,0 +1,115 @@
+import pytest
+from fastapi import HTTPException
+
+import settings
+from api_models import ReceivedAchievementCreate
+from ingest import BulkReport, iter_chunks, iter_csv_rows, iter_lines, parse_records
+
+
+async def stream(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+async def collect(iterator) -> list:
+    return [item async for item in iterator]
+
+
+async def test_lines_split_across_chunks_are_joined():
+    lines = await collect(iter_lines(stream(b'{"a"', b':1}\n{"b":2', b"}\n", b'{"c":3}')))
+    assert lines == [(1, b'{"a":1}'), (2, b'{"b":2}'), (3, b'{"c":3}')]
+
+
+async def test_blank_lines_are_skipped_but_counted():
+    lines = await collect(iter_lines(stream(b"first\n\n  \nfourth\n\n")))
+    assert lines == [(1, b"first"), (4, b"fourth")]
+
+
+@pytest.mark.parametrize("chunks", [
+    [b"x" * 20, b"x" * 20],
+    # the long line starts after the newline of a chunk
+    [b"short\n" + b"x" * 40, b"\n"],
+])
+async def test_too_long_line_is_rejected(monkeypatch, chunks):
+    monkeypatch.setattr(settings, "BULK_MAX_LINE_BYTES", 32)
+    with pytest.raises(HTTPException) as error:
+        await collect(iter_lines(stream(*chunks)))
+    assert error.value.status_code == 413
+
+
+async def test_chunks_keep_the_given_size():
+    chunks = await collect(iter_chunks(stream(*range(5)), 2))
+    assert chunks == [[0, 1], [2, 3], [4]]
+
+
+def test_parse_records_reports_every_invalid_line():
+    chunk = [
+        (1, b'{"email": "user@example.com", "achievement_name": "First", "date": "2024-01-02"}'),
+        (2, b'{"email": "not-an-email", "achievement_name": "First", "date": "2024-01-02"}'),
+        (3, b"not json"),
+        (4, ValueError("Expected 3 columns, got 2")),
+        (5, {"email": "dict@example.com", "achievement_name": "Second", "date": "2024-01-03"}),
+    ]
+    records, errors = parse_records(chunk, ReceivedAchievementCreate)
+    assert [(line_no, record.email) for line_no, record in records] == [(1, "user@example.com"), (5, "dict@example.com")]
+    assert [line_no for line_no, _ in errors] == [2, 3, 4]
+    assert errors[0][1].startswith("email: ")
+    assert errors[2][1] == "Expected 3 columns, got 2"
+
+
+def test_report_keeps_a_bounded_list_of_errors():
+    report = BulkReport(max_errors=2)
+    report.accepted = 3
+    report.reject_all([(line_no, None) for line_no in range(1, 6)], "Chunk was not saved")
+    result = report.as_dict()
+    assert (result["accepted"], result["rejected"]) == (3, 5)
+    assert result["errors"] == [{"line": 1, "detail": "Chunk was not saved"}, {"line": 2, "detail": "Chunk was not saved"}]
+
+
+async def csv_rows(*chunks: bytes) -> list:
+    return await collect(iter_csv_rows(iter_lines(stream(*chunks))))
+
+
+async def test_csv_rows_use_the_header():
+    rows = await csv_rows(b"name, surname ,email\nAnna,Ivanova,anna@example.com\nBob,Smith\n")
+    assert rows[0] == (2, {"name": "Anna", "surname": "Ivanova", "email": "anna@example.com"})
+    assert rows[1][0] == 3
+    assert str(rows[1][1]) == "Expected 3 columns, got 2"
+
+
+async def test_csv_line_split_across_chunks():
+    rows = await csv_rows(b"name,email\nAn", b"na,anna@exa", b"mple.com\n")
+    assert rows == [(2, {"name": "Anna", "email": "anna@example.com"})]
+
+
+async def test_csv_line_not_valid_utf8_is_rejected_alone():
+    rows = await csv_rows(b"name,email\n\xff\xfe,bad\nBob,bob@example.com\n")
+    assert rows[0][0] == 2
+    assert isinstance(rows[0][1], ValueError)
+    assert rows[1] == (3, {"name": "Bob", "email": "bob@example.com"})
+
+
+async def test_csv_header_not_valid_utf8_fails_the_upload():
+    with pytest.raises(HTTPException) as error:
+        await csv_rows(b"n\xffame,email\nBob,bob@example.com\n")
+    assert error.value.status_code == 400
+
+
+async def test_csv_quoted_field_keeps_its_newlines():
+    rows = await csv_rows(b'name,note\nAnna,"first\n', b'\nthird ""quoted"""\nBob,plain\n')
+    assert rows == [
+        (2, {"name": "Anna", "note": 'first\n\nthird "quoted"'}),
+        (5, {"name": "Bob", "note": "plain"}),
+    ]
+
+
+async def test_csv_unclosed_quote_is_rejected(monkeypatch):
+    rows = await csv_rows(b'name,note\nAnna,"never closed\nBob,plain\n')
+    assert len(rows) == 1
+    assert rows[0][0] == 2
+    assert str(rows[0][1]) == "Quoted field is not closed"
+
+    monkeypatch.setattr(settings, "BULK_MAX_LINE_BYTES", 32)
+    with pytest.raises(HTTPException) as error:
+        await csv_rows(b'name,note\nAnna,"' + b"x\n" * 40)
+    assert error.value.status_code == 413
@@ -0,0 +1,42 @@
+import random
+import uuid
+
+import pytest
+
+from point_difference import farthest_pairs, make_pair
+
+
+def make_rows(count: int, seed: int, max_points: int = 20) -> list:
+    """Rows in the order of the DAL, narrow totals give many equal differences"""
+    generator = random.Random(seed)
+    rows = [
+        (uuid.UUID(int=generator.getrandbits(128)), f"Name{number}", f"Surname{number}", generator.randint(0, max_points))
+        for number in range(count)
+    ]
+    return sorted(rows, key=lambda row: (-row[3], row[0]))
+
+
+def brute_force(rows: list, k: int) -> list:
+    """Every pair, the first and the last users come first among equal differences"""
+    pairs = [(rows[i][3] - rows[j][3], i, j) for i in range(len(rows)) for j in range(i + 1, len(rows))]
+    best = sorted(pairs, key=lambda pair: (-pair[0], pair[1], -pair[2]))[:k]
+    return [make_pair(rows[i], rows[j]) for _, i, j in best]
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("k", [1, 3, 10])
+def test_farthest_pairs_match_brute_force(seed, k):
+    rows = make_rows(random.Random(seed).randint(0, 30), seed)
+    # the DAL selects the k first rows DESC and the k last rows ASC
+    assert farthest_pairs(rows[:k], rows[::-1][:k], k) == brute_force(rows, k)
+
+
+@pytest.mark.parametrize("k", [1, 2, 5])
+def test_farthest_pairs_of_equal_totals(k):
+    rows = make_rows(6, seed=k, max_points=0)
+    assert farthest_pairs(rows[:k], rows[::-1][:k], k) == brute_force(rows, k)
+
+
+def test_input_order_does_not_matter():
+    rows = make_rows(12, seed=7, max_points=3)
+    assert farthest_pairs(rows[:4][::-1], rows[-4:], 4) == brute_force(rows, 4)
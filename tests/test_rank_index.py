@@ -0,0 +1,45 @@
+import uuid
+
+from rank_index import RankIndex
+
+
+def test_equal_totals_share_a_rank():
+    index = RankIndex(refresh_seconds=60)
+    users = [uuid.uuid4() for _ in range(4)]
+    index.reset([(users[0], 30), (users[1], 20), (users[2], 20), (users[3], 10)])
+    assert [index.rank(points) for points in (30, 20, 10)] == [1, 2, 4]
+    assert index.rank(25) == 2
+    assert index.percentile(20) == 25.0
+    assert index.percentile(30) == 75.0
+    assert index.percentile(10) == 0.0
+
+
+def test_update_moves_the_user():
+    index = RankIndex(refresh_seconds=60)
+    leader, other = uuid.uuid4(), uuid.uuid4()
+    index.reset([(leader, 30), (other, 10)])
+    index.update(other, 40)
+    assert len(index) == 2
+    assert index.get_points(other) == 40
+    assert index.rank(40) == 1
+    assert index.rank(30) == 2
+
+
+def test_update_before_load_is_ignored():
+    index = RankIndex(refresh_seconds=60)
+    index.update(uuid.uuid4(), 10)
+    assert len(index) == 0
+    assert index.percentile(10) == 0.0
+
+
+def test_repeated_updates_keep_one_key_per_user():
+    index = RankIndex(refresh_seconds=60)
+    users = [uuid.uuid4() for _ in range(100)]
+    index.reset((user_id, 0) for user_id in users)
+    for step in range(1, 6):
+        for number, user_id in enumerate(users):
+            index.update(user_id, number * step)
+    assert len(index) == 100
+    assert index.rank(99 * 5) == 1
+    assert index.rank(0) == 100
+    assert index.percentile(50 * 5) == 50.0
@@ -0,0 +1,31 @@
+import asyncio
+
+import orjson
+
+from caches import LRUBackend, ResponseCache
+
+
+async def test_hit_and_tag_invalidation():
+    cache = ResponseCache(LRUBackend(max_entries=10))
+    calls = 0
+
+    @cache.cached("route", ttl=60, tags=["users"])
+    async def route(limit: int):
+        nonlocal calls
+        calls += 1
+        return {"limit": limit, "calls": calls}
+
+    first = await route(limit=5)
+    assert orjson.loads(first.body) == {"limit": 5, "calls": 1}
+    assert (await route(limit=5)).body == first.body
+    assert calls == 1
+
+    # another tag leaves the entry in place
+    cache.invalidate("awards")
+    await asyncio.gather(*cache._pending)
+    await route(limit=5)
+    assert calls == 1
+
+    cache.invalidate("users")
+    await asyncio.gather(*cache._pending)
+    assert orjson.loads((await route(limit=5)).body) == {"limit": 5, "calls": 2}
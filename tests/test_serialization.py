@@ -0,0 +1,41 @@
+import uuid
+
+import orjson
+
+from api_models import ShowAchievement
+from caches import AchievementCatalog, LRUBackend, ResponseCache
+
+
+def make_achievement(name: str) -> ShowAchievement:
+    return ShowAchievement(
+        achievement_id=uuid.uuid4(), name=name, points=10, ru_description="", en_description="",
+    )
+
+
+def test_catalog_json_is_encoded_once_per_change():
+    catalog = AchievementCatalog(ttl_seconds=60)
+    first = make_achievement("first")
+    catalog.reset([first], {first.achievement_id: 1}, users=4)
+    encoded = catalog.as_json()
+    assert catalog.as_json() is encoded
+    assert orjson.loads(encoded) == [{**first.model_dump(mode="json"), "holders": 1, "rarity_pct": 25.0}]
+
+    catalog.add_holders({first.achievement_id: 1})
+    assert orjson.loads(catalog.as_json())[0]["rarity_pct"] == 50.0
+    catalog.put(make_achievement("second"))
+    assert len(orjson.loads(catalog.as_json())) == 2
+
+
+async def test_cache_hit_is_sent_as_stored():
+    backend = LRUBackend(max_entries=10)
+    cache = ResponseCache(backend)
+
+    @cache.cached("route", ttl=60, tags=["users"])
+    async def route(limit: int):
+        return [{"limit": limit}]
+
+    body = (await route(limit=1)).body
+    key, = backend._entries
+    await backend.set(key, b'[{"stored":true}]', 60)
+    assert body == b'[{"limit":1}]'
+    assert (await route(limit=1)).body == b'[{"stored":true}]'
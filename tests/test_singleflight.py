@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+async def test_concurrent_callers_share_one_computation():
+    flight = SingleFlight("test")
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(*(flight.do("key", compute) for _ in range(5)))
+    assert results == [1] * 5
+    assert len(flight) == 0
+    # the key is free again once the computation is done
+    assert await flight.do("key", compute) == 2
+
+
+async def test_exception_reaches_every_caller_and_frees_the_key():
+    flight = SingleFlight("test")
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(*(flight.do("key", fail) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(flight) == 0
+
+    async def succeed():
+        return "ok"
+
+    assert await flight.do("key", succeed) == "ok"
+
+
+async def test_cancelled_caller_does_not_cancel_the_others():
+    flight = SingleFlight("test")
+    release = asyncio.Event()
+
+    async def compute():
+        await release.wait()
+        return "done"
+
+    first = asyncio.ensure_future(flight.do("key", compute))
+    second = asyncio.ensure_future(flight.do("key", compute))
+    await asyncio.sleep(0)
+    first.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    release.set()
+    assert await second == "done"
+
+
+async def test_computation_is_cancelled_with_its_last_caller():
+    flight = SingleFlight("test")
+    started = asyncio.Event()
+    cancelled = False
+
+    async def compute():
+        nonlocal cancelled
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+
+    caller = asyncio.ensure_future(flight.do("key", compute))
+    await started.wait()
+    caller.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+    await asyncio.sleep(0)
+    assert cancelled
+    assert len(flight) == 0
+
+
+async def test_coalesced_leaderboard_requests_get_their_own_response(monkeypatch):
+    import contextlib
+
+    import main
+    from dals import UserStatsDAL
+
+    class Session:
+        @contextlib.asynccontextmanager
+        async def begin(self):
+            yield
+
+    @contextlib.asynccontextmanager
+    async def read_session(*args, **kwargs):
+        yield Session()
+
+    calls = 0
+
+    async def get_leaderboard_page(self, limit, after_points, after_user_id):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return []
+
+    async def ensure_fresh(load):
+        pass
+
+    monkeypatch.setattr(main, "read_session", read_session)
+    monkeypatch.setattr(UserStatsDAL, "get_leaderboard_page", get_leaderboard_page)
+    monkeypatch.setattr(main.rank_index, "ensure_fresh", ensure_fresh)
+
+    first, second = await asyncio.gather(main.get_leaderboard(limit=10), main.get_leaderboard(limit=10))
+    assert calls == 1
+    assert first is not second
+    first.headers["X-Test"] = "1"
+    assert "X-Test" not in second.headers
+    assert first.body == second.body
@@ -0,0 +1,83 @@
+import datetime
+import types
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql
+
+import metrics
+
+import settings
+from dals import count_users_stmt
+from slow_queries import SlowQueryLog, explain_prefix, instrument_engine, redact
+
+
+@pytest.mark.parametrize("statement", [
+    "SELECT user_id, total_points FROM user_stats ORDER BY total_points DESC LIMIT $1",
+    "WITH ranked AS (SELECT user_id, row_number() OVER () AS place FROM user_stats) SELECT * FROM ranked",
+    "  select updated_at from users",
+])
+def test_reads_are_analyzed(statement):
+    assert explain_prefix(statement) == "EXPLAIN (ANALYZE, BUFFERS) "
+
+
+@pytest.mark.parametrize("statement", [
+    str(count_users_stmt(1).compile(dialect=postgresql.dialect())),
+    "UPDATE user_stats SET current_streak = 1 WHERE user_id = $1",
+    "DELETE FROM daily_award_rollup WHERE date >= $1",
+    "WITH new_awards AS (INSERT INTO received_achievements VALUES ($1) RETURNING user_id) SELECT * FROM new_awards",
+    "SELECT user_id FROM user_stats WHERE user_id = ANY($1) ORDER BY user_id FOR UPDATE",
+    "SELECT user_id FROM user_stats FOR SHARE",
+])
+def test_writes_and_locks_are_not_executed_again(statement):
+    assert explain_prefix(statement) == "EXPLAIN "
+
+
+def test_log_keeps_the_slowest_execution_of_every_statement():
+    log = SlowQueryLog(size=2)
+    assert log.add("SELECT 1", None, 10, "dals.py:a") is not None
+    assert log.add("SELECT 1", None, 5, "dals.py:a") is None
+    log.add("SELECT 2", None, 20, "dals.py:b", error="QueryCanceledError")
+    # the fastest entry makes room for a slower statement
+    log.add("SELECT 3", None, 30, "dals.py:c")
+    entries = log.entries()
+    assert [(entry["statement"], entry["duration_ms"]) for entry in entries] == [("SELECT 3", 30), ("SELECT 2", 20)]
+    assert entries[1]["error"] == "QueryCanceledError"
+    assert len(log) == 2
+
+
+def test_parameters_are_redacted(monkeypatch):
+    monkeypatch.setattr(settings, "SLOW_QUERY_REDACT", True)
+    user_id = uuid.uuid4()
+    parameters = {"email": "user@example.com", "ids": [user_id, 7], "day": datetime.date(2024, 1, 2), "other": object()}
+    assert redact(parameters) == {
+        "email": "<str:16>", "ids": [str(user_id), 7], "day": "2024-01-02", "other": "<object>",
+    }
+
+
+def test_log_reads_the_shared_statement_timing(monkeypatch):
+    monkeypatch.setattr(settings, "SLOW_QUERY_THRESHOLD_MS", 1e-6)
+    monkeypatch.setattr(settings, "SLOW_QUERY_EXPLAIN", False)
+    sync_engine = create_engine("sqlite://")
+    engine = types.SimpleNamespace(sync_engine=sync_engine, pool=sync_engine.pool)
+    timings = []
+    metrics.on_statement(engine, lambda conn, statement, parameters, executemany, elapsed, error: timings.append(
+        (statement, elapsed, error)
+    ))
+    log = SlowQueryLog(size=10)
+    instrument_engine(engine, log)
+
+    with sync_engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        with pytest.raises(Exception):
+            connection.execute(text("SELECT * FROM missing"))
+
+    assert [(statement, error) for statement, _, error in timings] == [
+        ("SELECT 1", None), ("SELECT * FROM missing", "OperationalError"),
+    ]
+    # both listeners got the one measured duration
+    entries = {entry["statement"]: entry for entry in log.entries()}
+    for statement, elapsed, error in timings:
+        assert entries[statement]["duration_ms"] == round(elapsed * 1000, 2)
+        assert entries[statement]["error"] == error
@@ -0,0 +1,108 @@
+import random
+from collections import namedtuple
+from datetime import date, timedelta
+
+import pytest
+
+from dals import AwardRollupDAL, bucket_count, bucket_start, next_bucket
+
+
+def days(date_from: date, date_to: date):
+    while date_from <= date_to:
+        yield date_from
+        date_from += timedelta(days=1)
+
+
+@pytest.mark.parametrize("day, bucket, start", [
+    (date(2024, 3, 14), "day", date(2024, 3, 14)),
+    # ISO weeks start on Monday, like date_trunc('week')
+    (date(2024, 3, 14), "week", date(2024, 3, 11)),
+    (date(2024, 3, 11), "week", date(2024, 3, 11)),
+    (date(2024, 3, 17), "week", date(2024, 3, 11)),
+    (date(2025, 1, 1), "week", date(2024, 12, 30)),
+    (date(2024, 2, 29), "month", date(2024, 2, 1)),
+])
+def test_bucket_start(day, bucket, start):
+    assert bucket_start(day, bucket) == start
+
+
+@pytest.mark.parametrize("start, bucket, following", [
+    (date(2024, 12, 31), "day", date(2025, 1, 1)),
+    (date(2024, 12, 30), "week", date(2025, 1, 6)),
+    (date(2024, 1, 1), "month", date(2024, 2, 1)),
+    (date(2024, 2, 1), "month", date(2024, 3, 1)),
+    (date(2024, 12, 1), "month", date(2025, 1, 1)),
+])
+def test_next_bucket(start, bucket, following):
+    assert next_bucket(start, bucket) == following
+
+
+@pytest.mark.parametrize("bucket", ["day", "week", "month"])
+def test_bucket_count_matches_the_distinct_starts(bucket):
+    generator = random.Random(bucket)
+    for _ in range(200):
+        date_from = date(2023, 1, 1) + timedelta(days=generator.randint(0, 730))
+        date_to = date_from + timedelta(days=generator.randint(0, 400))
+        starts = {bucket_start(day, bucket) for day in days(date_from, date_to)}
+        assert bucket_count(date_from, date_to, bucket) == len(starts)
+
+
+class FakeSession:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def execute(self, stmt):
+        return self.rows
+
+
+async def test_timeseries_fills_empty_buckets():
+    Row = namedtuple("Row", "start awards points")
+    session = FakeSession([Row(date(2024, 1, 29), 3, 30), Row(date(2024, 2, 12), 1, 5)])
+    series = await AwardRollupDAL(session).get_timeseries(date(2024, 1, 31), date(2024, 2, 14), "week")
+    assert series == [
+        (date(2024, 1, 29), 3, 30),
+        (date(2024, 2, 5), 0, 0),
+        (date(2024, 2, 12), 1, 5),
+    ]
+
+
+def test_default_range_is_cached_per_day(monkeypatch):
+    import contextlib
+
+    from fastapi.testclient import TestClient
+
+    import main
+
+    class Session:
+        @contextlib.asynccontextmanager
+        async def begin(self):
+            yield
+
+    @contextlib.asynccontextmanager
+    async def read_session(*args, **kwargs):
+        yield Session()
+
+    ranges = []
+
+    async def get_timeseries(self, date_from, date_to, bucket):
+        ranges.append((date_from, date_to))
+        return [(date_from, 1, 10)]
+
+    today = date.today()
+
+    class Tomorrow(date):
+        @classmethod
+        def today(cls):
+            return today + timedelta(days=1)
+
+    monkeypatch.setattr(main, "read_session", read_session)
+    monkeypatch.setattr(AwardRollupDAL, "get_timeseries", get_timeseries)
+    main.response_cache.backend.clear()
+    client = TestClient(main.app)
+
+    assert client.get("/stats/timeseries").json() == client.get("/stats/timeseries").json()
+    assert ranges == [(today - timedelta(days=364), today)]
+
+    monkeypatch.setattr(main, "date", Tomorrow)
+    assert client.get("/stats/timeseries").json()[0]["start"] == (today - timedelta(days=363)).isoformat()
+    assert len(ranges) == 2
@@ -0,0 +1,58 @@
+import uuid
+
+import pytest
+
+import caches
+from api_models import ShowUser
+from caches import UNKNOWN_USER, UserCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces time.monotonic of the caches, advanced by assigning clock.now"""
+
+    class Clock:
+        now = 1000.0
+
+    monkeypatch.setattr(caches.time, "monotonic", lambda: Clock.now)
+    return Clock
+
+
+def make_user(email: str) -> ShowUser:
+    return ShowUser(user_id=uuid.uuid4(), name="Name", surname="Surname", email=email, language="en")
+
+
+def test_negative_entry_expires_after_negative_ttl(clock):
+    cache = UserCache(max_entries=10, ttl_seconds=60, negative_ttl_seconds=5)
+    cache.put_unknown("missing@example.com")
+    assert cache.get_by_email("missing@example.com") is UNKNOWN_USER
+
+    clock.now += 4.9
+    assert cache.get_by_email("missing@example.com") is UNKNOWN_USER
+    clock.now += 0.1
+    assert cache.get_by_email("missing@example.com") is None
+
+
+def test_put_replaces_negative_entry_and_invalidate_drops_both_keys(clock):
+    cache = UserCache(max_entries=10, ttl_seconds=60, negative_ttl_seconds=5)
+    user = make_user("user@example.com")
+    cache.put_unknown(user.email)
+    cache.put(user.email, user)
+    assert cache.get_by_email(user.email) == user
+    assert cache.get_by_id(user.user_id) == user
+
+    cache.invalidate(user.email)
+    assert cache.get_by_email(user.email) is None
+    assert cache.get_by_id(user.user_id) is None
+
+
+def test_least_recently_used_user_is_dropped(clock):
+    cache = UserCache(max_entries=2, ttl_seconds=60, negative_ttl_seconds=5)
+    first, second, third = (make_user(f"user{number}@example.com") for number in range(3))
+    cache.put(first.email, first)
+    cache.put(second.email, second)
+    cache.get_by_email(first.email)
+    cache.put(third.email, third)
+    assert cache.get_by_email(second.email) is None
+    assert cache.get_by_email(first.email) == first
+    assert len(cache) == 2
@@ -0,0 +1,89 @@
+import asyncio
+import datetime
+
+import pytest
+from fastapi import HTTPException
+
+import write_behind
+from write_behind import AwardWriteQueue
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def begin(self):
+        return self
+
+
+class FakeReceivedAchievementsDAL:
+    batches = []
+
+    def __init__(self, session):
+        self.session = session
+
+    async def create_received_achievements_bulk(self, records: list, ra_ids: list) -> list:
+        self.batches.append(list(records))
+        return [{"ra_id": ra_id, "email": email} for ra_id, (email, _, _) in zip(ra_ids, records)]
+
+
+@pytest.fixture
+def written(monkeypatch):
+    monkeypatch.setattr(FakeReceivedAchievementsDAL, "batches", [])
+    monkeypatch.setattr(write_behind, "ReceivedAchievementsDAL", FakeReceivedAchievementsDAL)
+    return FakeReceivedAchievementsDAL.batches
+
+
+async def test_drain_flushes_queued_awards(written):
+    queue = AwardWriteQueue(FakeSession, max_size=10, batch_size=100, flush_ms=50, put_timeout_ms=100)
+    queue.start()
+    today = datetime.date.today()
+    submitted = [await queue.submit(f"user{number}@example.com", "Achievement", today) for number in range(3)]
+
+    await queue.drain()
+    assert len(queue) == 0
+    assert len(written) == 1
+    for number, (ra_id, future) in enumerate(submitted):
+        assert future.result() == {"ra_id": ra_id, "email": f"user{number}@example.com"}
+
+    with pytest.raises(HTTPException) as error:
+        await queue.submit("late@example.com", "Achievement", today)
+    assert error.value.status_code == 503
+
+
+async def test_awards_are_written_in_batches(written):
+    queue = AwardWriteQueue(FakeSession, max_size=10, batch_size=2, flush_ms=50, put_timeout_ms=100)
+    queue.start()
+    today = datetime.date.today()
+    futures = [(await queue.submit(f"user{number}@example.com", "Achievement", today))[1] for number in range(5)]
+    await asyncio.gather(*futures)
+    await queue.drain()
+    assert [len(batch) for batch in written] == [2, 2, 1]
+
+
+async def test_award_queued_after_drain_is_failed(written, monkeypatch):
+    queue = AwardWriteQueue(FakeSession, max_size=10, batch_size=100, flush_ms=50, put_timeout_ms=100)
+    queue.start()
+    drained = asyncio.Event()
+    put = queue._queue.put
+
+    async def late_put(item):
+        # the caller waited for room until drain() returned
+        await drained.wait()
+        await put(item)
+
+    monkeypatch.setattr(queue._queue, "put", late_put)
+    late = asyncio.ensure_future(queue.submit("late@example.com", "Achievement", datetime.date.today()))
+    await asyncio.sleep(0)
+    await queue.drain()
+    drained.set()
+
+    _, future = await late
+    with pytest.raises(HTTPException) as error:
+        await future
+    assert error.value.status_code == 503
+    assert len(queue) == 0
+    assert written == []
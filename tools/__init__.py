@@ -0,0 +1 @@
+"""Command-line tools for the server-achievements service"""
@@ -0,0 +1,254 @@
+"""Checks that no DAL statement needs a sequential scan.
+
+Runs every DAL method against a seeded local database inside a transaction
+that is rolled back, captures the SQL it sends and EXPLAINs each statement
+with enable_seqscan turned off: a Seq Scan that is still left means there is
+no index the planner could use. Exits with 1 if such a statement is found or
+if a public method of a DAL class has no scenario.
+
+    python -m tools.check_query_plans --seed --scale 100k
+"""
+
+import argparse
+import asyncio
+import datetime
+import inspect
+import json
+import sys
+import uuid
+
+from fastapi import HTTPException
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import settings
+from benchmarks.generator import SCALES, dataset_for, load
+import dals
+from caches import user_cache
+from dals import (
+    AchievementDAL, AchievementHoldersDAL, AwardRollupDAL, ReceivedAchievementsDAL, UserDAL, UserStatsDAL,
+)
+
+
+# full reads which are intended: the catalog is loaded into memory as a whole
+ALLOWED_SEQ_SCANS = {
+    "AchievementDAL.get_all_achievements": {"achievements", "achievement_stats"},
+    "UserDAL.create_users_bulk": {"users_staging"},
+    # the export reads every award
+    "ReceivedAchievementsDAL.stream_received_achievements": {"received_achievements", "users", "achievements"},
+    # the rank index is loaded with the totals of every user
+    "UserStatsDAL.get_all_totals": {"user_stats"},
+    # rebuilds recompute whole tables from every award
+    "UserStatsDAL.rebuild": {"user_stats", "received_achievements"},
+    "AchievementHoldersDAL.rebuild": {"achievement_holders", "achievement_stats", "received_achievements"},
+}
+
+# statements EXPLAIN accepts, LOCK, SET and the like are skipped
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+async def _consume(iterator):
+    return [item async for item in iterator]
+
+
+def scenarios(sample: dict):
+    today = datetime.date.today()
+    email, user_id, name = sample["email"], sample["user_id"], sample["achievement_name"]
+    achievement_id = sample["achievement_id"]
+    return {
+        "UserDAL.create_user": lambda s: UserDAL(s).create_user("Plan", "Check", "plan-check-one@example.com", "en"),
+        "UserDAL.find_user": lambda s: UserDAL(s).find_user(email),
+        "UserDAL.find_users": lambda s: UserDAL(s).find_users([email, "missing@example.com"]),
+        "UserDAL.get_user": lambda s: UserDAL(s).get_user(email),
+        "UserDAL.get_user_by_id": lambda s: UserDAL(s).get_user_by_id(user_id),
+        "UserDAL.get_user_with_most_achievements": lambda s: UserDAL(s).get_user_with_most_achievements(),
+        "UserDAL.get_user_with_most_achievement_points": lambda s: UserDAL(s).get_user_with_most_achievement_points(),
+        "UserDAL.get_users_with_max_point_difference": lambda s: UserDAL(s).get_users_with_max_point_difference(5),
+        "UserDAL.get_users_with_min_point_difference": lambda s: UserDAL(s).get_users_with_min_point_difference(),
+        "UserDAL.get_users_with_min_point_difference(top_k)": lambda s: UserDAL(s).get_users_with_min_point_difference(5),
+        "UserDAL.get_users_with_achievements_for_consecutive_days": lambda s: _consume(
+            UserDAL(s).get_users_with_achievements_for_consecutive_days(7)
+        ),
+        "UserDAL.create_users_bulk": lambda s: UserDAL(s).create_users_bulk(
+            [(sample["new_user_id"], "Plan", "Check", "plan-check@example.com", "en")]
+        ),
+        "AchievementDAL.get_all_achievements": lambda s: AchievementDAL(s)._load_catalog(),
+        "AchievementDAL.get_rarest_achievements": lambda s: AchievementDAL(s).get_rarest_achievements(10),
+        "AchievementDAL.create_achievement": lambda s: AchievementDAL(s).create_achievement("plan-check", 1, "", ""),
+        "AchievementDAL.get_achievement_by_id": lambda s: AchievementDAL(s).get_achievement_by_id(uuid.uuid4()),
+        "AchievementDAL.get_achievement_by_name": lambda s: AchievementDAL(s).get_achievement_by_name("missing"),
+        "AchievementDAL.get_achievements_by_names": lambda s: AchievementDAL(s).get_achievements_by_names(["missing"]),
+        "AchievementDAL.get_total_points_by_user_id": lambda s: AchievementDAL(s).get_total_points_by_user_id(user_id),
+        "UserStatsDAL.get_leaderboard_page": lambda s: UserStatsDAL(s).get_leaderboard_page(50),
+        "UserStatsDAL.get_leaderboard_page(cursor)": lambda s: UserStatsDAL(s).get_leaderboard_page(
+            50, sample["total_points"], user_id
+        ),
+        "UserStatsDAL.recompute_streaks": lambda s: UserStatsDAL(s).recompute_streaks([user_id]),
+        "UserStatsDAL.after_award": lambda s: UserStatsDAL(s).after_award(
+            user_id, today - datetime.timedelta(days=400), sample["total_points"], today
+        ),
+        "UserStatsDAL.add_awards": lambda s: UserStatsDAL(s).add_awards([(user_id, 10, today)]),
+        "UserStatsDAL.get_all_totals": lambda s: UserStatsDAL(s).get_all_totals(),
+        "UserStatsDAL.rebuild": lambda s: UserStatsDAL(s).rebuild(),
+        "AchievementHoldersDAL.add_holders": lambda s: AchievementHoldersDAL(s).add_holders({(achievement_id, user_id)}),
+        "AchievementHoldersDAL.rebuild": lambda s: AchievementHoldersDAL(s).rebuild(),
+        "AwardRollupDAL.add_awards": lambda s: AwardRollupDAL(s).add_awards([(achievement_id, 10, today)]),
+        "AwardRollupDAL.rebuild": lambda s: AwardRollupDAL(s).rebuild(today - datetime.timedelta(days=30), today),
+        "AwardRollupDAL.get_timeseries": lambda s: AwardRollupDAL(s).get_timeseries(
+            today - datetime.timedelta(days=364), today, "week"
+        ),
+        "ReceivedAchievementsDAL.create_received_achievement": lambda s: ReceivedAchievementsDAL(
+            s
+        ).create_received_achievement(email, name, today - datetime.timedelta(days=400)),
+        "ReceivedAchievementsDAL.create_received_achievements_bulk": lambda s: ReceivedAchievementsDAL(
+            s
+        ).create_received_achievements_bulk([(email, name, today)]),
+        "ReceivedAchievementsDAL.get_user": lambda s: ReceivedAchievementsDAL(s).get_user(email),
+        "ReceivedAchievementsDAL.get_achievement_by_name": lambda s: ReceivedAchievementsDAL(
+            s
+        ).get_achievement_by_name(name),
+        "ReceivedAchievementsDAL.get_received_achievements_by_email": lambda s: ReceivedAchievementsDAL(
+            s
+        ).get_received_achievements_by_email(email, 100, date_from=today - datetime.timedelta(days=30)),
+        "ReceivedAchievementsDAL.get_received_achievements_by_emails": lambda s: ReceivedAchievementsDAL(
+            s
+        ).get_received_achievements_by_emails([email, "missing@example.com"], 100),
+        "ReceivedAchievementsDAL.stream_received_achievements": lambda s: _consume(
+            ReceivedAchievementsDAL(s).stream_received_achievements(1000)
+        ),
+    }
+
+
+def dal_methods() -> set:
+    """Public coroutine and async generator methods of every DAL class"""
+    methods = set()
+    for class_name, cls in inspect.getmembers(dals, inspect.isclass):
+        if cls.__module__ != dals.__name__ or not class_name.endswith("DAL"):
+            continue
+        for method_name, member in inspect.getmembers(cls, inspect.isfunction):
+            if not method_name.startswith("_") and (
+                inspect.iscoroutinefunction(member) or inspect.isasyncgenfunction(member)
+            ):
+                methods.add(f"{class_name}.{method_name}")
+    return methods
+
+
+def unchecked_methods(names) -> list:
+    """DAL methods without a scenario, "(variant)" suffixes of the names are ignored"""
+    return sorted(dal_methods() - {name.split("(", 1)[0] for name in names})
+
+
+async def load_sample(async_session) -> dict:
+    async with async_session() as session:
+        result = await session.execute(
+            text(
+                "SELECT u.user_id, u.email, s.total_points FROM user_stats s JOIN users u USING (user_id) "
+                "ORDER BY s.total_points DESC LIMIT 1"
+            )
+        )
+        user = result.first()
+        achievement = (await session.execute(text("SELECT achievement_id, name FROM achievements LIMIT 1"))).first()
+        new_user_id = (await session.execute(text("SELECT gen_random_uuid()"))).scalar()
+    if user is None or achievement is None:
+        sys.exit("The database is empty, run with --seed first")
+    return {
+        "user_id": user.user_id,
+        "email": user.email,
+        "total_points": user.total_points,
+        "achievement_id": achievement.achievement_id,
+        "achievement_name": achievement.name,
+        "new_user_id": new_user_id,
+    }
+
+
+def find_seq_scans(plan: dict) -> set:
+    relations = set()
+    if plan.get("Node Type") == "Seq Scan":
+        relations.add(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        relations |= find_seq_scans(child)
+    return relations
+
+
+async def check(engine, async_session, sample: dict) -> list:
+    captured = []
+    capturing = False
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if capturing:
+            captured.append((statement, parameters[0] if executemany else parameters))
+
+    # the catalog is loaded once on startup, not by the checked methods
+    async with async_session() as session:
+        await AchievementDAL(session).get_all_achievements()
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    report = []
+    for name, scenario in scenarios(sample).items():
+        async with async_session() as session:
+            await session.begin()
+            connection = await session.connection()
+            await connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            captured.clear()
+            # a cached user would leave the lookup statements out of the check
+            user_cache.clear()
+            capturing = True
+            try:
+                await scenario(session)
+            except HTTPException:
+                pass
+            finally:
+                capturing = False
+
+            for statement, parameters in captured:
+                if not statement.lstrip().upper().startswith(EXPLAINABLE):
+                    continue
+                result = await connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters)
+                plan = result.scalar()
+                plan = json.loads(plan) if isinstance(plan, str) else plan
+                seq_scans = find_seq_scans(plan[0]["Plan"]) - ALLOWED_SEQ_SCANS.get(name, set())
+                report.append({"method": name, "statement": statement, "seq_scans": sorted(seq_scans)})
+            await session.rollback()
+    event.remove(engine.sync_engine, "before_cursor_execute", capture)
+    return report
+
+
+async def run(args) -> int:
+    engine = create_async_engine(args.database_url, future=True)
+    async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    try:
+        if args.seed:
+            await load(async_session, dataset_for(args.scale, args.seed_value), truncate=True)
+        sample = await load_sample(async_session)
+        report = await check(engine, async_session, sample)
+    finally:
+        await engine.dispose()
+
+    failed = [item for item in report if item["seq_scans"]]
+    for item in report:
+        status = "SEQ SCAN on " + ", ".join(item["seq_scans"]) if item["seq_scans"] else "ok"
+        print(f"{item['method']:<60} {status}")
+    if args.verbose:
+        for item in failed:
+            print("\n" + item["statement"])
+    print(f"\n{len(report)} statements checked, {len(failed)} with sequential scans")
+    # a method added without a scenario would silently stay unchecked
+    unchecked = unchecked_methods(scenarios(sample))
+    if unchecked:
+        print("DAL methods without a scenario: " + ", ".join(unchecked))
+    return 1 if failed or unchecked else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=settings.REAL_DATABASE_URL)
+    parser.add_argument("--seed", action="store_true", help="replace all rows with synthetic data before the check")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="100k")
+    parser.add_argument("--seed-value", type=int, default=42, help="seed of the synthetic data")
+    parser.add_argument("--verbose", action="store_true", help="print the failing statements")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
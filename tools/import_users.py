@@ -0,0 +1,57 @@
+"""Imports users from a CSV or NDJSON file.
+
+Uses the same pipeline as POST /user/bulk: records are validated with the
+UserCreate rules in chunks and loaded with COPY through a staging table.
+
+    python -m tools.import_users users.csv --chunk-size 5000
+"""
+
+import argparse
+import asyncio
+import json
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import settings
+from ingest import BulkReport, import_users, iter_records
+
+
+async def read_file(path: str, block_size: int = 1 << 16):
+    with open(path, "rb") as file:
+        while block := file.read(block_size):
+            yield block
+
+
+async def run(args) -> dict:
+    engine = create_async_engine(args.database_url, future=True)
+    async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    content_type = "text/csv" if args.format == "csv" else "application/x-ndjson"
+    try:
+        report = await import_users(
+            async_session,
+            iter_records(read_file(args.path), content_type),
+            BulkReport(max_errors=args.max_errors),
+            args.chunk_size,
+        )
+    finally:
+        await engine.dispose()
+    return report.as_dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="detected by the file extension by default")
+    parser.add_argument("--chunk-size", type=int, default=settings.BULK_CHUNK_SIZE)
+    parser.add_argument("--max-errors", type=int, default=settings.BULK_MAX_REPORTED_ERRORS)
+    parser.add_argument("--database-url", default=settings.REAL_DATABASE_URL)
+    args = parser.parse_args()
+    if args.format is None:
+        args.format = "csv" if args.path.endswith(".csv") else "ndjson"
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
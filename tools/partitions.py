@@ -0,0 +1,154 @@
+"""Creates future monthly partitions of received_achievements and detaches old ones.
+
+Run it daily from cron. Partitions for the next months are created ahead of
+time. Awards that already landed in the default partition for such a month
+are moved into it. Detaching is explicit: a detached partition is kept as a
+plain table (or dropped with --drop), and its awards are no longer seen by
+any query. user_stats, daily_award_rollup and achievement_holders keep
+their totals, but UserStatsDAL.rebuild(), AchievementHoldersDAL.rebuild(),
+tools.rollup and the streak recomputation only see the awards that are
+still attached.
+
+    python -m tools.partitions --ahead 3
+    python -m tools.partitions --detach-before 2023-01 --drop
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import re
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import settings
+
+
+PARENT = "received_achievements"
+DEFAULT_PARTITION = "received_achievements_default"
+PARTITION_NAME = re.compile(r"^received_achievements_p(\d{4})_(\d{2})$")
+
+
+def month_start(day: datetime.date) -> datetime.date:
+    return day.replace(day=1)
+
+
+def add_months(month: datetime.date, count: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"{PARENT}_p{month:%Y_%m}"
+
+
+async def existing_partitions(session) -> dict:
+    """Monthly partitions attached to the parent, name -> first day of the month"""
+    result = await session.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:parent AS regclass)"
+        ),
+        {"parent": PARENT},
+    )
+    partitions = {}
+    for name in result.scalars():
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[name] = datetime.date(int(match.group(1)), int(match.group(2)), 1)
+    return partitions
+
+
+async def create_partition(session, month: datetime.date) -> int:
+    """Creates the partition of the month, returns the number of awards moved from the default partition"""
+    name, start, end = partition_name(month), month, add_months(month, 1)
+    bounds = {"start": start, "end": end}
+    misplaced = (
+        await session.execute(
+            text(f"SELECT count(*) FROM {DEFAULT_PARTITION} WHERE date >= :start AND date < :end"), bounds
+        )
+    ).scalar()
+    if not misplaced:
+        await session.execute(
+            text(f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES FROM ('{start}') TO ('{end}')")
+        )
+        return 0
+
+    # a partition can not be created while the default one holds rows of its range
+    await session.execute(text(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    await session.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE date >= :start AND date < :end "
+            f"RETURNING ra_id, user_id, achievement_id, date) "
+            f"INSERT INTO {name} (ra_id, user_id, achievement_id, date) SELECT * FROM moved"
+        ),
+        bounds,
+    )
+    await session.execute(
+        text(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')")
+    )
+    return misplaced
+
+
+async def ensure_partitions(session, start: datetime.date, end: datetime.date) -> list:
+    """Creates the missing partitions of every month from start to end inclusive"""
+    existing = set((await existing_partitions(session)).values())
+    created = []
+    month = month_start(start)
+    while month <= month_start(end):
+        if month not in existing:
+            moved = await create_partition(session, month)
+            created.append({"partition": partition_name(month), "moved_from_default": moved})
+        month = add_months(month, 1)
+    return created
+
+
+async def detach_partitions(session, before: datetime.date, drop: bool = False) -> list:
+    """Detaches the partitions of the months before the given one"""
+    detached = []
+    for name, month in sorted((await existing_partitions(session)).items(), key=lambda item: item[1]):
+        if month >= month_start(before):
+            break
+        await session.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+        if drop:
+            await session.execute(text(f"DROP TABLE {name}"))
+        detached.append(name)
+    return detached
+
+
+async def run(args) -> dict:
+    engine = create_async_engine(args.database_url, future=True)
+    async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    today = datetime.date.today()
+    report = {}
+    try:
+        async with async_session() as session:
+            async with session.begin():
+                report["created"] = await ensure_partitions(session, today, add_months(month_start(today), args.ahead))
+        if args.detach_before is not None:
+            async with async_session() as session:
+                async with session.begin():
+                    report["detached"] = await detach_partitions(session, args.detach_before, drop=args.drop)
+                    report["dropped"] = args.drop
+    finally:
+        await engine.dispose()
+    return report
+
+
+def parse_month(value: str) -> datetime.date:
+    return datetime.datetime.strptime(value, "%Y-%m").date()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ahead", type=int, default=3, help="months to create after the current one")
+    parser.add_argument("--detach-before", type=parse_month, help="YYYY-MM, detach the partitions of earlier months")
+    parser.add_argument("--drop", action="store_true", help="drop the detached partitions")
+    parser.add_argument("--database-url", default=settings.REAL_DATABASE_URL)
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Rebuilds daily_award_rollup from received_achievements.
+
+The rollup is updated together with every award, a rebuild is needed only
+after awards were written around the application or to fill the days
+missed by the migration backfill. The rollup is locked while a range is
+rebuilt, awards written meanwhile wait for it. Every range is rebuilt in
+its own transaction, a month at a time by default, so the awards never
+wait for a whole rebuild.
+
+    python -m tools.rollup --from 2024-01-01 --to 2024-12-31
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import settings
+from database import ReceivedAchievements
+from dals import AwardRollupDAL
+
+
+async def award_dates(async_session) -> tuple:
+    async with async_session() as session:
+        result = await session.execute(select(func.min(ReceivedAchievements.date), func.max(ReceivedAchievements.date)))
+        return result.first()
+
+
+async def run(args) -> dict:
+    engine = create_async_engine(args.database_url, future=True)
+    async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    started = time.perf_counter()
+    ranges = 0
+    try:
+        first, last = await award_dates(async_session)
+        date_from = args.date_from or first
+        date_to = args.date_to or last
+        current = date_from
+        while current is not None and current <= date_to:
+            range_end = min(current + datetime.timedelta(days=args.days - 1), date_to)
+            async with async_session() as session:
+                async with session.begin():
+                    await AwardRollupDAL(session).rebuild(current, range_end)
+            ranges += 1
+            current = range_end + datetime.timedelta(days=1)
+    finally:
+        await engine.dispose()
+    return {
+        "from": date_from and date_from.isoformat(),
+        "to": date_to and date_to.isoformat(),
+        "ranges": ranges,
+        "elapsed_seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--from", dest="date_from", type=datetime.date.fromisoformat, help="the first award by default")
+    parser.add_argument("--to", dest="date_to", type=datetime.date.fromisoformat, help="the last award by default")
+    parser.add_argument("--days", type=int, default=31, help="days rebuilt per transaction")
+    parser.add_argument("--database-url", default=settings.REAL_DATABASE_URL)
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
+
+
+if __name__ == "__main__":
+    main()
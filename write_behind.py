@@ -0,0 +1,147 @@
+##########################################
+# BLOCK FOR THE WRITE-BEHIND AWARD QUEUE #
+##########################################
+
+
+import asyncio
+import logging
+import time
+import uuid
+from datetime import date
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.exc import SQLAlchemyError
+
+import metrics
+from dals import ReceivedAchievementsDAL
+
+
+logger = logging.getLogger("write_behind")
+
+
+class AwardWriteQueue:
+    """Collects single awards and writes them in batches.
+
+    Awards wait in a bounded queue and are written by one worker with
+    create_received_achievements_bulk, in a transaction per batch of up to
+    batch_size awards or flush_ms of waiting, whichever comes first. Every
+    award gets a future resolved with its fields or failed with its error
+    once the batch is committed. A full queue makes callers wait for
+    put_timeout_ms and then rejects them with 503.
+    """
+
+    def __init__(self, session_factory, max_size: int, batch_size: int, flush_ms: int, put_timeout_ms: int):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_seconds = flush_ms / 1000
+        self.put_timeout_seconds = put_timeout_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self._worker: Optional[asyncio.Task] = None
+        self._accepting = False
+        self._stopped = False
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        self._accepting = True
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, email: str, achievement_name: str, award_date: date) -> Tuple[uuid.UUID, asyncio.Future]:
+        """Queues the award, returns its id and the future of its write"""
+        if not self._accepting:
+            raise HTTPException(status_code=503, detail="Award queue is not accepting awards")
+        ra_id = uuid.uuid4()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(
+                self._queue.put((ra_id, (email, achievement_name, award_date), future)), self.put_timeout_seconds
+            )
+        except asyncio.TimeoutError:
+            metrics.award_queue_rejected.inc()
+            raise HTTPException(status_code=503, detail="Award queue is full", headers={"Retry-After": "1"})
+        if self._stopped:
+            # drain returned while this call waited for room, no worker writes the award anymore
+            self._fail_queued()
+        return ra_id, future
+
+    async def drain(self) -> None:
+        """Stops accepting awards and waits until the queued ones are written"""
+        self._accepting = False
+        await self._queue.join()
+        self._stopped = True
+        if self._worker is not None:
+            self._worker.cancel()
+        # a caller which waited for room in put() may have queued an award after join() returned
+        self._fail_queued()
+
+    def _fail_queued(self) -> None:
+        while not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(HTTPException(status_code=503, detail="Award queue is stopped"))
+            self._queue.task_done()
+
+    async def _next_batch(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._write(batch)
+            except Exception as error:
+                logger.exception("award batch was not written")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write(self, batch: list) -> None:
+        metrics.award_queue_batch_size.observe(len(batch))
+        try:
+            results = await self._write_records(batch)
+        except SQLAlchemyError:
+            # one bad award must not fail the whole batch, retry them one by one
+            logger.warning("award batch of %s failed, writing the awards one by one", len(batch))
+            results = []
+            for item in batch:
+                try:
+                    results.extend(await self._write_records([item]))
+                except SQLAlchemyError as error:
+                    detail = f"Award was not saved: {error.__class__.__name__}"
+                    results.append(HTTPException(status_code=503, detail=detail))
+
+        for (ra_id, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, HTTPException):
+                logger.warning("queued award %s was not saved: %s", ra_id, result.detail)
+                future.set_exception(result)
+            elif isinstance(result, str):
+                # the caller may have accepted a 202 and is not waiting anymore
+                logger.warning("queued award %s was rejected: %s", ra_id, result)
+                future.set_exception(HTTPException(status_code=404, detail=result))
+            else:
+                future.set_result(result)
+
+    async def _write_records(self, batch: list) -> List:
+        async with self.session_factory() as session:
+            async with session.begin():
+                received_achievement_dal = ReceivedAchievementsDAL(session)
+                return await received_achievement_dal.create_received_achievements_bulk(
+                    [record for _, record, _ in batch], ra_ids=[ra_id for ra_id, _, _ in batch],
+                )